@@ -258,3 +258,74 @@ DEFENDER_REDIS_URL = config("REDIS_URL")
 
 # Gemini API
 GEMINI_API_KEY = config("GEMINI_API_KEY", default=None)
+
+# Load the law retriever's embedding model and database connection when a web worker
+# starts, instead of on the first chat request
+LAW_RETRIEVER_WARM_UP = config("LAW_RETRIEVER_WARM_UP", cast=bool, default=False)
+
+# Connection pool for the law retriever's vector searches, per process. Keep
+# LAW_DB_POOL_MAX_SIZE times the number of web workers below Postgres' max_connections.
+LAW_DB_POOL_MIN_SIZE = config("LAW_DB_POOL_MIN_SIZE", cast=int, default=1)
+LAW_DB_POOL_MAX_SIZE = config("LAW_DB_POOL_MAX_SIZE", cast=int, default=5)
+LAW_DB_POOL_IDLE_TIMEOUT = config("LAW_DB_POOL_IDLE_TIMEOUT", cast=float, default=300.0)
+LAW_DB_POOL_CHECKOUT_TIMEOUT = config("LAW_DB_POOL_CHECKOUT_TIMEOUT", cast=float, default=5.0)
+LAW_DB_STATEMENT_TIMEOUT_MS = config("LAW_DB_STATEMENT_TIMEOUT_MS", cast=int, default=5000)
+
+# Candidates examined per vector search (hnsw.ef_search / ivfflat.probes). Higher values
+# give better recall at the cost of latency, see common/utils/vector_benchmark.py
+VECTOR_SEARCH_EF_SEARCH = config("VECTOR_SEARCH_EF_SEARCH", cast=int, default=40)
+VECTOR_SEARCH_PROBES = config("VECTOR_SEARCH_PROBES", cast=int, default=10)
+
+# "halfvec" or "binary" when ingestion built the paragraphs index on quantized embeddings
+# (see common/utils/vector_indexes.py). Searches then read VECTOR_SEARCH_RERANK_FACTOR
+# times as many candidates from the index and rerank them by exact cosine distance
+VECTOR_INDEX_QUANTIZATION = config("VECTOR_INDEX_QUANTIZATION", default="none")
+VECTOR_SEARCH_RERANK_FACTOR = config("VECTOR_SEARCH_RERANK_FACTOR", cast=int, default=10)
+
+# Find the top laws and their paragraphs in one statement instead of two round trips
+LAW_RETRIEVER_SINGLE_QUERY = config("LAW_RETRIEVER_SINGLE_QUERY", cast=bool, default=False)
+
+# "pgvector" searches in Postgres, "numpy" searches a memory-mapped snapshot of the
+# embeddings that is shared by the workers on a host and re-exported when a new index
+# version is activated
+LAW_RETRIEVER_BACKEND = config("LAW_RETRIEVER_BACKEND", default="pgvector")
+LAW_VECTOR_SNAPSHOT_DIR = config(
+    "LAW_VECTOR_SNAPSHOT_DIR", default=os.path.join(BASE_DIR, ".vector_snapshots")
+)
+
+# Directory the ingest_laws task extracts the law XML files to. The per-law tasks read
+# them from there, so it has to be shared by every Celery worker
+LAW_INGESTION_DIR = config("LAW_INGESTION_DIR", default=os.path.join(BASE_DIR, ".law_ingestion"))
+
+# Seconds between checks for a newly activated index version, after which the numpy
+# snapshot is reloaded and cached retrieval results of the old version are no longer used
+LAW_INDEX_VERSION_CHECK_INTERVAL = config(
+    "LAW_INDEX_VERSION_CHECK_INTERVAL", cast=float, default=30.0
+)
+
+# Rank paragraphs by Norwegian full-text match as well as vector distance, fused with
+# reciprocal rank fusion. Exact legal terms then lift the right paragraphs, so fewer of
+# them (LAW_RETRIEVER_HYBRID_K_PARAGRAPHS) are sent to Gemini
+LAW_RETRIEVER_HYBRID = config("LAW_RETRIEVER_HYBRID", cast=bool, default=False)
+LAW_RETRIEVER_HYBRID_K_PARAGRAPHS = config("LAW_RETRIEVER_HYBRID_K_PARAGRAPHS", cast=int, default=8)
+
+# Whole retrieval results are cached per index version in this cache, shared by all
+# workers through Redis. Set LAW_RETRIEVER_RESULT_CACHE to "" to disable it
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "law_retrieval": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": config("REDIS_URL"),
+        "KEY_PREFIX": "law_retrieval",
+    },
+}
+LAW_RETRIEVER_RESULT_CACHE = config("LAW_RETRIEVER_RESULT_CACHE", default="law_retrieval")
+LAW_RETRIEVER_RESULT_CACHE_TIMEOUT = config(
+    "LAW_RETRIEVER_RESULT_CACHE_TIMEOUT", cast=int, default=24 * 60 * 60
+)
+
+# Threads that embed prompts for AsyncLawRetriever, which also uses its own pool of
+# LAW_DB_POOL_MAX_SIZE connections next to the one of LawRetriever
+LAW_RETRIEVER_EMBED_WORKERS = config("LAW_RETRIEVER_EMBED_WORKERS", cast=int, default=2)
@@ -32,6 +32,13 @@ PASSWORD_HASHERS = [
 CELERY_TASK_ALWAYS_EAGER = True
 CELERY_TASK_EAGER_PROPAGATES = True
 
+# Keep the on-disk embedding cache out of tests unless a test enables it
+os.environ["EMBEDDING_CACHE_DIR"] = ""
+
+# Likewise for the retrieval result cache, which must not need Redis
+CACHES["law_retrieval"] = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+LAW_RETRIEVER_RESULT_CACHE = ""
+
 # Suppress logging and warnings during tests
 logging.disable(logging.CRITICAL)
 warnings.filterwarnings("ignore")
@@ -1,8 +1,18 @@
 import os
+import threading
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CDP_Trondheim_Kommune.settings.production")
 
 application = get_wsgi_application()
+
+if settings.LAW_RETRIEVER_WARM_UP:
+    from common.utils.law_retriever_from_database import warm_up_law_retriever
+
+    # Warm up in the background so the worker can accept requests right away
+    threading.Thread(
+        target=warm_up_law_retriever, name="law-retriever-warm-up", daemon=True
+    ).start()
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+
+# The law retriever selects these columns, which ingestion adds when it creates or
+# upgrades the law tables. Adding a nullable column without a default only changes the
+# catalog, so databases that have not been re-ingested get them here without a table
+# rewrite. Rows stored before the columns existed are formatted at query time until the
+# next ingestion fills them in. The generated text_search column of hybrid retrieval
+# would rewrite the table and is left to the next ingestion.
+UPGRADE_LAW_TABLES_SQL = """
+    ALTER TABLE IF EXISTS laws ADD COLUMN IF NOT EXISTS content_hash TEXT;
+    ALTER TABLE IF EXISTS paragraphs ADD COLUMN IF NOT EXISTS content_hash TEXT;
+    ALTER TABLE IF EXISTS paragraphs ADD COLUMN IF NOT EXISTS clean_text TEXT;
+    ALTER TABLE IF EXISTS paragraphs ADD COLUMN IF NOT EXISTS word_count INTEGER;
+    ALTER TABLE IF EXISTS paragraphs ADD COLUMN IF NOT EXISTS lovdata_url TEXT;
+    ALTER TABLE IF EXISTS paragraphs ADD COLUMN IF NOT EXISTS is_first_section BOOLEAN;
+"""
+
+
+def upgrade_law_tables(apps, schema_editor):
+    # The law tables only exist in Postgres
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(UPGRADE_LAW_TABLES_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("common", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(upgrade_law_tables, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,191 @@
+import logging
+import os
+
+from django.conf import settings
+
+from CDP_Trondheim_Kommune import celery_app
+from celery import chord
+
+from common.utils.db_client import (
+    EMBEDDING_BATCH_SIZE,
+    LAW_EMBEDDING,
+    WRITE_PAGE_SIZE,
+    backfill_paragraph_text,
+    connect_with_retries,
+    create_table_if_not_exists,
+    delete_missing_laws,
+    finish_index_version,
+    load_content_hashes,
+    log_embedding_cache_stats,
+    new_ingestion_stats,
+    parse_law_file,
+    prepare_law_update,
+    prepare_version_tables,
+    source_law_id,
+    write_law_update,
+)
+from common.utils.index_versions import (
+    INDEX_ROLLBACK_WINDOW_HOURS,
+    abandon_index_version,
+    begin_index_version,
+    drop_expired_index_versions,
+    version_tables,
+)
+from common.utils.law_extractor import fetch_lovdata_laws, standard_format_laws
+
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(bind=True)
+def ingest_laws(
+    self,
+    laws=None,
+    full_rebuild=False,
+    rollback_window_hours=INDEX_ROLLBACK_WINDOW_HOURS,
+    law_embedding=LAW_EMBEDDING,
+):
+    """
+    Re-index the law corpus across the worker pool.
+
+    Extracts the wanted laws from Lovdata to ``LAW_INGESTION_DIR``, starts a new index
+    version and fans out one ``ingest_law`` task per law file. Only the file paths go
+    through the broker, each task reads its own XML. Laws that are no longer wanted are
+    deleted from the new version. A chord runs ``finalize_ingestion`` once every law is
+    written, which builds the indexes and swaps the version in. Progress of the fan-out
+    can be followed with ``get_ingestion_progress(group_id)``.
+    """
+    self.update_state(state="FETCHING")
+    law_sources = fetch_lovdata_laws(laws or standard_format_laws, settings.LAW_INGESTION_DIR)
+    law_paths = [os.path.join(settings.LAW_INGESTION_DIR, name) for name in sorted(law_sources)]
+
+    conn = connect_with_retries()
+    try:
+        create_table_if_not_exists(conn)
+        version = begin_index_version(conn)
+        try:
+            tables = version_tables(version)
+            prepare_version_tables(conn, tables, full_rebuild)
+            delete_missing_laws(conn, tables, {source_law_id(path) for path in law_paths})
+        except BaseException:
+            abandon_index_version(conn, version)
+            raise
+    finally:
+        conn.close()
+
+    header = [
+        ingest_law.s(version, law_path, law_embedding=law_embedding) for law_path in law_paths
+    ]
+    finalize = finalize_ingestion.s(version, rollback_window_hours).on_error(
+        abandon_ingestion.si(version)
+    )
+    try:
+        result = chord(header)(finalize)
+    except BaseException:
+        # Nothing was queued when publishing fails, so no callback will drop the version.
+        # Eager runs already executed the chord, whose callbacks handle their own errors.
+        if not self.request.is_eager:
+            abandon_ingestion(version)
+        raise
+
+    # Keep the group in the result backend so its progress can be looked up by id
+    group_result = result.parent
+    if group_result is not None and not self.request.is_eager:
+        group_result.save()
+
+    return {
+        "index_version": version,
+        "laws": len(header),
+        "group_id": group_result.id if group_result is not None else None,
+        "finalize_id": result.id,
+    }
+
+
+@celery_app.task(bind=True)
+def ingest_law(
+    self,
+    version,
+    law_path,
+    batch_size=EMBEDDING_BATCH_SIZE,
+    write_page_size=WRITE_PAGE_SIZE,
+    law_embedding=LAW_EMBEDDING,
+):
+    """Parse, embed and write the law XML at ``law_path`` into the shadow tables of ``version``."""
+    tables = version_tables(version)
+    stats = new_ingestion_stats()
+    law_id = source_law_id(law_path)
+
+    self.update_state(state="PROGRESS", meta={"law_id": law_id, "stage": "parsing"})
+    _, _, json_data = parse_law_file(law_path)
+    if json_data is None:
+        return stats
+
+    conn = connect_with_retries()
+    try:
+        content_hashes = load_content_hashes(conn, tables, law_ids=[law_id])
+
+        self.update_state(state="PROGRESS", meta={"law_id": law_id, "stage": "embedding"})
+        update = prepare_law_update(
+            law_id, None, json_data, content_hashes, batch_size, stats, law_embedding
+        )
+
+        if update is not None:
+            self.update_state(state="PROGRESS", meta={"law_id": law_id, "stage": "writing"})
+            write_law_update(conn, update, write_page_size, stats, tables)
+    finally:
+        conn.close()
+    return stats
+
+
+@celery_app.task
+def finalize_ingestion(results, version, rollback_window_hours=INDEX_ROLLBACK_WINDOW_HOURS):
+    """Chord callback: build the indexes of ``version``, activate it and sum the stats."""
+    stats = new_ingestion_stats()
+    for result in results:
+        for key in stats:
+            stats[key] += result[key]
+
+    conn = connect_with_retries()
+    try:
+        try:
+            tables = version_tables(version)
+            backfill_paragraph_text(conn, tables)
+            finish_index_version(conn, version, tables)
+        except BaseException:
+            abandon_index_version(conn, version)
+            raise
+        drop_expired_index_versions(conn, rollback_window_hours)
+    finally:
+        conn.close()
+
+    logger.info(
+        "Index version %s activated: %s laws updated, %s unchanged",
+        version,
+        stats["laws"],
+        stats["unchanged_laws"],
+    )
+    log_embedding_cache_stats(stats)
+    stats["index_version"] = version
+    return stats
+
+
+@celery_app.task
+def abandon_ingestion(version):
+    """Error callback: drop the shadow tables of a build where a law task failed."""
+    conn = connect_with_retries()
+    try:
+        abandon_index_version(conn, version)
+    finally:
+        conn.close()
+
+
+def get_ingestion_progress(group_id):
+    """Return how many of the per-law tasks of an ingestion have finished, or None."""
+    group_result = celery_app.GroupResult.restore(group_id)
+    if group_result is None:
+        return None
+    return {
+        "total": len(group_result.results),
+        "completed": group_result.completed_count(),
+        "failed": sum(1 for result in group_result.results if result.failed()),
+    }
@@ -0,0 +1,99 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import psycopg
+from psycopg import pq
+
+from common.utils.async_db_pool import AsyncConnectionPool
+from common.utils.db_pool import PoolTimeoutError
+
+
+def _mock_connection():
+    conn = MagicMock(closed=False)
+    conn.close = AsyncMock()
+    conn.rollback = AsyncMock()
+    conn.execute = AsyncMock()
+    conn.info.transaction_status = pq.TransactionStatus.IDLE
+    return conn
+
+
+class AsyncConnectionPoolTest(IsolatedAsyncioTestCase):
+    """Test the asyncio connection pool used by the async law retriever."""
+
+    def setUp(self):
+        connect_patcher = patch(
+            "common.utils.async_db_pool.psycopg.AsyncConnection.connect",
+            side_effect=lambda **_: _mock_connection(),
+        )
+        self.mock_connect = connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+    def _pool(self, **kwargs):
+        pool = AsyncConnectionPool({"dbname": "test_db"}, **kwargs)
+        self.addAsyncCleanup(pool.close)
+        return pool
+
+    async def test_connections_are_reused(self):
+        """Test that a returned connection is handed out again instead of a new one"""
+        pool = self._pool()
+
+        async with pool.connection() as first:
+            pass
+        async with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.mock_connect.assert_called_once_with(
+            autocommit=True, dbname="test_db", options="-c statement_timeout=5000"
+        )
+
+    async def test_checkout_times_out_when_pool_is_exhausted(self):
+        """Test that no more than max_size connections are opened"""
+        pool = self._pool(max_size=2, checkout_timeout=0.01)
+        await pool.getconn()
+        await pool.getconn()
+
+        with self.assertRaises(PoolTimeoutError):
+            await pool.getconn()
+
+        stats = pool.stats()
+        self.assertEqual(stats["in_use"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(self.mock_connect.call_count, 2)
+
+    async def test_waiting_checkout_gets_returned_connection(self):
+        """Test that a coroutine waiting for a connection is woken when one is returned"""
+        pool = self._pool(max_size=1)
+        conn = await pool.getconn()
+
+        waiter = asyncio.create_task(pool.getconn())
+        await asyncio.sleep(0)
+        await pool.putconn(conn)
+
+        self.assertIs(await waiter, conn)
+        self.assertEqual(pool.stats()["waits"], 1)
+
+    async def test_broken_connection_is_discarded(self):
+        """Test that a connection that failed is closed and its slot freed"""
+        pool = self._pool(max_size=1)
+
+        with self.assertRaises(psycopg.OperationalError):
+            async with pool.connection() as conn:
+                raise psycopg.OperationalError("server closed the connection")
+
+        conn.close.assert_awaited_once()
+        async with pool.connection() as new_conn:
+            self.assertIsNot(new_conn, conn)
+        self.assertEqual(pool.stats()["discarded"], 1)
+
+    async def test_open_transaction_is_rolled_back_on_return(self):
+        """Test that a connection is not reused in the middle of a transaction"""
+        pool = self._pool()
+        conn = await pool.getconn()
+        conn.info.transaction_status = pq.TransactionStatus.INTRANS
+
+        await pool.putconn(conn)
+
+        conn.rollback.assert_awaited_once()
+        self.assertEqual(pool.stats()["idle"], 1)
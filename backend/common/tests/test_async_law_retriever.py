@@ -0,0 +1,186 @@
+import asyncio
+from contextlib import asynccontextmanager
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.core.cache import caches
+
+import psycopg
+
+from common.utils.async_law_retriever import AsyncLawRetriever
+from common.utils.db_pool import close_connection_pool
+from common.utils.law_retriever_from_database import LawRetriever
+from common.utils.paragraph_text import FIRST_SECTION_SQL
+
+
+def _create_mock_embedding():
+    """Helper to create a mock embedding array with tolist() method"""
+    mock_array = MagicMock()
+    mock_array.tolist.return_value = [0.1] * 384
+    return mock_array
+
+
+class AsyncLawRetrieverTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.addCleanup(close_connection_pool)
+        self.mock_model = MagicMock()
+        self.mock_model.embed.side_effect = lambda texts: iter(
+            [_create_mock_embedding() for _ in texts]
+        )
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=self.mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+        # Rows answered by the law search and the paragraph search, by table
+        self.rows = {
+            "FROM laws": [("law1", {"title": "Lov 1"})],
+            "FROM paragraphs": [("p2", "§ 2", "Tekst", {}, "law1", 0.1)],
+        }
+        self.conn = MagicMock()
+        self.conn.execute = AsyncMock(side_effect=self._execute)
+        self.conn.transaction = MagicMock(side_effect=self._transaction)
+        self.pool = MagicMock()
+        self.pool.max_size = 2
+        self.pool.connection = MagicMock(side_effect=self._connection)
+        self.pool.close = AsyncMock()
+        self.checked_out = 0
+        self.max_checked_out = 0
+
+    async def _execute(self, query, params=()):
+        rows = next((rows for table, rows in self.rows.items() if table in query), [])
+        cur = MagicMock()
+        cur.fetchall = AsyncMock(return_value=rows)
+        return cur
+
+    @asynccontextmanager
+    async def _transaction(self):
+        yield
+
+    @asynccontextmanager
+    async def _connection(self):
+        self.checked_out += 1
+        self.max_checked_out = max(self.max_checked_out, self.checked_out)
+        try:
+            # Let the other searches of a batch run while this connection is held
+            await asyncio.sleep(0)
+            yield self.conn
+        finally:
+            self.checked_out -= 1
+
+    async def _retriever(self, **options):
+        retriever = AsyncLawRetriever(
+            pool=self.pool, retriever=LawRetriever(backend="pgvector", result_cache="", **options)
+        )
+        self.addAsyncCleanup(retriever.close)
+        return retriever
+
+    def _queries(self):
+        return [call.args[0] for call in self.conn.execute.await_args_list]
+
+    async def test_retrieve_matches_law_retriever_result(self):
+        """Test that laws and paragraphs come back in the shape of LawRetriever.retrieve"""
+        retriever = await self._retriever()
+
+        result = await retriever.retrieve("personvern", k_paragraphs=5)
+
+        self.assertEqual(result["laws"], [{"law_id": "law1", "metadata": {"title": "Lov 1"}}])
+        self.assertEqual([p["paragraph_id"] for p in result["paragraphs"]], ["p2"])
+        self.assertEqual(result["paragraphs_text"], "§ 2: Tekst")
+        self.mock_model.embed.assert_called_once_with(["personvern"])
+
+    async def test_search_settings_are_set_in_the_search_transaction(self):
+        """Test that every vector search sets the index search parameters first"""
+        retriever = await self._retriever(ef_search=100)
+
+        await retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        queries = self._queries()
+        self.assertIn("set_config('hnsw.ef_search'", queries[0])
+        self.assertEqual(self.conn.execute.await_args_list[0].args[1][0], "100")
+        self.assertIn("FROM paragraphs", queries[1])
+        # § 1 and the distance threshold are filtered by the search, as in LawRetriever
+        self.assertIn(f"NOT {FIRST_SECTION_SQL}", queries[1])
+        self.assertEqual(self.conn.execute.await_args_list[1].args[1]["distance_threshold"], 0.27)
+        self.conn.transaction.assert_called_once()
+
+    async def test_lost_connection_is_retried_once(self):
+        """Test that a search is retried on a new connection after a connection error"""
+        self.conn.execute.side_effect = [
+            psycopg.OperationalError("server closed the connection"),
+            *[await self._execute(q) for q in ("", "FROM paragraphs")],
+        ]
+        retriever = await self._retriever()
+
+        result = await retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(self.pool.connection.call_count, 2)
+        self.assertEqual(result["paragraphs"][0]["paragraph_id"], "p2")
+
+    async def test_retrieve_many_embeds_prompts_in_one_batch(self):
+        """Test that a batch is embedded once and empty prompts give {}"""
+        retriever = await self._retriever()
+
+        results = await retriever.retrieve_many(
+            ["personvern", "", "alkohol", "personvern "], law_id="law1", k_paragraphs=5
+        )
+
+        self.mock_model.embed.assert_called_once_with(["personvern", "alkohol"])
+        self.assertEqual(results[1], {})
+        self.assertEqual(results[0], results[3])
+        self.assertEqual(results[2]["paragraphs"][0]["paragraph_id"], "p2")
+        self.assertIsNot(results[0]["paragraphs"], results[3]["paragraphs"])
+
+    async def test_retrieve_many_checks_out_at_most_max_size_connections(self):
+        """Test that a batch larger than the pool waits for its own searches"""
+        retriever = await self._retriever()
+
+        prompts = [f"spørsmål {i}" for i in range(6)]
+        results = await retriever.retrieve_many(prompts, law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(self.max_checked_out, 2)
+
+    async def test_shares_the_process_law_retriever(self):
+        """Test that the embedding model and caches of get_law_retriever() are reused"""
+        shared = LawRetriever(backend="pgvector", result_cache="")
+
+        with patch(
+            "common.utils.async_law_retriever.get_law_retriever", return_value=shared
+        ) as mock_get:
+            retriever = AsyncLawRetriever(pool=self.pool)
+            self.addAsyncCleanup(retriever.close)
+
+        mock_get.assert_called_once_with()
+        self.assertIs(retriever.retriever, shared)
+
+    async def test_wrapped_retriever_does_not_create_a_sync_pool(self):
+        """Test that a pure-async deployment never builds the shared psycopg2 pool"""
+        with patch("common.utils.law_retriever_from_database.get_connection_pool") as mock_get_pool:
+            retriever = await self._retriever()
+            await retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        mock_get_pool.assert_not_called()
+
+    async def test_results_are_cached_per_index_version(self):
+        """Test that a repeated prompt is answered from the result cache"""
+        caches["law_retrieval"].clear()
+        self.addCleanup(caches["law_retrieval"].clear)
+        retriever = AsyncLawRetriever(
+            pool=self.pool,
+            retriever=LawRetriever(backend="pgvector", result_cache="law_retrieval"),
+        )
+        self.addAsyncCleanup(retriever.close)
+
+        with patch(
+            "common.utils.async_law_retriever._get_active_index_version", return_value=3
+        ) as mock_version:
+            first = await retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+            searches = self.conn.execute.await_count
+            second = await retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(second, first)
+        self.assertEqual(self.conn.execute.await_count, searches)
+        mock_version.assert_awaited_once()
+        self.assertEqual(retriever.result_cache_stats()["hits"], 1)
@@ -4,6 +4,8 @@ Unit tests mock external dependencies (TextEmbedding model) to test individual f
 Integration tests use the Django test database to test actual PostgreSQL operations.
 """
 
+import os
+import tempfile
 from unittest.mock import MagicMock, patch
 
 from django.conf import settings
@@ -11,15 +13,44 @@ from django.test import TestCase
 
 import psycopg2
 
+from common.utils import embedding_cache
 from common.utils.db_client import (
-    clear_table,
+    EMBEDDING_MODEL_NAME,
+    backfill_paragraph_text,
+    build_indexes,
+    centroid_embedding,
     create_embedding,
+    create_embeddings,
     create_table_if_not_exists,
+    delete_missing_laws,
     extract_text_from_json,
     get_model,
-    insert_law_record,
-    insert_paragraph_record,
+    html_to_json_structured,
+    load_content_hashes,
+    load_paragraph_embeddings,
+    process_laws,
+    write_law_with_paragraphs,
 )
+from common.utils.index_versions import LIVE_TABLES, IndexTables, version_tables
+from common.utils.vector_indexes import VectorIndexConfig
+
+
+def clear_tables(conn):
+    """Empty the live laws and paragraphs tables"""
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE TABLE paragraphs, laws;")
+    conn.commit()
+
+
+SAMPLE_LAW_XML = """
+<html><body>
+<dl class="data-document-key-info">
+  <dt>Tittel</dt><dd>Lov om testing</dd>
+</dl>
+<article class="legalArticle" data-name="§ 1">§ 1 Formål</article>
+<article class="legalArticle" data-name="§ 2">§ 2 Virkeområde</article>
+</body></html>
+"""
 
 
 class GetModelTest(TestCase):
@@ -130,6 +161,353 @@ class CreateEmbeddingTest(TestCase):
         mock_model.embed.assert_called_once_with([""])
 
 
+class CreateEmbeddingsTest(TestCase):
+    """Test creating embeddings for many texts in batches."""
+
+    @patch("common.utils.db_client.get_model")
+    def test_create_embeddings_preserves_order(self, mock_get_model):
+        """Test that vectors are returned in the same order as the texts"""
+        mock_model = MagicMock()
+        vectors = []
+        for value in (0.1, 0.2, 0.3):
+            mock_array = MagicMock()
+            mock_array.tolist.return_value = [value] * 384
+            vectors.append(mock_array)
+        mock_model.embed.return_value = iter(vectors)
+        mock_get_model.return_value = mock_model
+
+        result = create_embeddings(["a", "b", "c"], batch_size=2)
+
+        self.assertEqual([vector[0] for vector in result], [0.1, 0.2, 0.3])
+        mock_model.embed.assert_called_once_with(["a", "b", "c"], batch_size=2)
+
+    @patch("common.utils.db_client.get_model")
+    def test_create_embeddings_with_no_texts(self, mock_get_model):
+        """Test that an empty input does not load or call the model"""
+        result = create_embeddings([])
+
+        self.assertEqual(result, [])
+        mock_get_model.assert_not_called()
+
+    @patch("common.utils.db_client.get_model")
+    def test_create_embeddings_reads_through_cache(self, mock_get_model):
+        """Test that texts embedded before are served from the embedding cache"""
+        mock_model = mock_get_model.return_value
+        mock_model.embed.side_effect = lambda texts, batch_size: [[0.5] * 384 for _ in texts]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.addCleanup(embedding_cache._caches.clear)
+            with patch.dict(os.environ, {"EMBEDDING_CACHE_DIR": tmpdir}):
+                create_embeddings(["a", "b"])
+                result = create_embeddings(["b", "c"])
+                embedding_cache._caches.pop((tmpdir, EMBEDDING_MODEL_NAME)).close()
+
+        self.assertEqual(result, [[0.5] * 384, [0.5] * 384])
+        self.assertEqual(mock_model.embed.call_args_list[1][0][0], ["c"])
+
+
+class HtmlToJsonStructuredTest(TestCase):
+    """Test parsing Lovdata XML into structured JSON."""
+
+    def test_parses_metadata_and_articles(self):
+        """Test that metadata and legal articles are extracted"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "nl-20000101-001.xml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(SAMPLE_LAW_XML)
+
+            result = html_to_json_structured(path)
+
+        self.assertEqual(result["metadata"]["Tittel"], "Lov om testing")
+        self.assertEqual([a["title"] for a in result["articles"]], ["§ 1", "§ 2"])
+        self.assertEqual(result["articles"][1]["paragraphs"], ["§ 2 Virkeområde"])
+
+    def test_parses_document_bytes(self):
+        """Test that a document streamed as bytes parses like the same file on disk"""
+        result = html_to_json_structured(SAMPLE_LAW_XML.encode("utf-8"))
+
+        self.assertEqual(result["metadata"]["Tittel"], "Lov om testing")
+        self.assertEqual([a["title"] for a in result["articles"]], ["§ 1", "§ 2"])
+
+
+class ProcessLawsPipelineTest(TestCase):
+    """Test the parse -> embed -> write ingestion pipeline with mocked dependencies."""
+
+    def setUp(self):
+        patchers = {
+            "connect": patch("common.utils.db_client.psycopg2.connect"),
+            "create_table": patch("common.utils.db_client.create_table_if_not_exists"),
+            "begin_version": patch("common.utils.db_client.begin_index_version", return_value=7),
+            "copy_tables": patch("common.utils.db_client.copy_table_contents"),
+            "build_indexes": patch("common.utils.db_client.build_indexes"),
+            "activate_version": patch("common.utils.db_client.activate_index_version"),
+            "abandon_version": patch("common.utils.db_client.abandon_index_version"),
+            "drop_expired": patch("common.utils.db_client.drop_expired_index_versions"),
+            "load_hashes": patch(
+                "common.utils.db_client.load_content_hashes", return_value=({}, {})
+            ),
+            "create_embedding": patch(
+                "common.utils.db_client.create_embedding", return_value=[0.1] * 384
+            ),
+            "create_embeddings": patch("common.utils.db_client.create_embeddings"),
+            "write": patch("common.utils.db_client.write_law_with_paragraphs", return_value=2),
+            "delete_missing": patch("common.utils.db_client.delete_missing_laws", return_value=0),
+        }
+        self.mocks = {name: patcher.start() for name, patcher in patchers.items()}
+        for patcher in patchers.values():
+            self.addCleanup(patcher.stop)
+
+        self.mocks["create_embeddings"].side_effect = lambda texts, batch_size: [
+            [0.2] * 384 for _ in texts
+        ]
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _write_laws(self, count, xml=SAMPLE_LAW_XML):
+        for i in range(count):
+            path = os.path.join(self.tmpdir.name, f"nl-2000010{i}-001.xml")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(xml)
+
+    def test_process_laws_writes_every_law(self):
+        """Test that every law flows through all stages and the XML files are removed"""
+        self._write_laws(3)
+
+        stats = process_laws(self.tmpdir.name, batch_size=4, parse_workers=0, queue_size=1)
+
+        mock_write = self.mocks["write"]
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        self.assertEqual(mock_write.call_count, 3)
+        self.assertEqual(stats["laws"], 3)
+        self.assertEqual(stats["embedded_paragraphs"], 6)
+        written_records = mock_write.call_args[0][5]
+        self.assertEqual(written_records[0]["embedding"], [0.2] * 384)
+        self.mocks["connect"].return_value.close.assert_called_once()
+
+    def test_process_laws_from_stream(self):
+        """Test that streamed (law_id, bytes) documents are ingested without files"""
+        law_stream = ((f"nl-2000010{i}-001", SAMPLE_LAW_XML.encode()) for i in range(2))
+
+        with patch("common.utils.db_client.os.remove") as mock_remove:
+            stats = process_laws(law_stream=law_stream, parse_workers=0, queue_size=1)
+
+        self.assertEqual(stats["laws"], 2)
+        written_ids = {call[0][1] for call in self.mocks["write"].call_args_list}
+        self.assertEqual(written_ids, {"nl-20000100-001", "nl-20000101-001"})
+        mock_remove.assert_not_called()
+
+    def test_process_laws_stream_failure_abandons_version(self):
+        """Test that a broken law stream fails the build instead of activating it"""
+
+        def law_stream():
+            yield "nl-20000100-001", SAMPLE_LAW_XML.encode()
+            raise OSError("archive stream interrupted")
+
+        with self.assertRaises(OSError):
+            process_laws(law_stream=law_stream(), parse_workers=0)
+
+        self.mocks["abandon_version"].assert_called_once()
+        self.mocks["activate_version"].assert_not_called()
+
+    def test_process_laws_embed_failure_abandons_version(self):
+        """Test that a failing embedding stage fails the build instead of activating it"""
+        self._write_laws(1)
+
+        with patch(
+            "common.utils.db_client.prepare_law_update", side_effect=ValueError("bad law")
+        ), self.assertRaises(ValueError):
+            process_laws(self.tmpdir.name, parse_workers=0)
+
+        self.mocks["abandon_version"].assert_called_once()
+        self.mocks["activate_version"].assert_not_called()
+
+    def test_process_laws_write_failure_abandons_version(self):
+        """Test that a failing write stage fails the build instead of activating it"""
+        self._write_laws(1)
+        self.mocks["write"].side_effect = RuntimeError("write failed")
+
+        with self.assertRaises(RuntimeError):
+            process_laws(self.tmpdir.name, parse_workers=0)
+
+        self.mocks["abandon_version"].assert_called_once()
+        self.mocks["activate_version"].assert_not_called()
+
+    def test_process_laws_removes_laws_missing_from_the_input(self):
+        """Test that only the laws of this run, even unparsable ones, stay in the version"""
+        law_stream = [
+            ("nl-20000100-001", SAMPLE_LAW_XML.encode()),
+            ("nl-20000101-001", b"\xff not utf-8"),
+        ]
+
+        with patch("common.utils.db_client.logging"):
+            process_laws(law_stream=law_stream, parse_workers=0)
+
+        self.mocks["delete_missing"].assert_called_once_with(
+            self.mocks["connect"].return_value,
+            ("laws_v7", "paragraphs_v7"),
+            {"nl-20000100-001", "nl-20000101-001"},
+        )
+
+    def test_process_laws_requires_one_source(self):
+        """Test that exactly one of input_dir and law_stream must be given"""
+        with self.assertRaises(ValueError):
+            process_laws()
+        with self.assertRaises(ValueError):
+            process_laws(self.tmpdir.name, law_stream=[])
+
+    def test_process_laws_builds_and_activates_shadow_version(self):
+        """Test that laws are written to the shadow tables which are then swapped in"""
+        self._write_laws(1)
+
+        stats = process_laws(self.tmpdir.name, parse_workers=0)
+
+        shadow_tables = ("laws_v7", "paragraphs_v7")
+        self.assertEqual(stats["index_version"], 7)
+        self.mocks["create_table"].assert_called_with(
+            self.mocks["connect"].return_value, shadow_tables
+        )
+        self.mocks["copy_tables"].assert_called_once_with(
+            self.mocks["connect"].return_value, ("laws", "paragraphs"), shadow_tables
+        )
+        self.assertEqual(self.mocks["write"].call_args[1]["tables"], shadow_tables)
+        self.mocks["build_indexes"].assert_called_once_with(
+            self.mocks["connect"].return_value, shadow_tables
+        )
+        self.mocks["activate_version"].assert_called_once_with(
+            self.mocks["connect"].return_value, 7
+        )
+        self.mocks["drop_expired"].assert_called_once()
+        self.mocks["abandon_version"].assert_not_called()
+
+    def test_process_laws_abandons_version_on_failure(self):
+        """Test that a failed build drops the shadow version and keeps the live tables"""
+        self.mocks["build_indexes"].side_effect = RuntimeError("index build failed")
+        self._write_laws(1)
+
+        with self.assertRaises(RuntimeError):
+            process_laws(self.tmpdir.name, parse_workers=0)
+
+        self.mocks["abandon_version"].assert_called_once_with(self.mocks["connect"].return_value, 7)
+        self.mocks["activate_version"].assert_not_called()
+
+    def test_process_laws_skips_law_when_embedding_fails(self):
+        """Test that an embedding failure for one law does not stop the pipeline"""
+        self.mocks["create_embeddings"].side_effect = [RuntimeError("onnx"), [[0.2] * 384] * 2]
+        self._write_laws(2)
+
+        stats = process_laws(self.tmpdir.name, parse_workers=0, queue_size=1)
+
+        self.assertEqual(self.mocks["write"].call_count, 1)
+        self.assertEqual(stats["laws"], 1)
+
+    def test_process_laws_full_rebuild_starts_from_empty_tables(self):
+        """Test that full_rebuild does not seed the new version with the live data"""
+        self._write_laws(1)
+
+        process_laws(self.tmpdir.name, parse_workers=0, full_rebuild=True)
+
+        self.mocks["copy_tables"].assert_not_called()
+        self.mocks["activate_version"].assert_called_once()
+
+    def test_process_laws_skips_unchanged_law(self):
+        """Test that a law with an unchanged content hash is neither embedded nor written"""
+        self._write_laws(1)
+        process_laws(self.tmpdir.name, parse_workers=0)
+        write_kwargs = self.mocks["write"].call_args[1]
+        records = self.mocks["write"].call_args[0][5]
+        law_hashes = {"nl-20000100-001": write_kwargs["content_hash"]}
+        paragraph_hashes = {
+            "nl-20000100-001": {r["paragraph_id"]: r["content_hash"] for r in records}
+        }
+        self.mocks["load_hashes"].return_value = (law_hashes, paragraph_hashes)
+        self.mocks["write"].reset_mock()
+        self.mocks["create_embeddings"].reset_mock()
+
+        self._write_laws(1)
+        stats = process_laws(self.tmpdir.name, parse_workers=0)
+
+        self.assertEqual(stats["unchanged_laws"], 1)
+        self.mocks["write"].assert_not_called()
+        self.mocks["create_embeddings"].assert_not_called()
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+
+    def test_process_laws_embeds_only_changed_paragraphs(self):
+        """Test that only new or changed paragraphs are re-embedded and stale ones removed"""
+        self._write_laws(1)
+        process_laws(self.tmpdir.name, parse_workers=0)
+        records = self.mocks["write"].call_args[0][5]
+        paragraph_hashes = {
+            "nl-20000100-001": {r["paragraph_id"]: r["content_hash"] for r in records}
+        }
+        self.mocks["load_hashes"].return_value = ({"nl-20000100-001": "old"}, paragraph_hashes)
+
+        self._write_laws(1, xml=SAMPLE_LAW_XML.replace("§ 2 Virkeområde", "§ 2 Endret"))
+        stats = process_laws(self.tmpdir.name, parse_workers=0)
+
+        self.assertEqual(stats["embedded_paragraphs"], 1)
+        written = self.mocks["write"].call_args
+        self.assertEqual([r["text"] for r in written[0][5]], ["§ 2 Endret"])
+        self.assertEqual(
+            written[1]["current_paragraph_ids"],
+            ["nl-20000100-001_p1_1", "nl-20000100-001_p2_1"],
+        )
+
+    def test_process_laws_law_embedding_from_paragraph_mean(self):
+        """Test that the mean mode derives the law vector from the paragraph vectors"""
+        self.mocks["create_embeddings"].side_effect = lambda texts, batch_size: [
+            [1.0, 0.0, 0.0],
+            [0.0, 1.0, 0.0],
+        ]
+        self._write_laws(1)
+
+        process_laws(self.tmpdir.name, parse_workers=0, law_embedding="mean")
+
+        self.mocks["create_embedding"].assert_not_called()
+        law_vector = self.mocks["write"].call_args[0][4]
+        self.assertAlmostEqual(law_vector[0], 2**-0.5, places=6)
+        self.assertAlmostEqual(law_vector[1], 2**-0.5, places=6)
+
+    def test_process_laws_centroid_uses_stored_vectors_of_unchanged_paragraphs(self):
+        """Test that unchanged paragraph vectors are read back for the law centroid"""
+        self._write_laws(1)
+        process_laws(self.tmpdir.name, parse_workers=0, law_embedding="mean")
+        records = self.mocks["write"].call_args[0][5]
+        paragraph_hashes = {
+            "nl-20000100-001": {r["paragraph_id"]: r["content_hash"] for r in records}
+        }
+        self.mocks["load_hashes"].return_value = ({"nl-20000100-001": "old"}, paragraph_hashes)
+        self.mocks["create_embeddings"].side_effect = lambda texts, batch_size: [[0.0, 1.0]]
+
+        self._write_laws(1, xml=SAMPLE_LAW_XML.replace("§ 2 Virkeområde", "§ 2 Endret"))
+        with patch(
+            "common.utils.db_client.load_paragraph_embeddings",
+            return_value={"nl-20000100-001_p1_1": [1.0, 0.0]},
+        ) as mock_load:
+            process_laws(self.tmpdir.name, parse_workers=0, law_embedding="mean")
+
+        self.assertEqual(mock_load.call_args[0][2], ["nl-20000100-001_p1_1"])
+        law_vector = self.mocks["write"].call_args[0][4]
+        self.assertAlmostEqual(law_vector[0], 2**-0.5, places=6)
+
+
+class CentroidEmbeddingTest(TestCase):
+    """Test law vectors computed from paragraph vectors."""
+
+    def test_mean_is_normalized(self):
+        """Test that the mean of the paragraph vectors has unit length"""
+        result = centroid_embedding([[2.0, 0.0], [0.0, 2.0]])
+
+        self.assertAlmostEqual(result[0], 2**-0.5, places=6)
+        self.assertAlmostEqual(result[1], 2**-0.5, places=6)
+
+    def test_weights_pull_the_centroid(self):
+        """Test that heavier paragraphs dominate the weighted centroid"""
+        result = centroid_embedding([[1.0, 0.0], [0.0, 1.0]], weights=[3, 1])
+
+        self.assertGreater(result[0], result[1])
+        self.assertAlmostEqual(result[0] ** 2 + result[1] ** 2, 1.0, places=6)
+
+
 class DatabaseIntegrationTest(TestCase):
     """Integration tests for database operations using Django test database."""
 
@@ -192,99 +570,349 @@ class DatabaseIntegrationTest(TestCase):
         self.assertTrue(paragraphs_exists)
         self.assertTrue(vector_exists)
 
-    def test_insert_law_record(self):
-        """Test inserting a law record into the database"""
-        clear_table(self.conn)
-
-        law_id = "test-law-001"
-        text = "This is a test law text."
-        metadata = {"title": "Test Law", "year": "2024"}
-        embedding = [0.1] * 384
-
-        insert_law_record(self.conn, law_id, text, metadata, embedding)
+    def test_write_law_with_paragraphs(self):
+        """Test that a law and its paragraphs are written together"""
+        clear_tables(self.conn)
+
+        records = [
+            {
+                "paragraph_id": "law-3_p1_1",
+                "paragraph_number": "§ 2",
+                "text": "Paragraph text",
+                "metadata": {},
+                "embedding": [0.2] * 384,
+            }
+        ]
+
+        stored = write_law_with_paragraphs(
+            self.conn, "law-3", "Law text", {"Tittel": "Law"}, [0.1] * 384, records
+        )
 
         with self.conn.cursor() as cur:
-            cur.execute("SELECT law_id, text, metadata FROM laws WHERE law_id = %s", (law_id,))
-            result = cur.fetchone()
-
-        self.assertIsNotNone(result)
-        self.assertEqual(result[0], law_id)
-        self.assertEqual(result[1], text)
-        self.assertEqual(result[2]["title"], "Test Law")
-
-    def test_insert_paragraph_record(self):
-        """Test inserting a paragraph record into the database"""
-        clear_table(self.conn)
-
-        law_id = "test-law-002"
-        insert_law_record(self.conn, law_id, "Law text", {}, [0.1] * 384)
-
-        paragraph_id = "test-para-001"
-        paragraph_number = "§ 1"
-        text = "This is paragraph text."
-        metadata = {"section": "1"}
-        embedding = [0.2] * 384
+            cur.execute("SELECT COUNT(*) FROM laws WHERE law_id = 'law-3'")
+            laws_count = cur.fetchone()[0]
+            cur.execute("SELECT COUNT(*) FROM paragraphs WHERE law_id = 'law-3'")
+            paragraphs_count = cur.fetchone()[0]
 
-        insert_paragraph_record(
-            self.conn, law_id, paragraph_id, paragraph_number, text, metadata, embedding
+        self.assertEqual(stored, 1)
+        self.assertEqual(laws_count, 1)
+        self.assertEqual(paragraphs_count, 1)
+
+    def test_write_law_with_paragraphs_upserts_and_deletes_stale(self):
+        """Test that rewriting a law updates changed paragraphs and removes stale ones"""
+        clear_tables(self.conn)
+
+        def record(paragraph_id, text):
+            return {
+                "paragraph_id": paragraph_id,
+                "paragraph_number": "§ 2",
+                "text": text,
+                "metadata": {},
+                "embedding": [0.2] * 384,
+                "content_hash": text,
+            }
+
+        write_law_with_paragraphs(
+            self.conn,
+            "law-4",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [record("law-4_p1_1", "Old"), record("law-4_p2_1", "Removed")],
+            content_hash="v1",
+        )
+        write_law_with_paragraphs(
+            self.conn,
+            "law-4",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [record("law-4_p1_1", "New")],
+            content_hash="v2",
+            current_paragraph_ids=["law-4_p1_1"],
         )
 
         with self.conn.cursor() as cur:
-            cur.execute(
-                "SELECT paragraph_id, law_id, paragraph_number, text FROM paragraphs WHERE paragraph_id = %s",
-                (paragraph_id,),
+            cur.execute("SELECT content_hash FROM laws WHERE law_id = 'law-4'")
+            law_hashes = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT paragraph_id, text FROM paragraphs WHERE law_id = 'law-4'")
+            paragraphs = cur.fetchall()
+
+        self.assertEqual(law_hashes, ["v2"])
+        self.assertEqual(paragraphs, [("law-4_p1_1", "New")])
+
+    def test_write_law_with_paragraphs_keeps_hash_of_partly_written_law_unset(self):
+        """Test that a law with a failing paragraph is not marked as up to date"""
+        clear_tables(self.conn)
+
+        def record(paragraph_id, dimensions):
+            return {
+                "paragraph_id": paragraph_id,
+                "paragraph_number": "§ 2",
+                "text": "Text",
+                "metadata": {},
+                "embedding": [0.2] * dimensions,
+            }
+
+        with patch("common.utils.db_client.logging"):
+            stored = write_law_with_paragraphs(
+                self.conn,
+                "law-8",
+                "Law text",
+                {},
+                [0.1] * 384,
+                [record("law-8_p1_1", 384), record("law-8_p2_1", 100)],
+                content_hash="v1",
+            )
+        law_hashes, _ = load_content_hashes(self.conn)
+
+        self.assertEqual(stored, 1)
+        self.assertIsNone(law_hashes["law-8"])
+
+        write_law_with_paragraphs(
+            self.conn,
+            "law-8",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [record("law-8_p1_1", 384), record("law-8_p2_1", 384)],
+            content_hash="v1",
+        )
+        law_hashes, _ = load_content_hashes(self.conn)
+
+        self.assertEqual(law_hashes["law-8"], "v1")
+
+    def test_delete_missing_laws(self):
+        """Test that laws outside the ingested set are deleted with their paragraphs"""
+        clear_tables(self.conn)
+        for law_id in ("kept-law", "dropped-law"):
+            write_law_with_paragraphs(
+                self.conn,
+                law_id,
+                "Law text",
+                {},
+                [0.1] * 384,
+                [
+                    {
+                        "paragraph_id": f"{law_id}_p1_1",
+                        "paragraph_number": "§ 2",
+                        "text": "Text",
+                        "metadata": {},
+                        "embedding": [0.2] * 384,
+                    }
+                ],
             )
-            result = cur.fetchone()
-
-        self.assertIsNotNone(result)
-        self.assertEqual(result[0], paragraph_id)
-        self.assertEqual(result[1], law_id)
-        self.assertEqual(result[2], paragraph_number)
-        self.assertEqual(result[3], text)
-
-    def test_clear_table(self):
-        """Test clearing all records from tables"""
-        insert_law_record(self.conn, "law-1", "Text 1", {}, [0.1] * 384)
-        insert_law_record(self.conn, "law-2", "Text 2", {}, [0.2] * 384)
 
-        clear_table(self.conn)
+        removed = delete_missing_laws(self.conn, LIVE_TABLES, {"kept-law"})
+        kept_after_empty_run = delete_missing_laws(self.conn, LIVE_TABLES, set())
 
         with self.conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM laws")
-            laws_count = cur.fetchone()[0]
-
-            cur.execute("SELECT COUNT(*) FROM paragraphs")
-            paragraphs_count = cur.fetchone()[0]
-
-        self.assertEqual(laws_count, 0)
-        self.assertEqual(paragraphs_count, 0)
-
-    def test_insert_law_record_with_exception(self):
-        """Test that insert_law_record handles exceptions gracefully"""
-        clear_table(self.conn)
+            cur.execute("SELECT law_id FROM laws")
+            laws = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT law_id FROM paragraphs")
+            paragraph_laws = [row[0] for row in cur.fetchall()]
+
+        self.assertEqual(removed, 1)
+        self.assertEqual(kept_after_empty_run, 0)
+        self.assertEqual(laws, ["kept-law"])
+        self.assertEqual(paragraph_laws, ["kept-law"])
+
+    def test_load_content_hashes(self):
+        """Test loading stored law and paragraph hashes"""
+        clear_tables(self.conn)
+        write_law_with_paragraphs(
+            self.conn,
+            "law-5",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [
+                {
+                    "paragraph_id": "law-5_p1_1",
+                    "paragraph_number": "§ 2",
+                    "text": "Text",
+                    "metadata": {},
+                    "embedding": [0.2] * 384,
+                    "content_hash": "p-hash",
+                }
+            ],
+            content_hash="law-hash",
+        )
 
-        insert_law_record(self.conn, "law-1", "Text", {}, [0.1] * 384)
+        law_hashes, paragraph_hashes = load_content_hashes(self.conn)
+
+        self.assertEqual(law_hashes["law-5"], "law-hash")
+        self.assertEqual(paragraph_hashes["law-5"], {"law-5_p1_1": "p-hash"})
+
+    def test_load_paragraph_embeddings(self):
+        """Test reading stored paragraph vectors back as lists"""
+        clear_tables(self.conn)
+        write_law_with_paragraphs(
+            self.conn,
+            "law-6",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [
+                {
+                    "paragraph_id": "law-6_p1_1",
+                    "paragraph_number": "§ 2",
+                    "text": "Text",
+                    "metadata": {},
+                    "embedding": [0.25] * 384,
+                }
+            ],
+        )
 
-        insert_law_record(self.conn, "law-1", "Duplicate", {}, [0.2] * 384)
+        vectors = load_paragraph_embeddings(self.conn, "law-6", ["law-6_p1_1", "missing"])
 
-        self.conn.rollback()
+        self.assertEqual(list(vectors), ["law-6_p1_1"])
+        self.assertEqual(vectors["law-6_p1_1"], [0.25] * 384)
 
+    def test_text_search_column_is_only_added_to_new_tables(self):
+        """Test that existing tables are not rewritten to add the generated column"""
+        tables = IndexTables("tsv_test_laws", "tsv_test_paragraphs")
+        shadow_tables = version_tables(9, tables)
         with self.conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM laws WHERE law_id = 'law-1'")
-            count = cur.fetchone()[0]
+            cur.execute(
+                "CREATE TABLE tsv_test_paragraphs (id SERIAL PRIMARY KEY, paragraph_id TEXT);"
+            )
+        self.conn.commit()
+
+        try:
+            create_table_if_not_exists(self.conn, tables)
+            create_table_if_not_exists(self.conn, shadow_tables)
+
+            self.assertNotIn("text_search", self._columns(tables.paragraphs))
+            self.assertIn("word_count", self._columns(tables.paragraphs))
+            self.assertIn("text_search", self._columns(shadow_tables.paragraphs))
+        finally:
+            self.conn.rollback()
+            with self.conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {', '.join(tables + shadow_tables)};")  # noqa: S608
+            self.conn.commit()
+
+    def _columns(self, table):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT column_name FROM information_schema.columns WHERE table_name = %s;",
+                (table,),
+            )
+            return {row[0] for row in cur.fetchall()}
+
+    def test_paragraphs_are_indexed_for_full_text_search(self):
+        """Test the generated Norwegian tsvector column and its GIN index"""
+        clear_tables(self.conn)
+        write_law_with_paragraphs(
+            self.conn,
+            "law-7",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [
+                {
+                    "paragraph_id": "law-7_p1_1",
+                    "paragraph_number": "§ 2",
+                    "text": "Den behandlingsansvarlige skal slette personopplysningene.",
+                    "metadata": {},
+                    "embedding": [0.25] * 384,
+                }
+            ],
+        )
+        build_indexes(self.conn)
 
-        self.assertEqual(count, 1)
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT paragraph_id FROM paragraphs
+                WHERE text_search @@ plainto_tsquery('norwegian', 'personopplysninger');
+            """
+            )
+            matches = cur.fetchall()
+            cur.execute(
+                "SELECT indexdef FROM pg_indexes WHERE indexname = 'paragraphs_text_search_idx';"
+            )
+            index = cur.fetchone()
 
-    def test_insert_paragraph_record_with_exception(self):
-        """Test that insert_paragraph_record handles exceptions gracefully"""
-        clear_table(self.conn)
+        self.assertEqual(matches, [("law-7_p1_1",)])
+        self.assertIn("USING gin (text_search)", index[0])
 
-        insert_paragraph_record(self.conn, "law-1", "para-1", "§1", "Text", {}, [0.1] * 100)
+    def test_paragraph_index_can_be_quantized(self):
+        """Test that quantization builds the paragraphs index on bit(384), not the laws one"""
+        build_indexes(
+            self.conn, index_config=VectorIndexConfig(quantization="binary"), rebuild=True
+        )
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT tablename, indexdef FROM pg_indexes "
+                    "WHERE indexname IN ('laws_embedding_idx', 'paragraphs_embedding_idx');"
+                )
+                indexes = dict(cur.fetchall())
+        finally:
+            # The other tests expect the full precision index
+            build_indexes(self.conn, index_config=VectorIndexConfig(), rebuild=True)
+
+        self.assertIn("(embedding vector_cosine_ops)", indexes["laws"])
+        self.assertIn("bit_hamming_ops", indexes["paragraphs"])
+        self.assertIn("binary_quantize(embedding)", indexes["paragraphs"])
+
+    def test_paragraph_text_is_precomputed(self):
+        """Test that the display text, word count, Lovdata link and § 1 flag are stored"""
+        clear_tables(self.conn)
+        write_law_with_paragraphs(
+            self.conn,
+            "nl-20000101-001",
+            "Law text",
+            {},
+            [0.1] * 384,
+            [
+                {
+                    "paragraph_id": "nl-20000101-001_p1_1",
+                    "paragraph_number": "§ 2",
+                    "text": "  § 2  Kommunen   skal ha en plan. ",
+                    "metadata": {},
+                    "embedding": [0.2] * 384,
+                }
+            ],
+        )
+        # A row stored before ingestion filled in the text columns
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO paragraphs "
+                "(paragraph_id, law_id, paragraph_number, text, metadata, embedding) "
+                "VALUES (%s, %s, %s, %s, '{}', %s);",
+                ("nl-20000101-001_p1_2", "nl-20000101-001", "§ 1", "§ 1 Annen tekst", [0.2] * 384),
+            )
+        self.conn.commit()
 
-        self.conn.rollback()
+        updated = backfill_paragraph_text(self.conn)
 
         with self.conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM paragraphs")
-            count = cur.fetchone()[0]
-
-        self.assertEqual(count, 0)
+            cur.execute(
+                "SELECT paragraph_id, clean_text, word_count, lovdata_url, is_first_section "
+                "FROM paragraphs "
+                "ORDER BY paragraph_id;"
+            )
+            rows = cur.fetchall()
+
+        self.assertEqual(updated, 1)
+        self.assertEqual(
+            rows,
+            [
+                (
+                    "nl-20000101-001_p1_1",
+                    "§ 2 Kommunen skal ha en plan.",
+                    6,
+                    "https://lovdata.no/dokument/LTI/lov/2000-01-01-1/§2",
+                    False,
+                ),
+                (
+                    "nl-20000101-001_p1_2",
+                    "§ 1 Annen tekst",
+                    3,
+                    "https://lovdata.no/dokument/LTI/lov/2000-01-01-1/§1",
+                    True,
+                ),
+            ],
+        )
@@ -0,0 +1,127 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+
+from common.utils.db_pool import ConnectionPool, PoolTimeoutError, db_config_from_settings
+
+
+def _mock_connection():
+    conn = MagicMock(closed=0)
+    conn.info.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class ConnectionPoolTest(TestCase):
+    """Test the bounded connection pool used by the law retriever."""
+
+    def setUp(self):
+        connect_patcher = patch(
+            "common.utils.db_pool.psycopg2.connect", side_effect=lambda **_: _mock_connection()
+        )
+        self.mock_connect = connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+    def _pool(self, **kwargs):
+        pool = ConnectionPool({"dbname": "test_db"}, **kwargs)
+        self.addCleanup(pool.close)
+        return pool
+
+    def test_connections_are_reused(self):
+        """Test that a returned connection is handed out again instead of a new one"""
+        pool = self._pool()
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.mock_connect.assert_called_once_with(
+            dbname="test_db", options="-c statement_timeout=5000"
+        )
+        self.assertTrue(first.autocommit)
+
+    def test_checkout_times_out_when_pool_is_exhausted(self):
+        """Test that no more than max_size connections are opened"""
+        pool = self._pool(max_size=2, checkout_timeout=0.01)
+        pool.getconn()
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeoutError):
+            pool.getconn()
+
+        stats = pool.stats()
+        self.assertEqual(stats["in_use"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(self.mock_connect.call_count, 2)
+
+    def test_broken_connection_is_discarded(self):
+        """Test that a connection that failed is closed and its slot freed"""
+        pool = self._pool(max_size=1)
+
+        with self.assertRaises(psycopg2.OperationalError), pool.connection() as conn:
+            raise psycopg2.OperationalError("server closed the connection")
+
+        conn.close.assert_called_once()
+        with pool.connection() as new_conn:
+            self.assertIsNot(new_conn, conn)
+        self.assertEqual(pool.stats()["discarded"], 1)
+
+    def test_idle_connections_above_min_size_are_closed(self):
+        """Test that connections idle for longer than the idle timeout are closed"""
+        pool = self._pool(min_size=1, idle_timeout=60)
+        with patch("common.utils.db_pool.time.monotonic", return_value=0):
+            first = pool.getconn()
+            second = pool.getconn()
+            pool.putconn(first)
+            pool.putconn(second)
+
+        with patch("common.utils.db_pool.time.monotonic", return_value=120):
+            conn = pool.getconn()
+
+        first.close.assert_called_once()
+        self.assertIs(conn, second)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_stale_connection_is_checked_before_checkout(self):
+        """Test that a connection idle for a while is pinged and replaced if dead"""
+        pool = self._pool(health_check_after=30)
+        with patch("common.utils.db_pool.time.monotonic", return_value=0):
+            stale = pool.getconn()
+            pool.putconn(stale)
+        stale.cursor.return_value.__enter__.return_value.execute.side_effect = (
+            psycopg2.OperationalError("terminated by administrator")
+        )
+
+        with patch("common.utils.db_pool.time.monotonic", return_value=60):
+            conn = pool.getconn()
+
+        self.assertIsNot(conn, stale)
+        self.assertEqual(pool.stats()["failed_health_checks"], 1)
+
+    def test_open_fills_pool_to_min_size(self):
+        """Test that opening the pool connects up front"""
+        pool = self._pool(min_size=2)
+
+        pool.open_pool()
+
+        self.assertEqual(pool.stats()["idle"], 2)
+
+    @patch("common.utils.db_pool.settings")
+    def test_db_config_from_settings(self, mock_settings):
+        """Test that the connection arguments come from Django's DATABASES"""
+        mock_settings.DATABASES = {
+            "default": {
+                "NAME": "laws",
+                "USER": "user",
+                "PASSWORD": "secret",
+                "HOST": "db",
+                "PORT": "",
+            }
+        }
+
+        self.assertEqual(
+            db_config_from_settings(),
+            {"dbname": "laws", "user": "user", "password": "secret", "host": "db"},
+        )
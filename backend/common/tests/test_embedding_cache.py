@@ -0,0 +1,119 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from common.utils import embedding_cache
+from common.utils.embedding_cache import EmbeddingCache, get_embedding_cache
+
+
+class EmbeddingCacheTest(TestCase):
+    """Test the memory-mapped embedding cache."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def _cache(self, max_entries=10):
+        cache = EmbeddingCache(self.tmpdir.name, "test/model", dim=3, max_entries=max_entries)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_get_many_returns_stored_vectors(self):
+        """Test that stored vectors are returned and unknown texts are misses"""
+        cache = self._cache()
+        cache.put_many(["a", "b"], [[1, 2, 3], [4, 5, 6]])
+
+        vectors = cache.get_many(["b", "c", "a"])
+
+        np.testing.assert_array_equal(vectors[0], [4, 5, 6])
+        self.assertIsNone(vectors[1])
+        np.testing.assert_array_equal(vectors[2], [1, 2, 3])
+        self.assertEqual(cache.stats()["hits"], 2)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_get_or_compute_embeds_distinct_missing_texts_once(self):
+        """Test that only missing texts are computed, and duplicates only once"""
+        cache = self._cache()
+        cache.put_many(["cached"], [[1, 1, 1]])
+        compute = MagicMock(side_effect=lambda texts: [[len(text)] * 3 for text in texts])
+
+        vectors = cache.get_or_compute(["cached", "new", "new"], compute)
+
+        compute.assert_called_once_with(["new"])
+        np.testing.assert_array_equal(vectors[0], [1, 1, 1])
+        np.testing.assert_array_equal(vectors[2], [3, 3, 3])
+
+    def test_cache_persists_across_instances(self):
+        """Test that vectors written by one process are read by the next"""
+        first = self._cache()
+        first.put_many(["paragraph"], [[0.5, 0.25, 0.125]])
+        first.close()
+
+        vectors = self._cache().get_many(["paragraph"])
+
+        np.testing.assert_array_equal(vectors[0], np.float32([0.5, 0.25, 0.125]))
+
+    def test_evicts_least_recently_used_entry(self):
+        """Test that a full cache replaces the entry that was used longest ago"""
+        cache = self._cache(max_entries=2)
+        with patch("common.utils.embedding_cache.time.time", side_effect=[1, 2, 3, 4]):
+            cache.put_many(["old"], [[1, 1, 1]])
+            cache.put_many(["recent"], [[2, 2, 2]])
+            cache.get_many(["old"])
+            cache.put_many(["new"], [[3, 3, 3]])
+
+        vectors = cache.get_many(["old", "recent", "new"])
+
+        self.assertIsNotNone(vectors[0])
+        self.assertIsNone(vectors[1])
+        np.testing.assert_array_equal(vectors[2], [3, 3, 3])
+        self.assertEqual(cache.stats()["entries"], 2)
+
+    def test_slot_overwritten_by_another_process_is_a_miss(self):
+        """Test that a vector evicted between the index lookup and the read is not returned"""
+        first = self._cache(max_entries=1)
+        first.put_many(["old"], [[1, 1, 1]])
+        second = self._cache(max_entries=1)
+        read_slot = first._read_slot
+
+        def read_after_eviction(slot, key):
+            second.put_many(["new"], [[2, 2, 2]])
+            return read_slot(slot, key)
+
+        with patch.object(first, "_read_slot", side_effect=read_after_eviction):
+            vectors = first.get_many(["old"])
+
+        self.assertIsNone(vectors[0])
+        np.testing.assert_array_equal(first.get_many(["new"])[0], [2, 2, 2])
+
+    def test_use_times_are_written_in_batches(self):
+        """Test that lookups only write their use times once a batch has built up"""
+        cache = self._cache()
+        with patch("common.utils.embedding_cache.time.time", side_effect=[1, 2, 3]):
+            cache.put_many(["a", "b"], [[1, 1, 1], [2, 2, 2]])
+            with patch.object(embedding_cache, "_SQLITE_BATCH_SIZE", 2):
+                cache.get_many(["a", "missing"])
+                before_batch = dict(cache._db.execute("SELECT key, last_used FROM entries;"))
+                cache.get_many(["b"])
+                after_batch = dict(cache._db.execute("SELECT key, last_used FROM entries;"))
+
+        key_a, key_b = embedding_cache.text_key("a"), embedding_cache.text_key("b")
+        self.assertEqual(before_batch, {key_a: 1, key_b: 1})
+        self.assertEqual(after_batch, {key_a: 2, key_b: 3})
+
+    def test_get_embedding_cache_disabled_without_directory(self):
+        """Test that no cache is used unless EMBEDDING_CACHE_DIR is set"""
+        with patch.dict(os.environ, {"EMBEDDING_CACHE_DIR": ""}):
+            self.assertIsNone(get_embedding_cache("test/model", 3))
+
+    def test_get_embedding_cache_is_shared(self):
+        """Test that the cache for a directory and model is created once"""
+        self.addCleanup(embedding_cache._caches.clear)
+        with patch.dict(os.environ, {"EMBEDDING_CACHE_DIR": self.tmpdir.name}):
+            cache = get_embedding_cache("test/model", 3)
+            self.addCleanup(cache.close)
+
+            self.assertIs(get_embedding_cache("test/model", 3), cache)
@@ -58,9 +58,9 @@ class GeminiAPIClientStartClientTest(TestCase):
 
 
 class GeminiAPIClientSendQuestionTest(TestCase):
-    @patch("common.utils.gemini_client.LawRetriever")
+    @patch("common.utils.gemini_client.get_law_retriever")
     @patch("common.utils.gemini_client.genai.Client")
-    def test_send_question_with_laws_success(self, mock_client_class, mock_law_retriever_class):
+    def test_send_question_with_laws_success(self, mock_client_class, mock_get_law_retriever):
         """Test send_question_with_laws sends message and returns response with history"""
         mock_response = MagicMock()
         mock_response.text = "Response to legal question"
@@ -78,7 +78,7 @@ class GeminiAPIClientSendQuestionTest(TestCase):
 
         mock_law_retriever = MagicMock()
         mock_law_retriever.retrieve.return_value = {"paragraphs": [], "laws": []}
-        mock_law_retriever_class.return_value = mock_law_retriever
+        mock_get_law_retriever.return_value = mock_law_retriever
 
         client = GeminiAPIClient(api_key="test-key")
         response_text, history = client.send_question_with_laws(
@@ -89,10 +89,10 @@ class GeminiAPIClientSendQuestionTest(TestCase):
         self.assertEqual(len(history), 2)
         mock_law_retriever.retrieve.assert_called_once()
 
-    @patch("common.utils.gemini_client.LawRetriever")
+    @patch("common.utils.gemini_client.get_law_retriever")
     @patch("common.utils.gemini_client.genai.Client")
     def test_send_question_with_context_and_system_instruction(
-        self, mock_client_class, mock_law_retriever_class
+        self, mock_client_class, mock_get_law_retriever
     ):
         """Test sending message with context and system instruction"""
         mock_response = MagicMock()
@@ -108,7 +108,7 @@ class GeminiAPIClientSendQuestionTest(TestCase):
 
         mock_law_retriever = MagicMock()
         mock_law_retriever.retrieve.return_value = {"paragraphs": [], "laws": []}
-        mock_law_retriever_class.return_value = mock_law_retriever
+        mock_get_law_retriever.return_value = mock_law_retriever
 
         client = GeminiAPIClient(api_key="test-key")
         client.send_question_with_laws(
@@ -121,9 +121,9 @@ class GeminiAPIClientSendQuestionTest(TestCase):
         call_kwargs = mock_client.chats.create.call_args[1]
         self.assertIn("config", call_kwargs)
 
-    @patch("common.utils.gemini_client.LawRetriever")
+    @patch("common.utils.gemini_client.get_law_retriever")
     @patch("common.utils.gemini_client.genai.Client")
-    def test_send_question_with_custom_model(self, mock_client_class, mock_law_retriever_class):
+    def test_send_question_with_custom_model(self, mock_client_class, mock_get_law_retriever):
         """Test sending message with custom model name"""
         mock_response = MagicMock()
         mock_response.text = "Response"
@@ -138,7 +138,7 @@ class GeminiAPIClientSendQuestionTest(TestCase):
 
         mock_law_retriever = MagicMock()
         mock_law_retriever.retrieve.return_value = {"paragraphs": [], "laws": []}
-        mock_law_retriever_class.return_value = mock_law_retriever
+        mock_get_law_retriever.return_value = mock_law_retriever
 
         client = GeminiAPIClient(api_key="test-key")
         client.send_question_with_laws(
@@ -148,9 +148,9 @@ class GeminiAPIClientSendQuestionTest(TestCase):
         call_kwargs = mock_client.chats.create.call_args[1]
         self.assertEqual(call_kwargs["model"], "gemini-pro")
 
-    @patch("common.utils.gemini_client.LawRetriever")
+    @patch("common.utils.gemini_client.get_law_retriever")
     @patch("common.utils.gemini_client.genai.Client")
-    def test_send_question_with_law_retrieval(self, mock_client_class, mock_law_retriever_class):
+    def test_send_question_with_law_retrieval(self, mock_client_class, mock_get_law_retriever):
         """Test that law paragraphs are retrieved and included in context"""
         mock_response = MagicMock()
         mock_response.text = "Legal response"
@@ -171,11 +171,13 @@ class GeminiAPIClientSendQuestionTest(TestCase):
                     "paragraph_number": "§ 1",
                     "text": "Test law paragraph",
                     "cosine_distance": 0.1,
+                    "word_count": 3,
+                    "lovdata_url": "https://lovdata.no/dokument/LTI/lov/1967-02-10-1/§1",
                 }
             ],
             "laws": [{"law_id": "lov19670210001", "metadata": {"title": "Test Law"}}],
         }
-        mock_law_retriever_class.return_value = mock_law_retriever
+        mock_get_law_retriever.return_value = mock_law_retriever
 
         client = GeminiAPIClient(api_key="test-key")
         response_text, _ = client.send_question_with_laws(
@@ -185,12 +187,38 @@ class GeminiAPIClientSendQuestionTest(TestCase):
         # Response should include law links appended to the base response
         self.assertIn("Legal response", response_text)
         self.assertIn("Lovdata-lenker", response_text)
+        self.assertIn("https://lovdata.no/dokument/LTI/lov/1967-02-10-1/§1", response_text)
         mock_chat.send_message.assert_called_once()
         call_args = mock_chat.send_message.call_args[0][0]
         self.assertTrue(
             any("KONTEKST" in str(part.text) for part in call_args if hasattr(part, "text"))
         )
 
+    @override_settings(LAW_RETRIEVER_HYBRID_K_PARAGRAPHS=6)
+    @patch("common.utils.gemini_client.get_law_retriever")
+    @patch("common.utils.gemini_client.genai.Client")
+    def test_send_question_fetches_fewer_paragraphs_with_hybrid_retrieval(
+        self, mock_client_class, mock_get_law_retriever
+    ):
+        """Test that hybrid retrieval asks for LAW_RETRIEVER_HYBRID_K_PARAGRAPHS paragraphs"""
+        mock_chat = MagicMock()
+        mock_chat.send_message.return_value = MagicMock(text="Response")
+        mock_chat.get_history.return_value = []
+        mock_client_class.return_value.chats.create.return_value = mock_chat
+
+        for hybrid, k_paragraphs in ((True, 6), (False, 20)):
+            mock_law_retriever = MagicMock(hybrid=hybrid)
+            mock_law_retriever.retrieve.return_value = {"paragraphs": [], "laws": []}
+            mock_get_law_retriever.return_value = mock_law_retriever
+
+            GeminiAPIClient(api_key="test-key").send_question_with_laws(
+                prompt="Question", current_history=[]
+            )
+
+            mock_law_retriever.retrieve.assert_called_once_with(
+                "Question", k_laws=3, k_paragraphs=k_paragraphs, max_words=400
+            )
+
 
 class GeminiChatServiceTest(TestCase):
     def test_service_singleton_exists(self):
@@ -0,0 +1,149 @@
+"""Integration tests for blue/green index versions using the Django test database.
+
+The tests use their own live table names so they never rename the real ``laws`` and
+``paragraphs`` tables.
+"""
+
+from django.conf import settings
+from django.test import TestCase
+
+import psycopg2
+
+from common.utils.db_client import create_table_if_not_exists, write_law_with_paragraphs
+from common.utils.index_versions import (
+    IndexTables,
+    abandon_index_version,
+    activate_index_version,
+    begin_index_version,
+    create_versions_table,
+    drop_expired_index_versions,
+    get_active_index_version,
+    get_retained_index_versions,
+    rollback_index_version,
+    version_tables,
+)
+
+
+TEST_TABLES = IndexTables("iv_test_laws", "iv_test_paragraphs")
+
+
+class IndexVersionsIntegrationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        db_settings = settings.DATABASES["default"]
+        cls.db_config = {
+            "dbname": db_settings["NAME"],
+            "user": db_settings["USER"],
+            "password": db_settings["PASSWORD"],
+            "host": db_settings["HOST"],
+            "port": db_settings["PORT"],
+        }
+
+    def setUp(self):
+        self.conn = psycopg2.connect(**self.db_config)
+        self._reset()
+        create_versions_table(self.conn)
+        create_table_if_not_exists(self.conn, TEST_TABLES)
+
+    def tearDown(self):
+        self._reset()
+        self.conn.close()
+
+    def _reset(self):
+        with self.conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT tablename FROM pg_tables
+                WHERE schemaname = current_schema() AND tablename LIKE 'iv_test_%';
+            """
+            )
+            for (table,) in cur.fetchall():
+                cur.execute(f'DROP TABLE IF EXISTS "{table}";')
+            cur.execute("DROP TABLE IF EXISTS index_versions;")
+        self.conn.commit()
+
+    def _build_version(self, law_id):
+        version = begin_index_version(self.conn)
+        tables = version_tables(version, TEST_TABLES)
+        create_table_if_not_exists(self.conn, tables)
+        write_law_with_paragraphs(self.conn, law_id, "Law text", {}, [0.1] * 384, [], tables=tables)
+        return version
+
+    def _live_law_ids(self):
+        with self.conn.cursor() as cur:
+            cur.execute(f"SELECT law_id FROM {TEST_TABLES.laws};")
+            return [row[0] for row in cur.fetchall()]
+
+    def _table_exists(self, table):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+            return cur.fetchone()[0]
+
+    def test_activate_swaps_shadow_tables_in(self):
+        """Test that activation makes the shadow tables live and keeps the old ones"""
+        version = self._build_version("law-new")
+
+        activate_index_version(self.conn, version, TEST_TABLES)
+
+        self.assertEqual(self._live_law_ids(), ["law-new"])
+        self.assertEqual(get_active_index_version(self.conn), version)
+        self.assertFalse(self._table_exists(version_tables(version, TEST_TABLES).laws))
+
+    def test_activate_renames_indexes_with_tables(self):
+        """Test that index names follow their table through the swap"""
+        version = self._build_version("law-new")
+
+        activate_index_version(self.conn, version, TEST_TABLES)
+
+        with self.conn.cursor() as cur:
+            cur.execute(
+                "SELECT indexname FROM pg_indexes WHERE tablename = %s;", (TEST_TABLES.laws,)
+            )
+            index_names = {row[0] for row in cur.fetchall()}
+        self.assertIn(f"{TEST_TABLES.laws}_law_id_key", index_names)
+
+    def test_rollback_restores_previous_version(self):
+        """Test that rollback swaps the previously active version back in"""
+        first = self._build_version("law-first")
+        activate_index_version(self.conn, first, TEST_TABLES)
+        second = self._build_version("law-second")
+        activate_index_version(self.conn, second, TEST_TABLES)
+
+        restored = rollback_index_version(self.conn, TEST_TABLES)
+
+        self.assertEqual(restored, first)
+        self.assertEqual(self._live_law_ids(), ["law-first"])
+        self.assertEqual(get_active_index_version(self.conn), first)
+
+    def test_rollback_without_previous_version_raises(self):
+        """Test that rollback fails when there is nothing to go back to"""
+        with self.assertRaises(LookupError):
+            rollback_index_version(self.conn, TEST_TABLES)
+
+    def test_drop_expired_versions(self):
+        """Test that retired versions outside the rollback window are dropped"""
+        first = self._build_version("law-first")
+        activate_index_version(self.conn, first, TEST_TABLES)
+        second = self._build_version("law-second")
+        activate_index_version(self.conn, second, TEST_TABLES)
+
+        kept = drop_expired_index_versions(self.conn, 1, TEST_TABLES)
+        dropped = drop_expired_index_versions(self.conn, 0, TEST_TABLES)
+
+        self.assertEqual(kept, [])
+        self.assertIn(first, dropped)
+        self.assertFalse(self._table_exists(version_tables(first, TEST_TABLES).laws))
+        self.assertEqual(self._live_law_ids(), ["law-second"])
+        self.assertNotIn(first, get_retained_index_versions(self.conn))
+        self.assertIn(second, get_retained_index_versions(self.conn))
+
+    def test_abandon_drops_shadow_tables(self):
+        """Test that an abandoned build leaves the live tables untouched"""
+        version = self._build_version("law-broken")
+
+        abandon_index_version(self.conn, version, TEST_TABLES)
+
+        self.assertFalse(self._table_exists(version_tables(version, TEST_TABLES).laws))
+        self.assertEqual(self._live_law_ids(), [])
+        self.assertIsNone(get_active_index_version(self.conn))
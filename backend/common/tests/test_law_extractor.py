@@ -1,13 +1,22 @@
+import hashlib
+import io
+import json
 import os
+import tarfile
 import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import ClassVar
 from unittest import TestCase
 from unittest.mock import patch
 
+from common.utils.artifact_cache import ArtifactCache
 from common.utils.law_extractor import (
     download_lovdata_file,
     extract_selected_files,
     format_laws_to_lovdata_format,
     list_public_files,
+    stream_lovdata_laws,
 )
 
 
@@ -150,6 +159,191 @@ class DownloadLovdataFileTest(TestCase):
             download_lovdata_file("test;rm -rf /.tar.bz2")
 
 
+ARCHIVE_BODY = b"0123456789" * 100
+ARCHIVE_ETAG = '"archive-v1"'
+
+
+class FakeLovdataHandler(BaseHTTPRequestHandler):
+    """Minimal Lovdata API with ETag validation and Range support."""
+
+    requests_seen: ClassVar[list] = []
+    archive_body = ARCHIVE_BODY
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, dict(self.headers)))
+        if self.headers.get("If-None-Match") == ARCHIVE_ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        if self.path.startswith("/list"):
+            body = json.dumps([{"filename": "archive.tar.bz2"}]).encode()
+            status = 200
+        else:
+            body = self.archive_body
+            status = 200
+            range_header = self.headers.get("Range")
+            if range_header and self.headers.get("If-Range") == ARCHIVE_ETAG:
+                body = self.archive_body[int(range_header[len("bytes=") : -1]) :]
+                status = 206
+
+        self.send_response(status)
+        self.send_header("ETag", ARCHIVE_ETAG)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ConditionalDownloadTest(TestCase):
+    """Test cached downloads against a local HTTP server."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLovdataHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeLovdataHandler.requests_seen = []
+        patcher = patch("common.utils.law_extractor.BASE_URL", self.base_url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_second_download_is_not_modified(self):
+        """Test that an unchanged archive is served from the cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = download_lovdata_file("archive.tar.bz2", out_dir=tmpdir, conditional=True)
+            second = download_lovdata_file("archive.tar.bz2", out_dir=tmpdir, conditional=True)
+
+            self.assertEqual(first, second)
+            with open(second, "rb") as f:
+                self.assertEqual(f.read(), ARCHIVE_BODY)
+
+        self.assertNotIn("If-None-Match", FakeLovdataHandler.requests_seen[0][1])
+        self.assertEqual(FakeLovdataHandler.requests_seen[1][1]["If-None-Match"], ARCHIVE_ETAG)
+
+    def test_interrupted_download_is_resumed(self):
+        """Test that a partial download continues with a Range request"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = ArtifactCache(tmpdir)
+            cache.start_partial("archive.tar.bz2", {"ETag": ARCHIVE_ETAG})
+            with open(cache.partial_path("archive.tar.bz2"), "wb") as f:
+                f.write(ARCHIVE_BODY[:300])
+
+            result = download_lovdata_file("archive.tar.bz2", out_dir=tmpdir, conditional=True)
+
+            with open(result, "rb") as f:
+                self.assertEqual(f.read(), ARCHIVE_BODY)
+            self.assertFalse(os.path.exists(cache.partial_path("archive.tar.bz2")))
+            self.assertEqual(cache.get_metadata("archive.tar.bz2")["etag"], ARCHIVE_ETAG)
+
+        self.assertEqual(FakeLovdataHandler.requests_seen[0][1]["Range"], "bytes=300-")
+
+    def test_checksum_mismatch_discards_download(self):
+        """Test that a download with the wrong checksum is not kept in the cache"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with self.assertRaises(OSError):
+                download_lovdata_file(
+                    "archive.tar.bz2", out_dir=tmpdir, conditional=True, expected_sha256="0" * 64
+                )
+
+            cache = ArtifactCache(tmpdir)
+            self.assertFalse(os.path.exists(cache.path("archive.tar.bz2")))
+            self.assertFalse(os.path.exists(cache.partial_path("archive.tar.bz2")))
+
+    def test_download_verifies_checksum_and_reports_progress(self):
+        """Test that a matching checksum passes and progress reaches the total size"""
+        progress = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            download_lovdata_file(
+                "archive.tar.bz2",
+                out_dir=tmpdir,
+                conditional=True,
+                chunk_size=256,
+                expected_size=len(ARCHIVE_BODY),
+                expected_sha256=hashlib.sha256(ARCHIVE_BODY).hexdigest(),
+                progress=lambda *args: progress.append(args),
+            )
+
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(progress[-1], ("archive.tar.bz2", len(ARCHIVE_BODY), len(ARCHIVE_BODY)))
+
+    def test_list_is_reused_when_not_modified(self):
+        """Test that the cached file list is used on 304 Not Modified"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            first = list_public_files(cache_dir=tmpdir)
+            second = list_public_files(cache_dir=tmpdir)
+
+        self.assertEqual(first, [{"filename": "archive.tar.bz2"}])
+        self.assertEqual(second, first)
+        self.assertEqual(FakeLovdataHandler.requests_seen[1][1]["If-None-Match"], ARCHIVE_ETAG)
+
+    def test_stream_lovdata_laws_reads_archive_from_response(self):
+        """Test that laws are streamed from the archive without writing files"""
+        archive = io.BytesIO()
+        with tarfile.open(fileobj=archive, mode="w:bz2") as tar:
+            for filename, content in [("nl-20180615-038.xml", b"<law/>"), ("other.xml", b"x")]:
+                tarinfo = tarfile.TarInfo(name=f"nl/{filename}")
+                tarinfo.size = len(content)
+                tar.addfile(tarinfo, io.BytesIO(content))
+
+        with (
+            patch.object(FakeLovdataHandler, "archive_body", archive.getvalue()),
+            patch("common.utils.law_extractor.open") as mock_open,
+        ):
+            laws = list(stream_lovdata_laws(["LOV-2018-06-15-038"]))
+
+        self.assertEqual(laws, [("nl-20180615-038", b"<law/>")])
+        mock_open.assert_not_called()
+
+    def test_stream_lovdata_laws_revalidates_cached_archive(self):
+        """Test that a cached archive is only read while the server reports it unchanged"""
+
+        def tar_bytes(content):
+            archive = io.BytesIO()
+            with tarfile.open(fileobj=archive, mode="w:bz2") as tar:
+                tarinfo = tarfile.TarInfo(name="nl/nl-20180615-038.xml")
+                tarinfo.size = len(content)
+                tar.addfile(tarinfo, io.BytesIO(content))
+            return archive.getvalue()
+
+        with (
+            tempfile.TemporaryDirectory() as tmpdir,
+            patch.object(FakeLovdataHandler, "archive_body", tar_bytes(b"<current/>")),
+        ):
+            download_lovdata_file("archive.tar.bz2", out_dir=tmpdir, conditional=True)
+            current = list(stream_lovdata_laws(["LOV-2018-06-15-038"], cache_dir=tmpdir))
+
+            # A cached copy with an outdated validator is replaced by the response
+            cache = ArtifactCache(tmpdir)
+            with open(cache.path("archive.tar.bz2"), "wb") as f:
+                f.write(tar_bytes(b"<stale/>"))
+            cache.set_metadata(
+                "archive.tar.bz2",
+                {"ETag": '"archive-v0"'},
+                os.path.getsize(cache.path("archive.tar.bz2")),
+            )
+            refreshed = list(stream_lovdata_laws(["LOV-2018-06-15-038"], cache_dir=tmpdir))
+
+        self.assertEqual(current, [("nl-20180615-038", b"<current/>")])
+        self.assertEqual(refreshed, [("nl-20180615-038", b"<current/>")])
+        archive_requests = [
+            headers for path, headers in FakeLovdataHandler.requests_seen if "download" in path
+        ]
+        self.assertEqual(archive_requests[1]["If-None-Match"], ARCHIVE_ETAG)
+        self.assertEqual(archive_requests[2]["If-None-Match"], '"archive-v0"')
+
+
 class ExtractSelectedFilesTest(TestCase):
     """Test extracting selected files from tar.bz2 archives."""
 
@@ -219,6 +413,43 @@ class ExtractSelectedFilesTest(TestCase):
             self.assertTrue(os.path.exists(os.path.join(extract_dir, "wanted.xml")))
             self.assertFalse(os.path.exists(os.path.join(extract_dir, "unwanted.xml")))
 
+    def test_extract_selected_files_stops_when_all_found(self):
+        """Test that the archive is not read past the last wanted file"""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            import io
+            import tarfile
+
+            tar_path = os.path.join(tmpdir, "test.tar.bz2")
+
+            with tarfile.open(tar_path, "w:bz2") as tar:
+                for filename in ["first.xml", "wanted.xml", "after.xml"]:
+                    tarinfo = tarfile.TarInfo(name=filename)
+                    tarinfo.size = 7
+                    tar.addfile(tarinfo, io.BytesIO(b"content"))
+
+            extract_dir = os.path.join(tmpdir, "extract")
+            seen = []
+            original_open = tarfile.open
+
+            def tracking_open(*args, **kwargs):
+                archive = original_open(*args, **kwargs)
+                original_next = archive.next
+
+                def tracking_next():
+                    member = original_next()
+                    if member is not None:
+                        seen.append(member.name)
+                    return member
+
+                archive.next = tracking_next
+                return archive
+
+            with patch("common.utils.law_extractor.tarfile.open", side_effect=tracking_open):
+                result = extract_selected_files(tar_path, {"wanted.xml"}, extract_to=extract_dir)
+
+            self.assertEqual(result, {"wanted.xml"})
+            self.assertNotIn("after.xml", seen)
+
 
 class FetchLovdataLawsTest(TestCase):
     """Test the main fetch_lovdata_laws function."""
@@ -226,11 +457,9 @@ class FetchLovdataLawsTest(TestCase):
     @patch("common.utils.law_extractor.list_public_files")
     @patch("common.utils.law_extractor.download_lovdata_file")
     @patch("common.utils.law_extractor.extract_selected_files")
-    @patch("common.utils.law_extractor.os.remove")
-    @patch("common.utils.law_extractor.os.path.exists")
     @patch("common.utils.law_extractor.os.listdir")
     def test_fetch_lovdata_laws_full_workflow(
-        self, mock_listdir, mock_exists, mock_remove, mock_extract, mock_download, mock_list
+        self, mock_listdir, mock_extract, mock_download, mock_list
     ):
         """Test the complete fetch workflow"""
         from common.utils.law_extractor import fetch_lovdata_laws
@@ -240,40 +469,115 @@ class FetchLovdataLawsTest(TestCase):
             {"filename": "other.zip"},
         ]
 
-        mock_exists.return_value = False
-
         mock_listdir.return_value = ["nl-20180615-038.xml"]
 
         with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = os.path.join(tmpdir, "archives")
             fetch_lovdata_laws(["LOV-2018-06-15-038"], out_dir=tmpdir)
 
-            mock_download.assert_called_once_with("archive.tar.bz2", out_dir=tmpdir)
+            mock_list.assert_called_once_with(cache_dir=cache_dir)
+            mock_download.assert_called_once()
+            self.assertEqual(mock_download.call_args[0][0], "archive.tar.bz2")
+            self.assertEqual(mock_download.call_args[1]["out_dir"], cache_dir)
+            self.assertTrue(mock_download.call_args[1]["conditional"])
 
             mock_extract.assert_called_once()
 
-            mock_remove.assert_called_once()
-
     @patch("common.utils.law_extractor.list_public_files")
     @patch("common.utils.law_extractor.download_lovdata_file")
     @patch("common.utils.law_extractor.extract_selected_files")
     @patch("common.utils.law_extractor.os.remove")
-    @patch("common.utils.law_extractor.os.path.exists")
     @patch("common.utils.law_extractor.os.listdir")
-    def test_fetch_lovdata_laws_skips_existing_archive(
-        self, mock_listdir, mock_exists, mock_remove, mock_extract, mock_download, mock_list
+    def test_fetch_lovdata_laws_keeps_cached_archive(
+        self, mock_listdir, mock_remove, mock_extract, mock_download, mock_list
     ):
-        """Test that existing archives are not re-downloaded"""
+        """Test that archives are kept in the cache directory for the next run"""
         from common.utils.law_extractor import fetch_lovdata_laws
 
         mock_list.return_value = [{"filename": "archive.tar.bz2"}]
-        mock_exists.return_value = True
         mock_listdir.return_value = ["nl-20180615-038.xml"]
 
         with tempfile.TemporaryDirectory() as tmpdir:
-            fetch_lovdata_laws(["LOV-2018-06-15-038"], out_dir=tmpdir)
+            cache_dir = os.path.join(tmpdir, "cache")
+            fetch_lovdata_laws(["LOV-2018-06-15-038"], out_dir=tmpdir, cache_dir=cache_dir)
 
-            mock_download.assert_not_called()
+            mock_download.assert_called_once()
+            self.assertEqual(mock_download.call_args[1]["out_dir"], cache_dir)
             mock_extract.assert_called_once()
+            mock_remove.assert_not_called()
+
+    @patch("common.utils.law_extractor.list_public_files")
+    @patch("common.utils.law_extractor.download_lovdata_file")
+    @patch("common.utils.law_extractor.extract_selected_files")
+    def test_fetch_lovdata_laws_stops_when_all_laws_found(
+        self, mock_extract, mock_download, mock_list
+    ):
+        """Test that no further archives are downloaded once every law is found"""
+        from common.utils.law_extractor import fetch_lovdata_laws, load_law_sources
+
+        mock_list.return_value = [{"filename": "first.tar.bz2"}, {"filename": "second.tar.bz2"}]
+        mock_extract.return_value = {"nl-20180615-038.xml"}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = fetch_lovdata_laws(["LOV-2018-06-15-038"], out_dir=tmpdir)
+            sources = load_law_sources(tmpdir)
+
+        self.assertEqual(result, {"nl-20180615-038.xml": "first.tar.bz2"})
+        self.assertEqual(sources, {"nl-20180615-038.xml": "first.tar.bz2"})
+        self.assertEqual(mock_download.call_count, 1)
+        self.assertEqual(mock_download.call_args[0][0], "first.tar.bz2")
+
+    @patch("common.utils.law_extractor.list_public_files")
+    @patch("common.utils.law_extractor.download_lovdata_file")
+    @patch("common.utils.law_extractor.extract_selected_files")
+    def test_fetch_lovdata_laws_reads_known_archive_first(
+        self, mock_extract, mock_download, mock_list
+    ):
+        """Test that the archive recorded in the manifest is tried before the others"""
+        from common.utils.law_extractor import fetch_lovdata_laws, save_law_sources
+
+        mock_list.return_value = [{"filename": "first.tar.bz2"}, {"filename": "second.tar.bz2"}]
+        mock_extract.return_value = {"nl-20180615-038.xml"}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            save_law_sources(tmpdir, {"nl-20180615-038.xml": "second.tar.bz2"})
+            fetch_lovdata_laws(["LOV-2018-06-15-038"], out_dir=tmpdir)
+
+        self.assertEqual(mock_download.call_count, 1)
+        self.assertEqual(mock_download.call_args[0][0], "second.tar.bz2")
+
+    @patch("common.utils.law_extractor.list_public_files")
+    @patch("common.utils.law_extractor.download_lovdata_file")
+    @patch("common.utils.law_extractor.extract_selected_files")
+    def test_fetch_lovdata_laws_extracts_each_archive_when_downloaded(
+        self, mock_extract, mock_download, mock_list
+    ):
+        """Test that concurrent downloads are extracted one by one as they finish"""
+        from common.utils.law_extractor import fetch_lovdata_laws
+
+        contents = {
+            "first.tar.bz2": {"nl-20180615-038.xml"},
+            "second.tar.bz2": {"sf-20110822-0894.xml"},
+        }
+        mock_list.return_value = [
+            {"filename": "first.tar.bz2", "size": 10},
+            {"filename": "second.tar.bz2", "size": 20},
+        ]
+        mock_download.side_effect = lambda filename, **kwargs: filename
+        mock_extract.side_effect = lambda path, remaining, extract_to: contents[path] & remaining
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            result = fetch_lovdata_laws(
+                ["LOV-2018-06-15-038", "FOR-2011-08-22-894"], out_dir=tmpdir, download_workers=2
+            )
+
+        self.assertEqual(
+            result,
+            {"nl-20180615-038.xml": "first.tar.bz2", "sf-20110822-0894.xml": "second.tar.bz2"},
+        )
+        self.assertEqual(mock_extract.call_count, 2)
+        sizes = {call[0][0]: call[1]["expected_size"] for call in mock_download.call_args_list}
+        self.assertEqual(sizes, {"first.tar.bz2": 10, "second.tar.bz2": 20})
 
     @patch("common.utils.law_extractor.list_public_files")
     @patch("common.utils.law_extractor.os.listdir")
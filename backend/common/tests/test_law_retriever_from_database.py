@@ -1,7 +1,30 @@
+import tempfile
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
-from common.utils.law_retriever_from_database import LawRetriever
+from django.core.cache import caches
+from django.test import override_settings
+
+import numpy as np
+import psycopg2
+
+from common.tests.test_db_client import clear_tables
+from common.utils.db_client import (
+    build_indexes,
+    create_table_if_not_exists,
+    write_law_with_paragraphs,
+)
+from common.utils.db_pool import (
+    close_connection_pool,
+    db_config_from_settings,
+    get_connection_pool,
+)
+from common.utils.law_retriever_from_database import (
+    LawRetriever,
+    close_law_retriever,
+    get_law_retriever,
+)
+from common.utils.paragraph_text import FIRST_SECTION_SQL
 
 
 def _create_mock_embedding():
@@ -11,27 +34,25 @@ def _create_mock_embedding():
     return mock_array
 
 
-class LawRetrieverInitTest(TestCase):
+class LawRetrieverTestCase(TestCase):
+    def setUp(self):
+        # Connections made with a mocked connect must not outlive the test in the shared pool
+        self.addCleanup(close_connection_pool)
+
+
+class LawRetrieverInitTest(LawRetrieverTestCase):
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
     @patch("common.utils.law_retriever_from_database.TextEmbedding")
     def test_init_with_default_config(self, mock_embedding, mock_connect):
-        """Test initialization with default database config"""
-        mock_conn = MagicMock()
-        mock_connect.return_value = mock_conn
+        """Test that the shared pool is used and no connection is opened up front"""
         mock_model = MagicMock()
         mock_embedding.return_value = mock_model
 
         retriever = LawRetriever()
 
-        mock_connect.assert_called_once_with(
-            dbname="CDP_Trondheim_Kommune",
-            user="CDP_Trondheim_Kommune",
-            password="password",
-            host="db",
-            port="5432",
-        )
+        mock_connect.assert_not_called()
         mock_embedding.assert_called_once_with(model_name="BAAI/bge-small-en-v1.5")
-        self.assertEqual(retriever.conn, mock_conn)
+        self.assertIs(retriever.pool, get_connection_pool())
         self.assertEqual(retriever.model, mock_model)
 
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
@@ -48,9 +69,9 @@ class LawRetrieverInitTest(TestCase):
         mock_conn = MagicMock()
         mock_connect.return_value = mock_conn
 
-        LawRetriever(db_config=custom_config)
+        LawRetriever(db_config=custom_config).health_check()
 
-        mock_connect.assert_called_once_with(**custom_config)
+        mock_connect.assert_called_once_with(**custom_config, options="-c statement_timeout=5000")
 
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
     @patch("common.utils.law_retriever_from_database.TextEmbedding")
@@ -61,7 +82,7 @@ class LawRetrieverInitTest(TestCase):
         mock_embedding.assert_called_once_with(model_name="custom-model")
 
 
-class LawRetrieverRetrieveTest(TestCase):
+class LawRetrieverRetrieveTest(LawRetrieverTestCase):
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
     @patch("common.utils.law_retriever_from_database.TextEmbedding")
     def test_retrieve_with_empty_prompt(self, mock_embedding, mock_connect):
@@ -150,127 +171,906 @@ class LawRetrieverRetrieveTest(TestCase):
         self.assertIn("paragraphs_text", result)
 
 
-class LawRetrieverCleanTextTest(TestCase):
+class LawRetrieverPrecomputedTextTest(LawRetrieverTestCase):
+    @patch("common.utils.law_retriever_from_database.paragraph_text_columns")
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
     @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_clean_text_removes_metadata(self, mock_embedding, mock_connect):
-        """Test that _clean_text removes metadata keywords"""
+    def test_precomputed_text_is_used_as_stored(
+        self, mock_embedding, mock_connect, mock_text_columns
+    ):
+        """Test that rows with text columns from ingestion are not cleaned again"""
         retriever = LawRetriever()
 
-        text = "XML generert some data Tittel Test Document § 1 This is the actual content"
-        cleaned = retriever._clean_text(text)
+        paragraphs = retriever.format_paragraphs(
+            [("p1", "§ 2", "§ 2 Stored text", {}, "law1", 0.1, 3, "https://lovdata.no/x/§2")]
+        )
 
-        self.assertNotIn("XML generert", cleaned)
-        self.assertNotIn("Tittel", cleaned)
-        self.assertIn("§ 1", cleaned)
+        mock_text_columns.assert_not_called()
+        self.assertEqual(paragraphs[0]["text"], "§ 2 Stored text")
+        self.assertEqual(paragraphs[0]["word_count"], 3)
+        self.assertEqual(paragraphs[0]["lovdata_url"], "https://lovdata.no/x/§2")
 
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
     @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_clean_text_normalizes_whitespace(self, mock_embedding, mock_connect):
-        """Test that _clean_text normalizes whitespace"""
+    def test_text_is_computed_for_rows_stored_before_ingestion_did(
+        self, mock_embedding, mock_connect
+    ):
+        """Test that rows without precomputed columns are cleaned at query time"""
         retriever = LawRetriever()
 
-        text = "Test   text   with    multiple    spaces"
-        cleaned = retriever._clean_text(text)
+        paragraphs = retriever.format_paragraphs(
+            [
+                ("p1", "§ 2", "Innledning § 2  Raw   text", {}, "nl-20000101-001", 0.1),
+                ("p2", "§ 3", "§ 3 Raw", {}, "nl-20000101-001", 0.2, None, None),
+            ]
+        )
 
-        self.assertNotIn("  ", cleaned)
-        self.assertEqual(cleaned, "Test text with multiple spaces")
+        self.assertEqual(paragraphs[0]["text"], "§ 2 Raw text")
+        self.assertEqual(paragraphs[0]["word_count"], 3)
+        self.assertEqual(
+            paragraphs[0]["lovdata_url"], "https://lovdata.no/dokument/LTI/lov/2000-01-01-1/§2"
+        )
+        self.assertEqual(paragraphs[1]["word_count"], 2)
 
     @patch("common.utils.law_retriever_from_database.psycopg2.connect")
     @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_clean_text_extracts_sections(self, mock_embedding, mock_connect):
-        """Test that _clean_text extracts section text"""
+    def test_first_section_without_stored_flag_is_dropped(self, mock_embedding, mock_connect):
+        """Test that § 1 stored before the columns existed is not returned"""
         retriever = LawRetriever()
 
-        text = "Preamble text § 1 First section § 2 Second section"
-        cleaned = retriever._clean_text(text)
+        paragraphs = retriever.format_paragraphs(
+            [
+                ("p1", "§ 1", "§ 1 Formål", {}, "nl-20000101-001", 0.1, None, None),
+                ("p2", "§ 10", "§ 10 Tekst", {}, "nl-20000101-001", 0.2, None, None),
+            ]
+        )
+
+        self.assertEqual([p["paragraph_id"] for p in paragraphs], ["p2"])
 
-        self.assertIn("§ 1", cleaned)
-        self.assertIn("First section", cleaned)
-        self.assertIn("§ 2", cleaned)
-        self.assertIn("Second section", cleaned)
 
-    @patch("common.utils.law_retriever_from_database.psycopg2.connect")
-    @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_clean_text_truncates_long_text(self, mock_embedding, mock_connect):
-        """Test that _clean_text truncates text longer than 600 words"""
+class LawRetrieverParagraphFilteringTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_cursor = MagicMock()
+        self.mock_cursor.fetchall.side_effect = lambda: (
+            [("law1", {"title": "Test Law"})]
+            if "FROM laws" in self.mock_cursor.execute.call_args[0][0]
+            else [("p2", "§ 2", "Second chapter", {}, "law1", 0.15)]
+        )
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        connect_patcher = patch(
+            "common.utils.law_retriever_from_database.psycopg2.connect", return_value=mock_conn
+        )
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+        mock_model = MagicMock()
+        mock_model.embed.side_effect = lambda texts: iter([_create_mock_embedding()])
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+    def _paragraph_search(self):
+        return next(
+            call[0]
+            for call in self.mock_cursor.execute.call_args_list
+            if isinstance(call[0][0], str) and "FROM paragraphs" in call[0][0]
+        )
+
+    def test_filters_by_distance_threshold(self):
+        """Test that the distance threshold is applied by the paragraph search"""
         retriever = LawRetriever()
 
-        text = " ".join(["word"] * 700)
-        cleaned = retriever._clean_text(text)
+        result = retriever.retrieve(
+            "test query", k_laws=1, k_paragraphs=10, distance_threshold=0.27
+        )
 
-        word_count = len(cleaned.split())
-        self.assertEqual(word_count, 600)
+        query, params = self._paragraph_search()
+        self.assertIn("cosine_distance <= %(distance_threshold)s", query)
+        self.assertEqual(params["distance_threshold"], 0.27)
+        self.assertEqual([p["paragraph_id"] for p in result["paragraphs"]], ["p2"])
 
-    @patch("common.utils.law_retriever_from_database.psycopg2.connect")
-    @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_clean_text_strips_whitespace(self, mock_embedding, mock_connect):
-        """Test that _clean_text strips leading/trailing whitespace"""
+    def test_filters_out_first_chapter(self):
+        """Test that § 1 (first chapter) is excluded before the paragraph limit"""
         retriever = LawRetriever()
 
-        text = "  Test content  "
-        cleaned = retriever._clean_text(text)
+        for options in ({}, {"skip_law_search": True}, {"law_id": "law1"}):
+            self.mock_cursor.execute.reset_mock()
+            retriever.retrieve("test query", k_laws=1, k_paragraphs=10, **options)
 
-        self.assertEqual(cleaned, "Test content")
+            query, _ = self._paragraph_search()
+            self.assertLess(
+                query.index(f"NOT {FIRST_SECTION_SQL}"), query.index("LIMIT %(k_paragraphs)s")
+            )
 
+    def test_law_filtered_search_ranks_the_law_paragraphs_exactly(self):
+        """Test that the paragraphs of a law are materialized before they are ranked"""
+        LawRetriever().retrieve("test query", law_id="law1", k_paragraphs=10)
 
-class LawRetrieverParagraphFilteringTest(TestCase):
-    @patch("common.utils.law_retriever_from_database.psycopg2.connect")
-    @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_filters_by_distance_threshold(self, mock_embedding, mock_connect):
-        """Test that paragraphs are filtered by cosine distance threshold"""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.side_effect = [
-            [("law1", {"title": "Test Law"})],
+        query, params = self._paragraph_search()
+        self.assertIn("candidates AS MATERIALIZED", query)
+        self.assertLess(query.index("law_id = ANY(%(law_ids)s)"), query.index("FROM candidates"))
+        self.assertEqual(params["law_ids"], ["law1"])
+
+    def test_word_budget_is_passed_to_the_query(self):
+        """Test that max_words reaches the search and is off by default"""
+        retriever = LawRetriever(result_cache="")
+
+        retriever.retrieve("test query", k_laws=1, k_paragraphs=20, max_words=400)
+        self.assertEqual(self._paragraph_search()[1]["max_words"], 400)
+
+        self.mock_cursor.execute.reset_mock()
+        retriever.retrieve("test query", k_laws=1, k_paragraphs=20)
+        self.assertIsNone(self._paragraph_search()[1]["max_words"])
+
+    def test_word_budget_of_the_numpy_backend(self):
+        """Test that snapshot results stop at the paragraph that fills the budget"""
+        retriever = LawRetriever(backend="numpy")
+        retriever.vector_index = MagicMock()
+        retriever.vector_index.search_paragraphs.return_value = [
+            (f"p{i}", f"§ {i + 2}", "Tekst", {}, "law1", 0.1 * i, 150, "url") for i in range(5)
+        ]
+
+        result = retriever.retrieve("test query", law_id="law1", k_paragraphs=5, max_words=400)
+
+        self.assertEqual([p["paragraph_id"] for p in result["paragraphs"]], ["p0", "p1", "p2"])
+
+
+class LawRetrieverLifecycleTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        connect_patcher = patch("common.utils.law_retriever_from_database.psycopg2.connect")
+        embedding_patcher = patch("common.utils.law_retriever_from_database.TextEmbedding")
+        self.mock_connect = connect_patcher.start()
+        self.mock_embedding = embedding_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+        self.addCleanup(embedding_patcher.stop)
+        self.addCleanup(close_law_retriever)
+
+    def test_get_law_retriever_is_shared(self):
+        """Test that the embedding model is only loaded once per process"""
+        retriever = get_law_retriever()
+
+        self.assertIs(get_law_retriever(), retriever)
+        self.mock_embedding.assert_called_once()
+
+    def test_close_law_retriever_resets_shared_retriever(self):
+        """Test that a new retriever is created after the shared one is closed"""
+        retriever = get_law_retriever()
+
+        close_law_retriever()
+
+        self.assertIsNot(get_law_retriever(), retriever)
+
+    def test_close_closes_own_pool(self):
+        """Test that a retriever with its own connection settings closes its connections"""
+        mock_conn = MagicMock(closed=0)
+        mock_conn.info.transaction_status = 0
+        self.mock_connect.return_value = mock_conn
+        retriever = LawRetriever(db_config={"dbname": "test_db"})
+        retriever.health_check()
+
+        retriever.close()
+
+        mock_conn.close.assert_called_once()
+
+    def test_reconnects_when_connection_is_lost(self):
+        """Test that a query on a broken connection is retried on a new connection"""
+        broken_conn = MagicMock(closed=0)
+        broken_conn.cursor.side_effect = psycopg2.InterfaceError("connection already closed")
+        new_conn = MagicMock(closed=0)
+        new_conn.cursor.return_value.__enter__.return_value.fetchall.return_value = [(1,)]
+        self.mock_connect.side_effect = [broken_conn, new_conn]
+
+        retriever = LawRetriever()
+
+        self.assertTrue(retriever.health_check())
+        broken_conn.close.assert_called_once()
+        self.assertEqual(retriever.pool.stats()["discarded"], 1)
+
+    def test_health_check_fails_when_database_is_down(self):
+        """Test that the health check reports an unreachable database"""
+        broken_conn = MagicMock()
+        broken_conn.cursor.side_effect = psycopg2.OperationalError("server closed the connection")
+        self.mock_connect.side_effect = [broken_conn, psycopg2.OperationalError("refused")]
+
+        retriever = LawRetriever()
+
+        self.assertFalse(retriever.health_check())
+
+    def test_warm_up_loads_model_and_checks_database(self):
+        """Test that warm-up runs the embedding model once and pings the database"""
+        mock_conn = MagicMock(closed=0)
+        mock_conn.cursor.return_value.__enter__.return_value.fetchall.return_value = [(1,)]
+        self.mock_connect.return_value = mock_conn
+        mock_model = MagicMock()
+        mock_model.embed.return_value = iter([_create_mock_embedding()])
+        self.mock_embedding.return_value = mock_model
+
+        self.assertTrue(LawRetriever().warm_up())
+        mock_model.embed.assert_called_once()
+        self.mock_connect.assert_called_once()
+
+
+class LawRetrieverQueryEmbeddingTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        connect_patcher = patch("common.utils.law_retriever_from_database.psycopg2.connect")
+        embedding_patcher = patch("common.utils.law_retriever_from_database.TextEmbedding")
+        mock_connect = connect_patcher.start()
+        mock_embedding = embedding_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+        self.addCleanup(embedding_patcher.stop)
+
+        self.mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+        mock_cursor = self.mock_cursor
+        mock_cursor.fetchall.side_effect = lambda: (
+            [("law1", {"title": "Test Law"})]
+            if "FROM laws" in mock_cursor.execute.call_args[0][0]
+            else [("p1", "§ 2", "Paragraph text", {}, "law1", 0.1)]
+        )
+        self.mock_model = mock_embedding.return_value
+        self.mock_model.embed.side_effect = lambda texts: iter(
+            [_create_mock_embedding() for _ in texts]
+        )
+
+    def test_prompt_is_embedded_once_per_retrieve(self):
+        """Test that the law and paragraph searches share one query embedding"""
+        LawRetriever().retrieve("test query", k_laws=1, k_paragraphs=10)
+
+        self.mock_model.embed.assert_called_once_with(["test query"])
+
+    def test_skip_law_search_searches_all_paragraphs(self):
+        """Test that paragraphs can be searched without looking up laws first"""
+        result = LawRetriever().retrieve("test query", k_paragraphs=10, skip_law_search=True)
+
+        self.assertEqual(result["laws"], [])
+        self.assertEqual(result["paragraphs"][0]["paragraph_id"], "p1")
+
+    def test_repeated_prompt_skips_the_model(self):
+        """Test that prompts differing only in whitespace reuse the cached vector"""
+        retriever = LawRetriever()
+
+        retriever.retrieve("Hva er  personvern?", k_paragraphs=10)
+        retriever.retrieve(" Hva er personvern? ", k_paragraphs=10)
+
+        self.mock_model.embed.assert_called_once_with(["Hva er personvern?"])
+        stats = retriever.query_cache_stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_query_cache_evicts_least_recently_used_prompt(self):
+        """Test that the query cache stays within its size"""
+        retriever = LawRetriever(query_cache_size=2)
+
+        retriever.embed_query("first")
+        retriever.embed_query("second")
+        retriever.embed_query("first")
+        retriever.embed_query("third")
+        retriever.embed_query("first")
+
+        self.assertEqual(self.mock_model.embed.call_count, 3)
+        self.assertEqual(list(retriever._query_vectors), ["third", "first"])
+
+    def test_vector_search_sets_index_search_parameters(self):
+        """Test that ef_search/probes are set for the search's own transaction"""
+        retriever = LawRetriever(ef_search=80, probes=4)
+
+        retriever.retrieve("test query", k_paragraphs=10, skip_law_search=True)
+
+        statements = [call[0][0] for call in self.mock_cursor.execute.call_args_list]
+        self.assertEqual(statements[0], "BEGIN;")
+        self.assertIn("Literal(80)", repr(statements[1]))
+        self.assertIn("Literal(4)", repr(statements[1]))
+        self.assertIn("FROM paragraphs", statements[2])
+        self.assertEqual(statements[3], "COMMIT;")
+
+
+class LawRetrieverSingleQueryTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_cursor = MagicMock()
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        connect_patcher = patch(
+            "common.utils.law_retriever_from_database.psycopg2.connect", return_value=mock_conn
+        )
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+        mock_model = MagicMock()
+        mock_model.embed.side_effect = lambda texts: iter([_create_mock_embedding()])
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+    def _search_statements(self):
+        return [
+            call[0][0]
+            for call in self.mock_cursor.execute.call_args_list
+            if isinstance(call[0][0], str) and "FROM" in call[0][0]
+        ]
+
+    def test_laws_and_paragraphs_in_one_statement(self):
+        """Test that the single-statement path returns the same shape as two queries"""
+        self.mock_cursor.fetchall.return_value = [
+            ("law1", {"title": "Lov 1"}, "p2", "§ 3", "Andre", {}, 0.2),
+            ("law1", {"title": "Lov 1"}, "p1", "§ 2", "Første", {}, 0.1),
+            ("law2", {"title": "Lov 2"}, "p3", "§ 4", "Tredje", {}, 0.15),
+        ]
+        retriever = LawRetriever(single_query=True)
+
+        result = retriever.retrieve("test query", k_paragraphs=10)
+
+        self.assertEqual(len(self._search_statements()), 1)
+        self.assertEqual(
+            result["laws"],
             [
-                ("p1", "§2", "Close match", {}, "law1", 0.1),
-                ("p2", "§3", "Far match", {}, "law1", 0.5),
+                {"law_id": "law1", "metadata": {"title": "Lov 1"}},
+                {"law_id": "law2", "metadata": {"title": "Lov 2"}},
             ],
+        )
+        self.assertEqual([p["paragraph_id"] for p in result["paragraphs"]], ["p1", "p3", "p2"])
+        self.assertEqual(result["paragraphs"][0]["law_id"], "law1")
+        self.assertEqual(result["paragraphs_text"], "§ 2: Første\n\n§ 4: Tredje\n\n§ 3: Andre")
+
+    def test_law_without_paragraphs_is_kept(self):
+        """Test that a top law without matching paragraphs is still listed"""
+        self.mock_cursor.fetchall.return_value = [
+            ("law1", {"title": "Lov 1"}, "p1", "§ 2", "Tekst", {}, 0.1),
+            ("law2", {"title": "Lov 2"}, None, None, None, None, None),
         ]
+        retriever = LawRetriever(single_query=True)
+
+        result = retriever.retrieve("test query", k_paragraphs=10)
+
+        self.assertEqual([law["law_id"] for law in result["laws"]], ["law1", "law2"])
+        self.assertEqual([p["paragraph_id"] for p in result["paragraphs"]], ["p1"])
+
+    def test_no_laws_found(self):
+        """Test that no matching laws gives empty results"""
+        self.mock_cursor.fetchall.return_value = []
+        retriever = LawRetriever(single_query=True)
+
+        result = retriever.retrieve("test query")
+
+        self.assertEqual(result, {"laws": [], "paragraphs": []})
+
+    def test_per_law_limit_is_passed_to_the_query(self):
+        """Test that the per-law cap and limits are sent as query parameters"""
+        self.mock_cursor.fetchall.return_value = []
+        retriever = LawRetriever(single_query=True)
+
+        retriever.retrieve("test query", k_laws=2, k_paragraphs=8, per_law_limit=3)
+
+        search = next(
+            call
+            for call in self.mock_cursor.execute.call_args_list
+            if isinstance(call[0][0], str) and "FROM laws" in call[0][0]
+        )
+        params = search[0][1]
+        self.assertEqual(params["k_laws"], 2)
+        self.assertEqual(params["k_paragraphs"], 8)
+        self.assertEqual(params["per_law_limit"], 3)
+
+    def test_law_id_uses_paragraph_search(self):
+        """Test that a given law_id skips law routing even with single_query"""
+        self.mock_cursor.fetchall.return_value = [("p1", "§ 2", "Tekst", {}, "law1", 0.1)]
+        retriever = LawRetriever(single_query=True)
+
+        result = retriever.retrieve("test query", law_id="law1", k_paragraphs=5)
+
+        statements = self._search_statements()
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn("FROM laws", statements[0])
+        self.assertEqual(result["paragraphs"][0]["paragraph_id"], "p1")
+
+
+class LawRetrieverNumpyBackendTest(LawRetrieverTestCase):
+    @patch("common.utils.law_retriever_from_database.psycopg2.connect")
+    @patch("common.utils.law_retriever_from_database.TextEmbedding")
+    def test_numpy_backend_searches_the_snapshot(self, mock_embedding, mock_connect):
+        """Test that the numpy backend serves both searches from the memory-mapped snapshot"""
+        mock_model = MagicMock()
+        mock_model.embed.return_value = iter([_create_mock_embedding()])
+        mock_embedding.return_value = mock_model
+
+        retriever = LawRetriever(backend="numpy")
+        retriever.vector_index = MagicMock()
+        retriever.vector_index.search_laws.return_value = [("law1", {"title": "Lov 1"})]
+        retriever.vector_index.search_paragraphs.return_value = [
+            ("p1", "§ 2", "Tekst", {}, "law1", 0.1)
+        ]
+
+        result = retriever.retrieve("test query", k_paragraphs=5)
+
+        mock_connect.assert_not_called()
+        retriever.vector_index.search_paragraphs.assert_called_once_with(
+            [0.1] * 384, ["law1"], 5, 0.27
+        )
+        self.assertEqual(result["laws"], [{"law_id": "law1", "metadata": {"title": "Lov 1"}}])
+        self.assertEqual(result["paragraphs"][0]["paragraph_id"], "p1")
+
+    @patch("common.utils.law_retriever_from_database.TextEmbedding")
+    def test_unknown_backend(self, mock_embedding):
+        """Test that an unknown backend is rejected"""
+        with self.assertRaises(ValueError):
+            LawRetriever(backend="faiss")
+
+
+class LawRetrieverHybridTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_cursor = MagicMock()
         mock_conn = MagicMock()
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-        mock_connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        connect_patcher = patch(
+            "common.utils.law_retriever_from_database.psycopg2.connect", return_value=mock_conn
+        )
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
 
         mock_model = MagicMock()
-        mock_model.embed.side_effect = [
-            iter([_create_mock_embedding()]),
-            iter([_create_mock_embedding()]),
+        mock_model.embed.side_effect = lambda texts: iter([_create_mock_embedding()])
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+    def _hybrid_call(self):
+        return next(
+            call
+            for call in self.mock_cursor.execute.call_args_list
+            if "tsquery" in repr(call[0][0])
+        )
+
+    def test_lexical_matches_are_kept_beyond_the_threshold(self):
+        """Test that full-text matches survive the distance threshold, vector-only ones not"""
+        self.mock_cursor.fetchall.return_value = [
+            ("p1", "§ 2", "Personopplysninger", {}, "law1", 0.6),
+            ("p2", "§ 3", "Nær i vektorrommet", {}, "law1", 0.2),
         ]
-        mock_embedding.return_value = mock_model
+        retriever = LawRetriever(hybrid=True)
 
-        retriever = LawRetriever()
         result = retriever.retrieve(
-            "test query", k_laws=1, k_paragraphs=10, distance_threshold=0.27
+            "personopplysninger", law_id="law1", k_paragraphs=5, distance_threshold=0.27
         )
 
-        self.assertEqual(len(result["paragraphs"]), 1)
-        self.assertEqual(result["paragraphs"][0]["cosine_distance"], 0.1)
+        query, params = self._hybrid_call()[0]
+        self.assertIn("lexical_match OR cosine_distance <= %(distance_threshold)s", query)
+        self.assertEqual(params["distance_threshold"], 0.27)
+        self.assertEqual([p["paragraph_id"] for p in result["paragraphs"]], ["p1", "p2"])
 
-    @patch("common.utils.law_retriever_from_database.psycopg2.connect")
-    @patch("common.utils.law_retriever_from_database.TextEmbedding")
-    def test_filters_out_first_chapter(self, mock_embedding, mock_connect):
-        """Test that § 1 (first chapter) is filtered out"""
-        mock_cursor = MagicMock()
-        mock_cursor.fetchall.side_effect = [
-            [("law1", {"title": "Test Law"})],
-            [
-                ("p1", "§ 1", "First chapter", {}, "law1", 0.1),
-                ("p2", "§ 2", "Second chapter", {}, "law1", 0.15),
-            ],
+    def test_hybrid_query_parameters(self):
+        """Test that the prompt, law filter and limits are passed to the fused query"""
+        self.mock_cursor.fetchall.return_value = []
+        retriever = LawRetriever(hybrid=True)
+
+        retriever.retrieve("  behandlingsansvarlig  ", law_id="law1", k_paragraphs=6)
+
+        query, params = self._hybrid_call()[0]
+        self.assertIn("ANY(%(law_ids)s)", repr(query))
+        self.assertEqual(params["prompt"], "behandlingsansvarlig")
+        self.assertEqual(params["law_ids"], ["law1"])
+        self.assertEqual(params["k_paragraphs"], 6)
+
+    def test_hybrid_without_law_filter(self):
+        """Test that skip_law_search fuses the rankings over all paragraphs"""
+        self.mock_cursor.fetchall.return_value = []
+        retriever = LawRetriever(hybrid=True)
+
+        retriever.retrieve("behandlingsansvarlig", k_paragraphs=6, skip_law_search=True)
+
+        self.assertIsNone(self._hybrid_call()[0][1]["law_ids"])
+
+
+class LawRetrieverQuantizedIndexTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_cursor = MagicMock()
+        self.mock_cursor.fetchall.return_value = [
+            ("p1", "§ 2", "Paragraph text", {}, "law1", 0.1, 3, "https://lovdata.no/p1")
         ]
         mock_conn = MagicMock()
-        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
-        mock_connect.return_value = mock_conn
+        mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        connect_patcher = patch(
+            "common.utils.law_retriever_from_database.psycopg2.connect", return_value=mock_conn
+        )
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
 
         mock_model = MagicMock()
-        mock_model.embed.side_effect = [
-            iter([_create_mock_embedding()]),
-            iter([_create_mock_embedding()]),
+        mock_model.embed.side_effect = lambda texts: iter([_create_mock_embedding()])
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+    def _statements(self):
+        return [call[0] for call in self.mock_cursor.execute.call_args_list]
+
+    def test_binary_candidates_are_reranked_by_exact_distance(self):
+        """Test that candidates come from the Hamming index and are ordered by cosine"""
+        retriever = LawRetriever(quantization="binary", rerank_factor=10)
+
+        result = retriever.retrieve("test query", k_paragraphs=5, skip_law_search=True)
+
+        statements = self._statements()
+        query, params = statements[2]
+        self.assertIn(
+            "binary_quantize(embedding)::bit(384) <~> "
+            "binary_quantize(%(query_vec)s::vector(384))::bit(384)",
+            query,
+        )
+        self.assertIn("LIMIT %(rerank_candidates)s", query)
+        self.assertIn("embedding <=> %(query_vec)s::vector(384) AS cosine_distance", query)
+        self.assertEqual(params["rerank_candidates"], 50)
+        self.assertEqual(params["k_paragraphs"], 5)
+        # The index scan has to return every candidate, not just k_paragraphs
+        self.assertIn("Literal(50)", repr(statements[1][0]))
+        self.assertEqual(result["paragraphs"][0]["paragraph_id"], "p1")
+
+    def test_halfvec_candidates(self):
+        """Test that the halfvec index is searched by cosine distance on halfvec"""
+        retriever = LawRetriever(quantization="halfvec", rerank_factor=4)
+
+        retriever.retrieve("test query", k_paragraphs=5, skip_law_search=True)
+
+        query, params = self._statements()[2]
+        self.assertIn("(embedding)::halfvec(384) <=> (%(query_vec)s::vector(384))::halfvec", query)
+        self.assertEqual(params["rerank_candidates"], 20)
+
+    def test_hybrid_semantic_ranking_uses_the_quantized_index(self):
+        """Test that the vector candidates of the hybrid search are reranked as well"""
+        retriever = LawRetriever(quantization="binary", rerank_factor=10, hybrid=True)
+
+        retriever.retrieve("test query", law_id="law1", k_paragraphs=5)
+
+        query, params = next(s for s in self._statements() if "tsquery" in repr(s[0]))
+        self.assertIn("binary_quantize(embedding)::bit(384) <~>", query)
+        self.assertEqual(params["rerank_candidates"], 500)
+        self.assertEqual(params["law_ids"], ["law1"])
+
+    def test_full_precision_index_is_searched_directly(self):
+        """Test that without quantization the search reads the table as before"""
+        LawRetriever(quantization="none").retrieve(
+            "test query", k_paragraphs=5, skip_law_search=True
+        )
+
+        query, params = self._statements()[2]
+        self.assertNotIn("rerank_candidates", query)
+        self.assertNotIn("binary_quantize", query)
+        self.assertIsNone(params["rerank_candidates"])
+
+    def test_unknown_quantization(self):
+        """Test that a typo in VECTOR_INDEX_QUANTIZATION fails when the retriever is created"""
+        with self.assertRaises(ValueError):
+            LawRetriever(quantization="bit")
+
+
+class LawRetrieverResultCacheTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        caches["law_retrieval"].clear()
+        self.addCleanup(caches["law_retrieval"].clear)
+
+        self.mock_cursor = MagicMock()
+        self.mock_cursor.fetchall.return_value = [("p1", "§ 2", "Tekst", {}, "law1", 0.1)]
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        connect_patcher = patch(
+            "common.utils.law_retriever_from_database.psycopg2.connect", return_value=mock_conn
+        )
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+        version_patcher = patch(
+            "common.utils.law_retriever_from_database.get_active_index_version", return_value=1
+        )
+        self.mock_get_active_index_version = version_patcher.start()
+        self.addCleanup(version_patcher.stop)
+
+        self.mock_model = MagicMock()
+        self.mock_model.embed.side_effect = lambda texts: iter([_create_mock_embedding()])
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=self.mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+        self.retriever = LawRetriever(result_cache="law_retrieval")
+        # Separate retrievers have separate query vector caches, as in separate workers
+        self.other_worker = LawRetriever(result_cache="law_retrieval")
+
+    def test_repeated_prompt_is_served_from_the_cache(self):
+        """Test that a normalized repeat of a prompt skips embedding and the database"""
+        first = self.retriever.retrieve("Hva er  personvern?", law_id="law1", k_paragraphs=5)
+        self.mock_cursor.execute.reset_mock()
+
+        second = self.other_worker.retrieve("Hva er personvern? ", law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(second, first)
+        self.assertEqual(self.mock_model.embed.call_count, 1)
+        self.mock_cursor.execute.assert_not_called()
+        stats = self.other_worker.result_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 0, 1.0))
+        self.assertGreater(stats["seconds_saved"], 0)
+
+    def test_arguments_are_part_of_the_key(self):
+        """Test that other retrieval arguments are not answered from the cache"""
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=10)
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=10)
+
+        stats = self.retriever.result_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+
+    @override_settings(LAW_INDEX_VERSION_CHECK_INTERVAL=0)
+    def test_new_index_version_invalidates_results(self):
+        """Test that results cached for an old index version are not reused"""
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.mock_get_active_index_version.return_value = 2
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(self.retriever.result_cache_stats()["misses"], 2)
+
+    def test_index_version_is_not_looked_up_on_every_call(self):
+        """Test that the active version is only checked once per interval"""
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+        self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.mock_get_active_index_version.assert_called_once()
+
+    def test_unavailable_cache_falls_back_to_retrieval(self):
+        """Test that a cache outage does not fail the retrieval"""
+        with patch.object(caches["law_retrieval"], "get", side_effect=ConnectionError):
+            result = self.retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(result["paragraphs"][0]["paragraph_id"], "p1")
+
+    def test_cache_is_disabled_without_alias(self):
+        """Test that an empty LAW_RETRIEVER_RESULT_CACHE turns the cache off"""
+        retriever = LawRetriever(result_cache="")
+        retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+        retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(self.mock_model.embed.call_count, 1)
+        self.assertEqual(retriever.result_cache_stats()["hits"], 0)
+        self.mock_get_active_index_version.assert_not_called()
+
+
+class LawRetrieverRetrieveManyTest(LawRetrieverTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mock_cursor = MagicMock()
+        mock_conn = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = self.mock_cursor
+        connect_patcher = patch(
+            "common.utils.law_retriever_from_database.psycopg2.connect", return_value=mock_conn
+        )
+        connect_patcher.start()
+        self.addCleanup(connect_patcher.stop)
+
+        self.mock_model = MagicMock()
+        self.mock_model.embed.side_effect = lambda texts: iter(
+            [_create_mock_embedding() for _ in texts]
+        )
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=self.mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+    def _search_statements(self):
+        return [
+            call[0][0]
+            for call in self.mock_cursor.execute.call_args_list
+            if isinstance(call[0][0], str) and "FROM" in call[0][0]
         ]
-        mock_embedding.return_value = mock_model
 
-        retriever = LawRetriever()
-        result = retriever.retrieve("test query", k_laws=1, k_paragraphs=10)
+    def test_batch_is_embedded_and_searched_once(self):
+        """Test that all prompts share one embedding call and one query per search"""
+        self.mock_cursor.fetchall.side_effect = [
+            [(1, "law1", {"title": "Lov 1"}), (2, "law2", {"title": "Lov 2"})],
+            [
+                (1, "p1", "§ 2", "Første", {}, "law1", 0.1),
+                (2, "p3", "§ 4", "Tredje", {}, "law2", 0.2),
+            ],
+        ]
+        retriever = LawRetriever(result_cache="")
+
+        results = retriever.retrieve_many(["personvern", "alkohol"], k_laws=1, k_paragraphs=5)
+
+        self.mock_model.embed.assert_called_once_with(["personvern", "alkohol"])
+        statements = self._search_statements()
+        self.assertEqual(len(statements), 2)
+        self.assertIn("LATERAL", statements[0])
+        self.assertIn("LATERAL", statements[1])
+        self.assertEqual(results[0]["laws"], [{"law_id": "law1", "metadata": {"title": "Lov 1"}}])
+        self.assertEqual(results[0]["paragraphs_text"], "§ 2: Første")
+        self.assertEqual(results[1]["paragraphs"][0]["paragraph_id"], "p3")
+        self.assertEqual(results[1]["paragraphs"][0]["law_id"], "law2")
+
+    def test_results_match_retrieve(self):
+        """Test that a batch gives the same result per prompt as retrieve()"""
+        paragraphs = [
+            ("p1", "§ 2", "Første", {}, "law1", 0.1),
+            ("p2", "§ 3", "Andre", {}, "law1", 0.3),
+        ]
+        self.mock_cursor.fetchall.return_value = paragraphs
+        retriever = LawRetriever(result_cache="")
+        expected = retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.mock_cursor.fetchall.return_value = [(1, *row) for row in paragraphs]
+        results = retriever.retrieve_many(["personvern"], law_id="law1", k_paragraphs=5)
+
+        self.assertEqual(results, [expected])
+
+    def test_empty_and_repeated_prompts(self):
+        """Test that empty prompts give {} and repeats are retrieved once, into separate copies"""
+        self.mock_cursor.fetchall.return_value = [(1, "p1", "§ 2", "Tekst", {}, "law1", 0.1)]
+        retriever = LawRetriever(result_cache="")
+
+        results = retriever.retrieve_many(
+            ["personvern", " ", "personvern "], law_id="law1", k_paragraphs=5
+        )
+
+        self.mock_model.embed.assert_called_once_with(["personvern"])
+        self.assertEqual(results[1], {})
+        self.assertEqual(results[0], results[2])
+        self.assertEqual(results[0]["paragraphs"][0]["paragraph_id"], "p1")
+        results[0]["paragraphs"].clear()
+        self.assertEqual(results[2]["paragraphs"][0]["paragraph_id"], "p1")
+
+    def test_prompt_without_laws_is_not_searched_for_paragraphs(self):
+        """Test that a prompt whose law search finds nothing gets an empty result"""
+        self.mock_cursor.fetchall.side_effect = [
+            [(2, "law1", {})],
+            [(1, "p1", "§ 2", "Tekst", {}, "law1", 0.1)],
+        ]
+        retriever = LawRetriever(result_cache="")
+
+        results = retriever.retrieve_many(["ukjent", "personvern"], k_paragraphs=5)
+
+        self.assertEqual(results[0], {"laws": [], "paragraphs": []})
+        self.assertEqual(results[1]["paragraphs"][0]["paragraph_id"], "p1")
+        # Only the prompt with laws is sent to the paragraph search
+        self.assertEqual(len(self.mock_cursor.execute.call_args_list[-2][0][1]["query_vecs"]), 1)
+
+    def test_hybrid_search_is_run_per_prompt_on_the_batch_embedding(self):
+        """Test that searches without a batched statement still share one embedding call"""
+        retriever = LawRetriever(hybrid=True, result_cache="")
+
+        with patch.object(retriever, "_retrieve", return_value={"laws": []}) as mock_retrieve:
+            results = retriever.retrieve_many(["personvern", "alkohol"], law_id="law1")
+
+        self.mock_model.embed.assert_called_once()
+        self.assertEqual(mock_retrieve.call_count, 2)
+        self.assertEqual(mock_retrieve.call_args.kwargs["query_vec"], [0.1] * 384)
+        self.assertEqual(results, [{"laws": []}, {"laws": []}])
+
+    def test_results_are_shared_with_the_result_cache(self):
+        """Test that retrieve_many reads results cached by retrieve and stores its own"""
+        caches["law_retrieval"].clear()
+        self.addCleanup(caches["law_retrieval"].clear)
+        version_patcher = patch(
+            "common.utils.law_retriever_from_database.get_active_index_version", return_value=1
+        )
+        version_patcher.start()
+        self.addCleanup(version_patcher.stop)
+        self.mock_cursor.fetchall.return_value = [("p1", "§ 2", "Tekst", {}, "law1", 0.1)]
+        retriever = LawRetriever(result_cache="law_retrieval")
+        cached = retriever.retrieve("personvern", law_id="law1", k_paragraphs=5)
+
+        self.mock_cursor.fetchall.return_value = [(1, "p2", "§ 3", "Annen", {}, "law1", 0.2)]
+        results = retriever.retrieve_many(
+            ["personvern", "alkohol", "personvern"], law_id="law1", k_paragraphs=5
+        )
+
+        self.assertEqual(results[0], cached)
+        self.assertEqual(results[2], cached)
+        self.assertIsNot(results[2]["paragraphs"], results[0]["paragraphs"])
+        self.assertEqual(retriever.retrieve("alkohol", law_id="law1", k_paragraphs=5), results[1])
+        stats = retriever.result_cache_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 2))
+
+
+class LawRetrieverBatchConsistencyTest(LawRetrieverTestCase):
+    """Test retrieve_many against retrieve on a real database."""
+
+    def setUp(self):
+        super().setUp()
+        self.conn = psycopg2.connect(**db_config_from_settings())
+        self.addCleanup(self.conn.close)
+        create_table_if_not_exists(self.conn)
+        clear_tables(self.conn)
+        self.addCleanup(clear_tables, self.conn)
+
+        rng = np.random.default_rng(7)
+        for law in range(4):
+            law_id = f"nl-2000010{law}-001"
+            paragraphs = [
+                {
+                    "paragraph_id": f"{law_id}_p{i}_1",
+                    "paragraph_number": f"§ {i + 2}",
+                    "text": f"Paragraf {i} i lov {law}",
+                    "metadata": {},
+                    "embedding": rng.normal(size=384).tolist(),
+                }
+                for i in range(30)
+            ]
+            write_law_with_paragraphs(
+                self.conn, law_id, "Lovtekst", {}, rng.normal(size=384).tolist(), paragraphs
+            )
+        build_indexes(self.conn)
+
+        self.prompt_vectors = {prompt: rng.normal(size=384) for prompt in ("personvern", "plan")}
+        mock_model = MagicMock()
+        mock_model.embed.side_effect = lambda texts: iter(
+            [self.prompt_vectors[text] for text in texts]
+        )
+        embedding_patcher = patch(
+            "common.utils.law_retriever_from_database.TextEmbedding", return_value=mock_model
+        )
+        embedding_patcher.start()
+        self.addCleanup(embedding_patcher.stop)
+
+    def test_retrieve_many_matches_retrieve_for_law_filtered_prompts(self):
+        """Test that a batch of one gives the same result as a single search"""
+        retriever = LawRetriever(result_cache="", quantization="none")
+
+        for options in ({"law_id": "nl-20000101-001"}, {"k_laws": 2}):
+            for prompt in self.prompt_vectors:
+                expected = retriever.retrieve(
+                    prompt, k_paragraphs=10, distance_threshold=2.0, **options
+                )
+
+                self.assertEqual(
+                    retriever.retrieve_many(
+                        [prompt], k_paragraphs=10, distance_threshold=2.0, **options
+                    ),
+                    [expected],
+                )
+                self.assertEqual(len(expected["paragraphs"]), 10)
+
+    def test_first_section_without_stored_flag_is_not_retrieved(self):
+        """Test that a § 1 stored before is_first_section was filled in is excluded"""
+        law_id = "nl-20000101-001"
+        with self.conn.cursor() as cur:
+            # The closest paragraph to the prompt, with none of the precomputed columns
+            cur.execute(
+                """
+                INSERT INTO paragraphs (paragraph_id, law_id, paragraph_number, text, metadata,
+                                        embedding)
+                VALUES (%s, %s, '§ 1', '§ 1 Lovens formål', '{}', %s::vector);
+            """,
+                (f"{law_id}_first", law_id, str(self.prompt_vectors["personvern"].tolist())),
+            )
+        self.conn.commit()
+
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        with override_settings(LAW_VECTOR_SNAPSHOT_DIR=snapshot_dir.name):
+            numpy_retriever = LawRetriever(result_cache="", backend="numpy")
+        retrievers = [
+            LawRetriever(result_cache="", quantization="none"),
+            LawRetriever(result_cache="", quantization="none", single_query=True),
+            LawRetriever(result_cache="", quantization="none", hybrid=True),
+            numpy_retriever,
+        ]
+        for retriever in retrievers:
+            for options in ({"law_id": law_id}, {"k_laws": 4}, {"skip_law_search": True}):
+                result = retriever.retrieve(
+                    "personvern", k_paragraphs=10, distance_threshold=2.0, **options
+                )
 
-        self.assertEqual(len(result["paragraphs"]), 1)
-        self.assertEqual(result["paragraphs"][0]["paragraph_number"], "§ 2")
+                paragraph_ids = [p["paragraph_id"] for p in result["paragraphs"]]
+                self.assertEqual(len(paragraph_ids), 10)
+                self.assertNotIn(f"{law_id}_first", paragraph_ids)
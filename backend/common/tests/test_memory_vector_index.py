@@ -0,0 +1,195 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+from common.utils.memory_vector_index import (
+    MemoryVectorIndex,
+    VectorSnapshot,
+    export_snapshot,
+    prune_snapshots,
+    top_k,
+)
+
+
+def _vector(*values):
+    return [*values, 0.0][:3]
+
+
+LAWS = [("law1", {"title": "Lov 1"}, _vector(1, 0)), ("law2", {"title": "Lov 2"}, _vector(0, 1))]
+PARAGRAPHS = [
+    ("p1", "§ 2", "Første", {}, "law1", 1, "url1#2", _vector(1, 0)),
+    ("p2", "§ 3", "Andre", {}, "law1", 1, "url1#3", _vector(1, 1)),
+    ("p3", "§ 2", "Tredje", {}, "law2", 1, "url2#2", _vector(0, 1)),
+    ("p4", "§ 3", "Fjerde", {}, "law2", 1, "url2#3", _vector(0.1, 1)),
+]
+
+
+def _mock_connection(version, laws=LAWS, paragraphs=PARAGRAPHS, retained=None):
+    """Connection whose cursor answers the version lookups and the table exports."""
+    cursor = MagicMock()
+
+    def fetchall():
+        query = cursor.execute.call_args[0][0]
+        if "index_versions" in query:
+            return [(retained_version,) for retained_version in retained or [version]]
+        source = laws if "FROM laws" in query else paragraphs
+        return [(*row[:-1], json.dumps(row[-1])) for row in source]
+
+    cursor.fetchall.side_effect = fetchall
+    cursor.fetchone.side_effect = lambda: (
+        (True,) if "to_regclass" in cursor.execute.call_args[0][0] else (version,)
+    )
+    conn = MagicMock()
+    conn.cursor.return_value.__enter__.return_value = cursor
+    return conn
+
+
+class TopKTest(TestCase):
+    def test_top_k_returns_smallest_in_order(self):
+        """Test that argpartition candidates come back sorted by distance"""
+        distances = np.array([0.5, 0.1, 0.9, 0.3, 0.2])
+
+        self.assertEqual(top_k(distances, 3).tolist(), [1, 4, 3])
+
+    def test_top_k_without_limit_sorts_everything(self):
+        """Test that k=None returns every position, like LIMIT NULL"""
+        distances = np.array([0.5, 0.1, 0.9])
+
+        self.assertEqual(top_k(distances, None).tolist(), [1, 0, 2])
+        self.assertEqual(top_k(distances, 10).tolist(), [1, 0, 2])
+        self.assertEqual(top_k(distances, 0).tolist(), [])
+
+
+class VectorSnapshotTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        version = export_snapshot(_mock_connection(7), self.tmpdir.name, dim=3)
+        self.snapshot = VectorSnapshot(os.path.join(self.tmpdir.name, f"v{version}"), version)
+
+    def test_export_writes_version_directory(self):
+        """Test that the snapshot is named after the active index version"""
+        self.assertEqual(os.listdir(self.tmpdir.name), ["v7"])
+        self.assertEqual(self.snapshot.paragraph_vectors.shape, (4, 3))
+        self.assertIsInstance(self.snapshot.paragraph_vectors, np.memmap)
+        np.testing.assert_allclose(
+            np.linalg.norm(self.snapshot.paragraph_vectors, axis=1), 1.0, rtol=1e-6
+        )
+
+    def test_search_laws(self):
+        """Test that laws come back as (law_id, metadata) by distance"""
+        self.assertEqual(
+            self.snapshot.search_laws(_vector(0.1, 1), 1), [("law2", {"title": "Lov 2"})]
+        )
+
+    def test_search_paragraphs_of_given_laws(self):
+        """Test that a law filter only searches the paragraphs of those laws"""
+        results = self.snapshot.search_paragraphs(_vector(0, 1), ["law1"], 5)
+
+        self.assertEqual([row[0] for row in results], ["p2", "p1"])
+        self.assertEqual(results[0][:5], ("p2", "§ 3", "Andre", {}, "law1"))
+        self.assertAlmostEqual(results[0][5], 1 - 1 / np.sqrt(2), places=6)
+        self.assertAlmostEqual(results[1][5], 1.0, places=6)
+        self.assertEqual(results[0][6:], (1, "url1#3"))
+
+    def test_search_paragraphs_of_all_laws(self):
+        """Test that without a law filter every paragraph is searched"""
+        results = self.snapshot.search_paragraphs(_vector(0, 1), None, 3)
+
+        self.assertEqual([row[0] for row in results][:2], ["p3", "p4"])
+        self.assertEqual(results[2][0], "p2")
+
+    def test_search_paragraphs_within_distance(self):
+        """Test that paragraphs beyond max_distance do not take any of the k places"""
+        results = self.snapshot.search_paragraphs(_vector(0, 1), None, 3, max_distance=0.5)
+
+        self.assertEqual([row[0] for row in results], ["p3", "p4", "p2"])
+        self.assertEqual(self.snapshot.search_paragraphs(_vector(0, 1), ["law1"], 5, 0.2), [])
+
+    def test_search_paragraphs_of_snapshot_without_precomputed_text(self):
+        """Test that snapshots exported before the text columns existed still load"""
+        paragraphs = [(*row[:5], row[-1]) for row in PARAGRAPHS]
+        with tempfile.TemporaryDirectory() as directory:
+            export_snapshot(_mock_connection(8, paragraphs=paragraphs), directory, dim=3)
+            snapshot = VectorSnapshot(os.path.join(directory, "v8"), 8)
+
+            results = snapshot.search_paragraphs(_vector(0, 1), ["law1"], 1)
+
+        self.assertEqual(len(results[0]), 6)
+        self.assertEqual(results[0][:5], ("p2", "§ 3", "Andre", {}, "law1"))
+
+    def test_search_paragraphs_of_unknown_law(self):
+        """Test that a law without paragraphs gives no results"""
+        self.assertEqual(self.snapshot.search_paragraphs(_vector(1, 0), ["missing"], 5), [])
+
+
+class MemoryVectorIndexTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.conn = _mock_connection(1)
+        self.pool = MagicMock()
+
+        @contextmanager
+        def connection():
+            yield self.conn
+
+        self.pool.connection.side_effect = connection
+
+    def test_reloads_when_the_index_version_changes(self):
+        """Test that a new active version is exported and loaded"""
+        index = MemoryVectorIndex(self.pool, self.tmpdir.name, check_interval=0, dim=3)
+        self.assertEqual(index.snapshot().version, 1)
+
+        self.conn = _mock_connection(2, paragraphs=PARAGRAPHS[:1], retained=[1, 2])
+        snapshot = index.snapshot()
+
+        self.assertEqual(snapshot.version, 2)
+        self.assertEqual(len(snapshot.paragraphs), 1)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["v1", "v2"])
+
+    def test_snapshots_that_cannot_be_rolled_back_to_are_deleted(self):
+        """Test that activating a version deletes the snapshots of dropped versions"""
+        for version in (1, 2):
+            export_snapshot(_mock_connection(version), self.tmpdir.name, dim=3)
+        index = MemoryVectorIndex(self.pool, self.tmpdir.name, check_interval=0, dim=3)
+
+        self.conn = _mock_connection(3, retained=[2, 3])
+        index.snapshot()
+
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), ["v2", "v3"])
+
+    def test_prune_keeps_newer_snapshots(self):
+        """Test that a snapshot of a version activated meanwhile is not deleted"""
+        for version in (1, 2, 4):
+            os.makedirs(os.path.join(self.tmpdir.name, f"v{version}"))
+        os.makedirs(os.path.join(self.tmpdir.name, ".v1-staging"))
+
+        pruned = prune_snapshots(self.tmpdir.name, {3})
+
+        self.assertEqual(pruned, [1, 2])
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)), [".v1-staging", "v4"])
+
+    def test_version_is_not_checked_within_interval(self):
+        """Test that searches reuse the snapshot until the check interval has passed"""
+        index = MemoryVectorIndex(self.pool, self.tmpdir.name, check_interval=60, dim=3)
+        first = index.snapshot()
+
+        self.conn = _mock_connection(2)
+        self.assertIs(index.snapshot(), first)
+        self.assertEqual(self.pool.connection.call_count, 1)
+
+    def test_existing_snapshot_is_loaded_without_export(self):
+        """Test that a worker maps a snapshot another worker has already exported"""
+        export_snapshot(_mock_connection(1), self.tmpdir.name, dim=3)
+
+        with patch("common.utils.memory_vector_index.export_snapshot") as mock_export:
+            snapshot = MemoryVectorIndex(self.pool, self.tmpdir.name, dim=3).snapshot()
+
+        mock_export.assert_not_called()
+        self.assertEqual(snapshot.version, 1)
@@ -0,0 +1,53 @@
+from importlib import import_module
+
+from django.db import connection
+from django.test import TestCase
+
+
+upgrade_law_tables = import_module("common.migrations.0002_upgrade_law_tables")
+
+
+class UpgradeLawTablesMigrationTest(TestCase):
+    """Test the migration that adds the retriever's columns to existing law tables."""
+
+    def _columns(self, cur, table):
+        cur.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'law_tables_upgrade' AND table_name = %s;
+        """,
+            [table],
+        )
+        return {row[0] for row in cur.fetchall()}
+
+    def test_adds_retriever_columns_to_tables_created_before_them(self):
+        """Test that tables from before the precomputed columns can be searched afterwards"""
+        # Rolled back with the test transaction
+        with connection.cursor() as cur:
+            cur.execute("CREATE SCHEMA law_tables_upgrade;")
+            cur.execute("SET LOCAL search_path TO law_tables_upgrade;")
+            cur.execute("CREATE TABLE laws (id SERIAL PRIMARY KEY, law_id TEXT UNIQUE);")
+            cur.execute(
+                "CREATE TABLE paragraphs (id SERIAL PRIMARY KEY, paragraph_id TEXT UNIQUE, "
+                "law_id TEXT, paragraph_number TEXT, text TEXT);"
+            )
+
+            cur.execute(upgrade_law_tables.UPGRADE_LAW_TABLES_SQL)
+            # Running it again, e.g. after an ingestion added the columns, is a no-op
+            cur.execute(upgrade_law_tables.UPGRADE_LAW_TABLES_SQL)
+
+            self.assertIn("content_hash", self._columns(cur, "laws"))
+            self.assertLessEqual(
+                {"content_hash", "clean_text", "word_count", "lovdata_url", "is_first_section"},
+                self._columns(cur, "paragraphs"),
+            )
+
+    def test_skips_missing_tables(self):
+        """Test that a database that was never ingested is left alone"""
+        with connection.cursor() as cur:
+            cur.execute("CREATE SCHEMA law_tables_upgrade;")
+            cur.execute("SET LOCAL search_path TO law_tables_upgrade;")
+
+            cur.execute(upgrade_law_tables.UPGRADE_LAW_TABLES_SQL)
+
+            self.assertEqual(self._columns(cur, "paragraphs"), set())
@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from common.utils.paragraph_text import (
+    build_lovdata_url,
+    clean_paragraph_text,
+    count_words,
+    is_first_section,
+    paragraph_text_columns,
+)
+
+
+class ParagraphTextTest(TestCase):
+    def test_clean_text_removes_metadata(self):
+        """Test that Lovdata metadata keywords are removed"""
+        cleaned = clean_paragraph_text(
+            "XML generert some data Tittel Test Document § 1 This is the actual content"
+        )
+
+        self.assertNotIn("XML generert", cleaned)
+        self.assertNotIn("Tittel", cleaned)
+        self.assertIn("§ 1", cleaned)
+
+    def test_clean_text_normalizes_whitespace(self):
+        """Test that runs of whitespace become one space and the ends are stripped"""
+        self.assertEqual(
+            clean_paragraph_text("Test   text   with    multiple    spaces"),
+            "Test text with multiple spaces",
+        )
+        self.assertEqual(clean_paragraph_text("  Test content  "), "Test content")
+
+    def test_clean_text_extracts_sections(self):
+        """Test that the text of every section is kept, without the preamble"""
+        cleaned = clean_paragraph_text("Preamble text § 1 First section § 2 Second section")
+
+        self.assertIn("§ 1", cleaned)
+        self.assertIn("First section", cleaned)
+        self.assertIn("§ 2", cleaned)
+        self.assertIn("Second section", cleaned)
+
+    def test_clean_text_truncates_long_text(self):
+        """Test that text longer than 600 words is cut to 600 words"""
+        cleaned = clean_paragraph_text(" ".join(["word"] * 700))
+
+        self.assertEqual(len(cleaned.split()), 600)
+
+    def test_count_words_ignores_punctuation(self):
+        """Test that words are counted like the chat context budget counts them"""
+        self.assertEqual(count_words("§ 2 Kommunen skal ha en plan."), 6)
+        self.assertEqual(count_words(""), 0)
+
+    def test_lovdata_url_of_law_paragraph(self):
+        """Test the deep link to a paragraph of a law"""
+        self.assertEqual(
+            build_lovdata_url("nl-20050617-062", "§ 14-9"),
+            "https://lovdata.no/dokument/LTI/lov/2005-06-17-62/§14-9",
+        )
+
+    def test_lovdata_url_of_regulation_without_paragraph(self):
+        """Test that regulations link to forskrift and that a missing number links the law"""
+        self.assertEqual(
+            build_lovdata_url("sf-20091215-1599", None),
+            "https://lovdata.no/dokument/LTI/forskrift/2009-12-15-1599",
+        )
+
+    def test_is_first_section(self):
+        """Test that only § 1 itself is flagged, not § 10 or § 1a"""
+        self.assertTrue(is_first_section("§ 1"))
+        self.assertTrue(is_first_section("§1"))
+        self.assertFalse(is_first_section("§ 10"))
+        self.assertFalse(is_first_section("§ 1a"))
+        self.assertFalse(is_first_section(None))
+
+    def test_paragraph_text_columns(self):
+        """Test the cleaned text, its word count and the link stored at ingestion"""
+        clean_text, word_count, lovdata_url, first_section = paragraph_text_columns(
+            "nl-20000101-001", "§ 3", "Innledning § 3  Annen   tekst"
+        )
+
+        self.assertEqual(clean_text, "§ 3 Annen tekst")
+        self.assertEqual(word_count, 3)
+        self.assertEqual(lovdata_url, "https://lovdata.no/dokument/LTI/lov/2000-01-01-1/§3")
+        self.assertFalse(first_section)
@@ -0,0 +1,142 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from common.tasks import finalize_ingestion, ingest_law, ingest_laws
+from common.tests.test_db_client import SAMPLE_LAW_XML
+
+
+class IngestLawsTaskTest(TestCase):
+    """Test the distributed ingestion tasks with Celery running eagerly."""
+
+    def setUp(self):
+        patchers = {
+            "connect": patch("common.tasks.connect_with_retries"),
+            "fetch": patch("common.tasks.fetch_lovdata_laws"),
+            "create_table": patch("common.tasks.create_table_if_not_exists"),
+            "begin_version": patch("common.tasks.begin_index_version", return_value=3),
+            "prepare_tables": patch("common.tasks.prepare_version_tables"),
+            "delete_missing": patch("common.tasks.delete_missing_laws"),
+            "backfill": patch("common.tasks.backfill_paragraph_text"),
+            "finish_version": patch("common.tasks.finish_index_version"),
+            "abandon_version": patch("common.tasks.abandon_index_version"),
+            "drop_expired": patch("common.tasks.drop_expired_index_versions"),
+            "load_hashes": patch("common.tasks.load_content_hashes", return_value=({}, {})),
+            "create_embedding": patch(
+                "common.utils.db_client.create_embedding", return_value=[0.1] * 384
+            ),
+            "create_embeddings": patch("common.utils.db_client.create_embeddings"),
+            "write": patch("common.utils.db_client.write_law_with_paragraphs", return_value=2),
+        }
+        self.mocks = {name: patcher.start() for name, patcher in patchers.items()}
+        for patcher in patchers.values():
+            self.addCleanup(patcher.stop)
+
+        self.mocks["create_embeddings"].side_effect = lambda texts, batch_size: [
+            [0.2] * 384 for _ in texts
+        ]
+
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings_override = override_settings(LAW_INGESTION_DIR=self.tmpdir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _write_law(self, law_id):
+        path = os.path.join(self.tmpdir.name, f"{law_id}.xml")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(SAMPLE_LAW_XML)
+        return path
+
+    def test_ingest_laws_fans_out_one_task_per_law(self):
+        """Test that every law is written to the new version before it is activated"""
+        for law_id in ("nl-20000101-001", "nl-20000102-001"):
+            self._write_law(law_id)
+        self.mocks["fetch"].return_value = {
+            "nl-20000101-001.xml": "lovtidend-avd1.tar.bz2",
+            "nl-20000102-001.xml": "lovtidend-avd1.tar.bz2",
+        }
+
+        result = ingest_laws.delay(full_rebuild=True).get()
+
+        self.assertEqual(result["index_version"], 3)
+        self.assertEqual(result["laws"], 2)
+        self.mocks["prepare_tables"].assert_called_once_with(
+            self.mocks["connect"].return_value, ("laws_v3", "paragraphs_v3"), True
+        )
+        self.mocks["delete_missing"].assert_called_once_with(
+            self.mocks["connect"].return_value,
+            ("laws_v3", "paragraphs_v3"),
+            {"nl-20000101-001", "nl-20000102-001"},
+        )
+        written_ids = {call[0][1] for call in self.mocks["write"].call_args_list}
+        self.assertEqual(written_ids, {"nl-20000101-001", "nl-20000102-001"})
+        self.assertEqual(self.mocks["write"].call_args[1]["tables"], ("laws_v3", "paragraphs_v3"))
+        self.mocks["finish_version"].assert_called_once_with(
+            self.mocks["connect"].return_value, 3, ("laws_v3", "paragraphs_v3")
+        )
+
+    def test_ingest_laws_abandons_version_when_dispatch_fails(self):
+        """Test that the new version is dropped when the chord cannot be queued"""
+        self.mocks["fetch"].return_value = {}
+
+        with (
+            patch("common.tasks.chord", side_effect=ConnectionError("broker unreachable")),
+            self.assertRaises(ConnectionError),
+        ):
+            ingest_laws.run(full_rebuild=True)
+
+        self.mocks["abandon_version"].assert_called_once_with(self.mocks["connect"].return_value, 3)
+        self.mocks["finish_version"].assert_not_called()
+
+    def test_ingest_law_skips_unchanged_law(self):
+        """Test that a law with a matching content hash is not embedded again"""
+        law_path = self._write_law("nl-20000101-001")
+        ingest_law(3, law_path)
+        law_hash = self.mocks["write"].call_args[1]["content_hash"]
+        self.mocks["load_hashes"].return_value = ({"nl-20000101-001": law_hash}, {})
+
+        stats = ingest_law(3, law_path)
+
+        self.assertEqual(stats["unchanged_laws"], 1)
+        self.assertEqual(self.mocks["write"].call_count, 1)
+        self.mocks["load_hashes"].assert_called_with(
+            self.mocks["connect"].return_value,
+            ("laws_v3", "paragraphs_v3"),
+            law_ids=["nl-20000101-001"],
+        )
+
+    def test_finalize_sums_stats_and_activates_version(self):
+        """Test that the chord callback totals the per-law stats"""
+        law_stats = {
+            "laws": 1,
+            "unchanged_laws": 0,
+            "embedded_paragraphs": 2,
+            "stored_paragraphs": 2,
+            "embedding_seconds": 0.5,
+            "embedding_cache_hits": 1,
+            "embedding_cache_misses": 2,
+        }
+
+        stats = finalize_ingestion([law_stats, law_stats], 3)
+
+        self.assertEqual(stats["laws"], 2)
+        self.assertEqual(stats["stored_paragraphs"], 4)
+        self.assertEqual(stats["embedding_cache_hits"], 2)
+        self.assertEqual(stats["index_version"], 3)
+        self.mocks["backfill"].assert_called_once_with(
+            self.mocks["connect"].return_value, ("laws_v3", "paragraphs_v3")
+        )
+        self.mocks["drop_expired"].assert_called_once()
+
+    def test_finalize_abandons_version_when_activation_fails(self):
+        """Test that a failed index build drops the shadow version"""
+        self.mocks["finish_version"].side_effect = RuntimeError("index build failed")
+
+        with self.assertRaises(RuntimeError):
+            finalize_ingestion([], 3)
+
+        self.mocks["abandon_version"].assert_called_once_with(self.mocks["connect"].return_value, 3)
+        self.mocks["connect"].return_value.close.assert_called_once()
@@ -0,0 +1,74 @@
+import struct
+from unittest import TestCase
+
+import numpy as np
+
+from common.utils.vector_benchmark import (
+    copy_payload,
+    exact_neighbours,
+    recall_at_k,
+    run_memory_queries,
+    search_sql,
+    synthetic_chunks,
+    synthetic_queries,
+)
+
+
+class VectorBenchmarkTest(TestCase):
+    """Test the data generation and scoring of the vector index benchmark."""
+
+    def test_synthetic_chunks_are_reproducible_unit_vectors(self):
+        """Test that the data can be generated again for the exact search"""
+        first = list(synthetic_chunks(250, dim=8, seed=3, chunk_size=100))
+        second = list(synthetic_chunks(250, dim=8, seed=3, chunk_size=100))
+
+        self.assertEqual([start for start, _ in first], [0, 100, 200])
+        self.assertEqual(sum(len(vectors) for _, vectors in first), 250)
+        for (_, a), (_, b) in zip(first, second, strict=True):
+            np.testing.assert_array_equal(a, b)
+        np.testing.assert_allclose(np.linalg.norm(first[0][1], axis=1), 1.0, rtol=1e-5)
+
+    def test_exact_neighbours_across_chunks(self):
+        """Test that chunked exact search matches a search over all vectors at once"""
+        vectors = np.concatenate([v for _, v in synthetic_chunks(300, dim=8, chunk_size=64)])
+        queries = synthetic_queries(5, dim=8)
+
+        found = exact_neighbours(synthetic_chunks(300, dim=8, chunk_size=64), queries, k=10)
+
+        expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+        for row, exact in zip(found, expected, strict=True):
+            self.assertEqual(set(row.tolist()), set(exact.tolist()))
+
+    def test_recall_at_k(self):
+        """Test that recall counts the exact neighbours that were returned"""
+        expected = np.array([[1, 2], [3, 4]])
+
+        self.assertEqual(recall_at_k([[1, 2], [3, 9]], expected), 0.75)
+
+    def test_copy_payload_encodes_binary_vectors(self):
+        """Test the binary COPY rows of (id, vector) in pgvector's wire format"""
+        payload = copy_payload(7, np.array([[0.5, -1.0]], dtype=np.float32))
+
+        self.assertTrue(payload.startswith(b"PGCOPY\n\xff\r\n\x00"))
+        row = payload[19:-2]
+        self.assertEqual(struct.unpack(">hii" + "ihh2f", row), (2, 4, 7, 12, 2, 0, 0.5, -1.0))
+        self.assertEqual(payload[-2:], struct.pack(">h", -1))
+
+    def test_memory_queries_find_the_exact_neighbours(self):
+        """Test that the in-process numpy search is exact"""
+        queries = synthetic_queries(4, dim=8)
+
+        _, latencies, found = run_memory_queries(300, queries, k=5, seed=0)
+
+        expected = exact_neighbours(synthetic_chunks(300, dim=8), queries, k=5)
+        self.assertEqual(len(latencies), 4)
+        self.assertEqual(recall_at_k(found, expected), 1.0)
+
+    def test_quantized_search_reranks_candidates(self):
+        """Test that the quantized runs rerank their candidates by exact cosine distance"""
+        statement = repr(search_sql("vector_benchmark_100", "binary"))
+
+        self.assertIn("binary_quantize(embedding)::bit(384) <~>", statement)
+        self.assertIn("LIMIT %(candidates)s", statement)
+        self.assertIn("ORDER BY embedding <=> %(query_vec)s::vector LIMIT %(k)s", statement)
+        self.assertNotIn("candidates", repr(search_sql("vector_benchmark_100")))
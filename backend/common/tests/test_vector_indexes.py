@@ -0,0 +1,94 @@
+import os
+from unittest import TestCase
+from unittest.mock import patch
+
+from common.utils.vector_indexes import (
+    VectorIndexConfig,
+    ivfflat_lists,
+    quantized_distance_sql,
+    search_settings_sql,
+    vector_index_sql,
+)
+
+
+class VectorIndexesTest(TestCase):
+    """Test the vector index configuration and the statements built from it."""
+
+    def test_config_from_env(self):
+        """Test that index type and parameters are read from the environment"""
+        env = {
+            "VECTOR_INDEX_METHOD": "ivfflat",
+            "IVFFLAT_LISTS": "250",
+            "HNSW_M": "32",
+            "VECTOR_INDEX_QUANTIZATION": "halfvec",
+        }
+        with patch.dict(os.environ, env):
+            config = VectorIndexConfig.from_env()
+
+        self.assertEqual(config.method, "ivfflat")
+        self.assertEqual(config.lists, 250)
+        self.assertEqual(config.m, 32)
+        self.assertEqual(config.quantization, "halfvec")
+
+    def test_unknown_method_is_rejected(self):
+        """Test that a typo in VECTOR_INDEX_METHOD fails instead of building no index"""
+        with self.assertRaises(ValueError):
+            VectorIndexConfig(method="hnws")
+        with self.assertRaises(ValueError):
+            VectorIndexConfig(quantization="int8")
+
+    def test_ivfflat_lists_follow_row_count(self):
+        """Test the pgvector recommendation of rows/1000, and sqrt(rows) above 1M rows"""
+        self.assertEqual(ivfflat_lists(500), 1)
+        self.assertEqual(ivfflat_lists(100_000), 100)
+        self.assertEqual(ivfflat_lists(4_000_000), 2000)
+
+    def test_hnsw_index_uses_build_parameters(self):
+        """Test that m and ef_construction end up in the index definition"""
+        statement = repr(
+            vector_index_sql("paragraphs", "paragraphs_embedding_idx", VectorIndexConfig(m=24))
+        )
+
+        self.assertIn("SQL('hnsw')", statement)
+        self.assertIn("Literal(24)", statement)
+        self.assertIn("Literal(64)", statement)
+
+    def test_ivfflat_index_sizes_lists_from_rows(self):
+        """Test that IVFFlat lists are derived from the row count unless configured"""
+        config = VectorIndexConfig(method="ivfflat")
+
+        statement = repr(vector_index_sql("paragraphs", "idx", config, rows=200_000))
+
+        self.assertIn("SQL('ivfflat')", statement)
+        self.assertIn("Literal(200)", statement)
+
+    def test_binary_quantized_index(self):
+        """Test that the binary index is built on the expression the searches order by"""
+        config = VectorIndexConfig(quantization="binary")
+
+        statement = repr(vector_index_sql("paragraphs", "idx", config))
+
+        self.assertIn("SQL('binary_quantize(embedding)::bit(384)')", statement)
+        self.assertIn("SQL('bit_hamming_ops')", statement)
+        self.assertEqual(
+            quantized_distance_sql("binary", "%(query_vec)s::vector(384)"),
+            "binary_quantize(embedding)::bit(384) <~> "
+            "binary_quantize(%(query_vec)s::vector(384))::bit(384)",
+        )
+
+    def test_halfvec_quantized_index(self):
+        """Test that the halfvec index keeps cosine distance"""
+        config = VectorIndexConfig(method="ivfflat", quantization="halfvec")
+
+        statement = repr(vector_index_sql("paragraphs", "idx", config, rows=5000))
+
+        self.assertIn("SQL('(embedding)::halfvec(384)')", statement)
+        self.assertIn("SQL('halfvec_cosine_ops')", statement)
+        self.assertIn("<=>", quantized_distance_sql("halfvec", "q.query_vec"))
+
+    def test_ef_search_is_at_least_the_limit(self):
+        """Test that an HNSW scan is allowed to return as many rows as requested"""
+        statement = repr(search_settings_sql(ef_search=40, probes=10, limit=100))
+
+        self.assertIn("Literal(100)", statement)
+        self.assertIn("Literal(10)", statement)
@@ -8,6 +8,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from common.models import MockResponse
+from common.utils.db_pool import PoolTimeoutError
 from common.views import history_to_json, json_to_history
 
 
@@ -371,6 +372,17 @@ class ChatViewSetTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
         self.assertIn("error", response.data)
 
+    @patch("common.views.GEMINI_CHAT_SERVICE")
+    def test_chat_database_busy(self, mock_service):
+        """Test chat API answers 503 when no database connection is free"""
+        mock_service.send_question_with_laws.side_effect = PoolTimeoutError("pool exhausted")
+        data = {"prompt": "Question", "history": []}
+
+        response = self.client.post(self.url, data=data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertIn("error", response.data)
+
     @patch("common.views.GEMINI_CHAT_SERVICE")
     def test_chat_empty_prompt(self, mock_service):
         """Test chat API handles empty prompt"""
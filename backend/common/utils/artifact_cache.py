@@ -0,0 +1,126 @@
+"""
+Local cache for artifacts downloaded from the Lovdata API.
+
+Every cached file is stored under its filename together with a small
+``<filename>.meta.json`` sidecar holding the HTTP validators (ETag, Last-Modified) and
+the size of the stored file. The validators are sent back as ``If-None-Match`` /
+``If-Modified-Since`` so unchanged artifacts are answered with ``304 Not Modified``,
+and as ``If-Range`` when an interrupted download is resumed with a Range request.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+
+
+PARTIAL_SUFFIX = ".part"
+METADATA_SUFFIX = ".meta.json"
+
+
+class ArtifactCache:
+    """Filename keyed artifact store with HTTP validators for conditional requests."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def partial_path(self, filename: str) -> str:
+        return self.path(filename) + PARTIAL_SUFFIX
+
+    def _metadata_path(self, key: str) -> str:
+        return self.path(key) + METADATA_SUFFIX
+
+    def _read_metadata(self, key: str) -> dict | None:
+        try:
+            with open(self._metadata_path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_metadata(self, key: str, metadata: dict) -> None:
+        tmp_path = self._metadata_path(key) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f)
+        os.replace(tmp_path, self._metadata_path(key))
+
+    def _remove_metadata(self, key: str) -> None:
+        try:
+            os.remove(self._metadata_path(key))
+        except FileNotFoundError:
+            pass
+
+    def get_metadata(self, filename: str) -> dict | None:
+        """Return the stored metadata if the cached file is present and complete."""
+        metadata = self._read_metadata(filename)
+        if metadata is None:
+            return None
+        try:
+            if os.path.getsize(self.path(filename)) != metadata.get("size"):
+                return None
+        except FileNotFoundError:
+            return None
+        return metadata
+
+    def set_metadata(self, filename: str, headers, size: int, **extra) -> None:
+        """Store the validators from a response for a complete cached file."""
+        self._write_metadata(
+            filename,
+            {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "size": size,
+                **extra,
+            },
+        )
+
+    def validator_headers(self, filename: str) -> dict:
+        """Headers that make the server answer 304 if the cached file is still current."""
+        metadata = self.get_metadata(filename)
+        if not metadata:
+            return {}
+
+        headers = {}
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata["etag"]
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata["last_modified"]
+        return headers
+
+    def resume_headers(self, filename: str) -> dict:
+        """Range headers for continuing an interrupted download, if one can be resumed."""
+        metadata = self._read_metadata(filename + PARTIAL_SUFFIX)
+        try:
+            offset = os.path.getsize(self.partial_path(filename))
+        except FileNotFoundError:
+            return {}
+
+        validator = metadata and (metadata.get("etag") or metadata.get("last_modified"))
+        if not offset or not validator:
+            return {}
+        return {"Range": f"bytes={offset}-", "If-Range": validator}
+
+    def start_partial(self, filename: str, headers) -> None:
+        """Remember the validators of the response a partial download belongs to."""
+        self._write_metadata(
+            filename + PARTIAL_SUFFIX,
+            {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")},
+        )
+
+    def discard_partial(self, filename: str) -> None:
+        try:
+            os.remove(self.partial_path(filename))
+        except FileNotFoundError:
+            pass
+        self._remove_metadata(filename + PARTIAL_SUFFIX)
+
+    def complete_partial(self, filename: str, headers, **extra) -> str:
+        """Move a finished partial download into place and store its validators."""
+        path = self.path(filename)
+        os.replace(self.partial_path(filename), path)
+        self._remove_metadata(filename + PARTIAL_SUFFIX)
+        self.set_metadata(filename, headers, os.path.getsize(path), **extra)
+        return path
@@ -0,0 +1,236 @@
+"""
+Bounded asyncio pool of psycopg 3 connections for the vector-search queries.
+
+The asyncio counterpart of ``db_pool.ConnectionPool``, for code running on an event
+loop under an ASGI server. It hands out at most ``max_size`` connections at a time;
+coroutines beyond that wait up to ``checkout_timeout`` seconds without blocking the loop
+and then fail with ``PoolTimeoutError``. Connections run in autocommit mode with a
+server-side ``statement_timeout``, idle connections above ``min_size`` are closed after
+``idle_timeout`` seconds, and a connection that has been idle for a while is pinged
+before it is handed out again.
+
+A pool belongs to the event loop it is first used on.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+import psycopg
+from psycopg import pq
+
+from common.utils.db_pool import PoolTimeoutError
+
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is broken, not the query
+ASYNC_CONNECTION_ERRORS = (psycopg.OperationalError, psycopg.InterfaceError)
+
+
+class AsyncConnectionPool:
+    """Bounded pool of autocommit ``psycopg.AsyncConnection`` objects."""
+
+    def __init__(
+        self,
+        db_config: dict,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        checkout_timeout: float = 5.0,
+        statement_timeout_ms: int = 5000,
+        health_check_after: float = 30.0,
+    ):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_after = health_check_after
+
+        # Idle connections with the time they were returned, most recently used last
+        self._idle: deque[tuple[psycopg.AsyncConnection, float]] = deque()
+        self._size = 0
+        self._closed = False
+        self._condition = asyncio.Condition()
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds": 0.0,
+            "created": 0,
+            "discarded": 0,
+            "failed_health_checks": 0,
+        }
+
+    async def _connect(self) -> psycopg.AsyncConnection:
+        db_config = dict(self.db_config)
+        if self.statement_timeout_ms:
+            db_config["options"] = f"-c statement_timeout={int(self.statement_timeout_ms)}"
+        return await psycopg.AsyncConnection.connect(autocommit=True, **db_config)
+
+    async def _notify(self) -> None:
+        async with self._condition:
+            self._condition.notify()
+
+    async def open_pool(self) -> None:
+        """Open connections until the pool holds ``min_size`` of them."""
+        while not self._closed and self._size < self.min_size:
+            self._size += 1
+            conn = await self._create_counted()
+            await self._put_idle(conn)
+
+    async def _create_counted(self) -> psycopg.AsyncConnection:
+        """Create a connection for a slot that has already been counted in ``_size``."""
+        try:
+            conn = await self._connect()
+        except BaseException:
+            self._size -= 1
+            await self._notify()
+            raise
+        self._metrics["created"] += 1
+        return conn
+
+    async def _put_idle(self, conn: psycopg.AsyncConnection) -> None:
+        if self._closed:
+            self._size -= 1
+            await self._close_quietly(conn)
+            return
+        self._idle.append((conn, time.monotonic()))
+        await self._notify()
+
+    async def _discard(self, conn: psycopg.AsyncConnection) -> None:
+        self._size -= 1
+        self._metrics["discarded"] += 1
+        await self._close_quietly(conn)
+        await self._notify()
+
+    @staticmethod
+    async def _close_quietly(conn: psycopg.AsyncConnection) -> None:
+        try:
+            await conn.close()
+        except psycopg.Error:
+            pass
+
+    def _prune_idle(self, now: float) -> list:
+        """Take idle connections past the idle timeout out of the pool, keeping min_size."""
+        expired = []
+        while (
+            self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout
+        ):
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._metrics["discarded"] += 1
+            expired.append(conn)
+        return expired
+
+    async def _is_usable(self, conn: psycopg.AsyncConnection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            await conn.execute("SELECT 1;")
+            return True
+        except psycopg.Error:
+            self._metrics["failed_health_checks"] += 1
+            return False
+
+    async def getconn(self) -> psycopg.AsyncConnection:
+        """Check out a connection, waiting up to ``checkout_timeout`` for a free one."""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+        while True:
+            if self._closed:
+                raise PoolTimeoutError("The connection pool is closed")
+            for expired_conn in self._prune_idle(time.monotonic()):
+                await self._close_quietly(expired_conn)
+
+            if self._idle:
+                conn, idle_since = self._idle.pop()
+                if not await self._is_usable(conn, idle_since):
+                    await self._discard(conn)
+                    continue
+            elif self._size < self.max_size:
+                self._size += 1
+                conn = await self._create_counted()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available within {self.checkout_timeout}s "
+                        f"({self.max_size} in use)"
+                    )
+                if not waited:
+                    self._metrics["waits"] += 1
+                    waited = True
+                async with self._condition:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), remaining)
+                    except TimeoutError:
+                        pass
+                continue
+
+            self._metrics["checkouts"] += 1
+            self._metrics["wait_seconds"] += time.monotonic() - started
+            return conn
+
+    async def putconn(self, conn: psycopg.AsyncConnection, broken: bool = False) -> None:
+        """Return a connection; broken ones are closed and their slot is freed."""
+        if broken or conn.closed:
+            await self._discard(conn)
+            return
+        if conn.info.transaction_status != pq.TransactionStatus.IDLE:
+            try:
+                await conn.rollback()
+            except psycopg.Error:
+                await self._discard(conn)
+                return
+        await self._put_idle(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        """Context manager that checks a connection out and returns it afterwards."""
+        conn = await self.getconn()
+        try:
+            yield conn
+        except ASYNC_CONNECTION_ERRORS:
+            await self.putconn(conn, broken=True)
+            raise
+        except BaseException:
+            await self.putconn(conn)
+            raise
+        else:
+            await self.putconn(conn)
+
+    def stats(self) -> dict:
+        """Current pool size and usage counters since the pool was created."""
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "in_use": self._size - len(self._idle),
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            **self._metrics,
+        }
+
+    async def close(self) -> None:
+        """Close idle connections and refuse new checkouts; checked out ones close on return."""
+        self._closed = True
+        idle = [conn for conn, _ in self._idle]
+        self._idle.clear()
+        self._size -= len(idle)
+        async with self._condition:
+            self._condition.notify_all()
+        for conn in idle:
+            await self._close_quietly(conn)
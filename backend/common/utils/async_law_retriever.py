@@ -0,0 +1,359 @@
+"""
+Law retrieval for ASGI deployments, without blocking the event loop.
+
+``AsyncLawRetriever`` has the interface of ``LawRetriever`` with coroutines instead of
+blocking calls: ``await retriever.retrieve(prompt, ...)`` returns the same result as
+``LawRetriever.retrieve``. Searches run on an ``AsyncConnectionPool`` of psycopg 3
+connections, and prompts are embedded by the ONNX model in a thread pool of
+``LAW_RETRIEVER_EMBED_WORKERS`` threads, so one process serves many concurrent chat
+turns while they wait on the database or the model.
+
+The SQL, the embedding model, the query vector cache, the result cache and the
+formatting are those of the process' shared ``LawRetriever`` (``get_law_retriever()``),
+so the model is loaded once per process. Searches always run in Postgres; the numpy
+backend has no I/O to wait on and is served by ``LawRetriever``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+import psycopg
+
+from common.utils.async_db_pool import ASYNC_CONNECTION_ERRORS, AsyncConnectionPool
+from common.utils.db_pool import PoolTimeoutError, db_config_from_settings
+from common.utils.law_retriever_from_database import (
+    LawRetriever,
+    get_law_retriever,
+    normalize_prompt,
+)
+from common.utils.memory_vector_index import UNVERSIONED
+from common.utils.vector_indexes import search_settings_query
+
+
+logger = logging.getLogger(__name__)
+
+_shared_retriever = None
+
+
+class AsyncLawRetriever:
+    def __init__(
+        self,
+        db_config=None,
+        pool=None,
+        embed_workers=None,
+        retriever: LawRetriever | None = None,
+    ):
+        # The retriever owns its pool unless one is given, configured like the shared one
+        self._owns_pool = pool is None
+        if pool is None:
+            pool = AsyncConnectionPool(
+                db_config if db_config is not None else db_config_from_settings(),
+                min_size=settings.LAW_DB_POOL_MIN_SIZE,
+                max_size=settings.LAW_DB_POOL_MAX_SIZE,
+                idle_timeout=settings.LAW_DB_POOL_IDLE_TIMEOUT,
+                checkout_timeout=settings.LAW_DB_POOL_CHECKOUT_TIMEOUT,
+                statement_timeout_ms=settings.LAW_DB_STATEMENT_TIMEOUT_MS,
+            )
+        self.pool = pool
+        # Builds the queries and formats their rows. Its own pool is created lazily, so it is
+        # never opened when the process only serves async requests
+        self.retriever = retriever if retriever is not None else get_law_retriever()
+        # ONNX inference releases the GIL, so a few threads embed prompts in parallel
+        self._executor = ThreadPoolExecutor(
+            max_workers=embed_workers or settings.LAW_RETRIEVER_EMBED_WORKERS,
+            thread_name_prefix="law-embedding",
+        )
+        self._index_version = None
+        self._index_version_expires = 0.0
+
+    async def _fetchall(self, query: str, params, search_limit: int | None = None) -> list:
+        """
+        Run a query on a pooled connection, retrying once if the connection was lost.
+
+        Vector searches pass ``search_limit`` so the query runs in a transaction with the
+        index search parameters set for it alone.
+        """
+        try:
+            return await self._execute(query, params, search_limit)
+        except ASYNC_CONNECTION_ERRORS as e:
+            # The pool has dropped the broken connection, so this checks out a new one
+            logger.warning("Law database connection lost, retrying: %s", e)
+            return await self._execute(query, params, search_limit)
+
+    async def _execute(self, query: str, params, search_limit: int | None) -> list:
+        async with self.pool.connection() as conn:
+            if search_limit is None:
+                cur = await conn.execute(query, params)
+                return await cur.fetchall()
+
+            async with conn.transaction():
+                await conn.execute(
+                    *search_settings_query(
+                        self.retriever.ef_search, self.retriever.probes, search_limit
+                    )
+                )
+                cur = await conn.execute(query, params)
+                return await cur.fetchall()
+
+    async def health_check(self) -> bool:
+        """Check that the database answers, reconnecting once if the connection is broken."""
+        try:
+            return await self._fetchall("SELECT 1;", ()) == [(1,)]
+        except (psycopg.Error, PoolTimeoutError) as e:
+            logger.error("Law database health check failed: %s", e)
+            return False
+
+    async def warm_up(self) -> bool:
+        """Load the embedding model and open the pool before the first request needs them."""
+        await self._embed_query("oppvarming")
+        try:
+            await self.pool.open_pool()
+        except psycopg.Error as e:
+            logger.error("Could not open the law database pool: %s", e)
+        return await self.health_check()
+
+    async def close(self) -> None:
+        """Close the retriever's own pool and stop its embedding threads."""
+        if self._owns_pool:
+            await self.pool.close()
+        self._executor.shutdown(wait=False)
+
+    async def retrieve(
+        self,
+        prompt: str,
+        k_laws: int = 3,
+        k_paragraphs: int | None = None,
+        law_id: int | None = None,
+        skip_law_search: bool = False,
+        distance_threshold: float = 0.27,
+        per_law_limit: int | None = None,
+        max_words: int | None = None,
+    ) -> dict:
+        """
+        Som LawRetriever.retrieve(), men uten å blokkere event-løkken.
+        Databasesøkene kjøres asynkront, og embedding kjøres i en egen trådpool.
+        """
+        if not prompt.strip():
+            return {}
+
+        arguments = {
+            "k_laws": k_laws,
+            "k_paragraphs": k_paragraphs,
+            "law_id": law_id,
+            "skip_law_search": skip_law_search,
+            "distance_threshold": distance_threshold,
+            "per_law_limit": per_law_limit,
+            "max_words": max_words,
+        }
+        if not self.retriever.result_cache_alias:
+            return await self._retrieve(prompt, **arguments)
+
+        cache = caches[self.retriever.result_cache_alias]
+        # As in LawRetriever.retrieve(), no cache backend error may fail the search
+        try:
+            key = self.retriever.result_cache_key(
+                prompt, arguments, await self._active_index_version()
+            )
+            cached = await cache.aget(key)
+        except Exception:  # noqa: BLE001
+            logger.warning("Law retrieval cache is unavailable", exc_info=True)
+            return await self._retrieve(prompt, **arguments)
+
+        if cached is not None:
+            self.retriever.record_result_cache_hit(cached["seconds"])
+            return cached["result"]
+
+        started = time.perf_counter()
+        result = await self._retrieve(prompt, **arguments)
+        self.retriever.record_result_cache_misses(1)
+        try:
+            await cache.aset(
+                key,
+                {"result": result, "seconds": time.perf_counter() - started},
+                self.retriever.result_cache_timeout,
+            )
+        except Exception:  # noqa: BLE001
+            logger.warning("Could not store law retrieval result in the cache", exc_info=True)
+        return result
+
+    async def _retrieve(
+        self,
+        prompt: str,
+        k_laws: int,
+        k_paragraphs: int | None,
+        law_id: int | None,
+        skip_law_search: bool,
+        distance_threshold: float,
+        per_law_limit: int | None,
+        max_words: int | None,
+    ) -> dict:
+        retriever = self.retriever
+        # Embedded once and shared by the law and paragraph searches
+        query_vec = await self._embed_query(prompt)
+
+        if skip_law_search:
+            paragraphs = await self._retrieve_paragraphs(
+                query_vec, None, k_paragraphs, distance_threshold, max_words, prompt
+            )
+            return {"laws": [], "paragraphs": paragraphs}
+
+        paragraphs = None
+        if law_id is None:
+            if retriever.single_query and not retriever.hybrid:
+                rows = await self._fetchall(
+                    *retriever.laws_and_paragraphs_query(
+                        query_vec,
+                        k_laws,
+                        k_paragraphs,
+                        per_law_limit,
+                        distance_threshold,
+                        max_words,
+                    )
+                )
+                law_results, paragraphs = retriever.split_laws_and_paragraphs(rows)
+            else:
+                law_results = await self._fetchall(*retriever.laws_query(query_vec, k_laws))
+            if not law_results:
+                return {"laws": [], "paragraphs": []}
+
+            laws = [
+                {"law_id": law_id, "metadata": law_metadata} for law_id, law_metadata in law_results
+            ]
+            law_ids = [law_id for law_id, _ in law_results]
+        else:
+            laws = [{"law_id": law_id}]
+            law_ids = [law_id]
+
+        if paragraphs is None:
+            paragraphs = await self._retrieve_paragraphs(
+                query_vec, law_ids, k_paragraphs, distance_threshold, max_words, prompt
+            )
+        return retriever.assemble_result(laws, paragraphs)
+
+    async def _retrieve_paragraphs(
+        self,
+        query_vec: list,
+        law_ids: list | None,
+        k_paragraphs: int | None,
+        distance_threshold: float,
+        max_words: int | None,
+        prompt: str,
+    ) -> list[dict]:
+        rows = await self._fetchall(
+            *self.retriever.paragraphs_query(
+                query_vec, law_ids, k_paragraphs, distance_threshold, max_words, prompt
+            )
+        )
+        return self.retriever.format_paragraphs(rows)
+
+    async def retrieve_many(
+        self,
+        prompts: list[str],
+        k_laws: int = 3,
+        k_paragraphs: int | None = None,
+        law_id: int | None = None,
+        skip_law_search: bool = False,
+        distance_threshold: float = 0.27,
+        per_law_limit: int | None = None,
+        max_words: int | None = None,
+    ) -> list[dict]:
+        """
+        Som LawRetriever.retrieve_many(), men søkene samles ikke i én spørring per batch.
+        Alle spørsmål embeddes i én batch, og deretter kjøres søkene for hvert spørsmål
+        samtidig på hver sin tilkobling, men aldri flere enn poolen har tilkoblinger.
+        """
+        distinct = list(dict.fromkeys(normalize_prompt(p) for p in prompts if p.strip()))
+        if distinct:
+            # Fills the query vector cache, so the searches below do not embed again
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.retriever.embed_queries, distinct
+            )
+        arguments = {
+            "k_laws": k_laws,
+            "k_paragraphs": k_paragraphs,
+            "law_id": law_id,
+            "skip_law_search": skip_law_search,
+            "distance_threshold": distance_threshold,
+            "per_law_limit": per_law_limit,
+            "max_words": max_words,
+        }
+        # Each search holds one connection, so a large batch waits for its own searches
+        # instead of timing out on checkouts from an exhausted pool
+        semaphore = asyncio.Semaphore(self.pool.max_size)
+
+        async def retrieve(prompt: str) -> dict:
+            async with semaphore:
+                return await self.retrieve(prompt, **arguments)
+
+        results = await asyncio.gather(*(retrieve(p) for p in distinct))
+        by_prompt = dict(zip(distinct, results, strict=True))
+        # Repeated prompts get their own copy, so changing one result leaves the others
+        returned = set()
+        ordered = []
+        for prompt in prompts:
+            if not prompt.strip():
+                ordered.append({})
+                continue
+            key = normalize_prompt(prompt)
+            ordered.append(copy.deepcopy(by_prompt[key]) if key in returned else by_prompt[key])
+            returned.add(key)
+        return ordered
+
+    async def _embed_query(self, prompt: str) -> list:
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self.retriever.embed_query, prompt
+        )
+
+    async def _active_index_version(self) -> int:
+        """The active index version, looked up at most every LAW_INDEX_VERSION_CHECK_INTERVAL."""
+        now = time.monotonic()
+        if self._index_version is None or now >= self._index_version_expires:
+            async with self.pool.connection() as conn:
+                self._index_version = await _get_active_index_version(conn) or UNVERSIONED
+            self._index_version_expires = now + settings.LAW_INDEX_VERSION_CHECK_INTERVAL
+        return self._index_version
+
+    def query_cache_stats(self) -> dict:
+        return self.retriever.query_cache_stats()
+
+    def result_cache_stats(self) -> dict:
+        return self.retriever.result_cache_stats()
+
+
+async def _get_active_index_version(conn) -> int | None:
+    """``index_versions.get_active_index_version`` on an async connection."""
+    cur = await conn.execute("SELECT to_regclass('index_versions') IS NOT NULL;")
+    if not (await cur.fetchone())[0]:
+        return None
+    cur = await conn.execute("SELECT version FROM index_versions WHERE status = 'active';")
+    row = await cur.fetchone()
+    return row[0] if row else None
+
+
+def get_async_law_retriever() -> AsyncLawRetriever:
+    """
+    Return the async retriever shared by this process, creating it on first use.
+
+    Its pool belongs to the event loop of the ASGI server, so it must only be used from
+    coroutines running on that loop.
+    """
+    global _shared_retriever
+    if _shared_retriever is None:
+        _shared_retriever = AsyncLawRetriever()
+    return _shared_retriever
+
+
+async def close_async_law_retriever() -> None:
+    """Close the shared async retriever, e.g. from the ASGI lifespan shutdown."""
+    global _shared_retriever
+    if _shared_retriever is not None:
+        retriever, _shared_retriever = _shared_retriever, None
+        await retriever.close()
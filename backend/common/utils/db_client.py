@@ -1,14 +1,40 @@
+import dataclasses
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
 
+import numpy as np
 import psycopg2
 from bs4 import BeautifulSoup
 from fastembed import TextEmbedding
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+
+from common.utils.embedding_cache import get_embedding_cache
+from common.utils.index_versions import (
+    INDEX_ROLLBACK_WINDOW_HOURS,
+    LIVE_TABLES,
+    abandon_index_version,
+    activate_index_version,
+    begin_index_version,
+    drop_expired_index_versions,
+    version_tables,
+)
+from common.utils.law_extractor import (
+    fetch_lovdata_laws,
+    standard_format_laws,
+    stream_lovdata_laws,
+)
+from common.utils.paragraph_text import paragraph_text_columns
+from common.utils.vector_indexes import VectorIndexConfig, vector_index_sql
 
-from common.utils.law_extractor import fetch_lovdata_laws, standard_format_laws
 
 # Configure logging to print to console
 logging.basicConfig(
@@ -19,11 +45,36 @@ logging.basicConfig(
 
 _model = None
 
+# Embedding model used for laws and paragraphs, and the size of its vectors
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+EMBEDDING_DIM = 384
+
+# How laws.embedding is computed:
+#   "text"     - embed the law text (truncated by the model at 512 tokens)
+#   "mean"     - normalized mean of the paragraph vectors
+#   "weighted" - centroid of the paragraph vectors weighted by paragraph word count
+LAW_EMBEDDING_MODES = ("text", "mean", "weighted")
+LAW_EMBEDDING = os.environ.get("LAW_EMBEDDING", "text")
+
+# Number of texts sent to the embedding model in one ONNX batch
+EMBEDDING_BATCH_SIZE = 64
+
+# Rows sent to the database per multi-row INSERT when writing in bulk
+WRITE_PAGE_SIZE = 500
+
+# Parse worker processes and queue depth between the ingestion pipeline stages
+PARSE_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+PIPELINE_QUEUE_SIZE = 8
+
+# Marks the end of the stream on a pipeline queue
+_END_OF_STREAM = None
+
+
 # Lazy loading only when model is needed
 def get_model():
     global _model
     if _model is None:
-        _model = TextEmbedding(model_name="BAAI/bge-small-en-v1.5")
+        _model = TextEmbedding(model_name=EMBEDDING_MODEL_NAME)
     return _model
 
 
@@ -36,235 +87,1041 @@ DB_CONFIG = {
     "port": "5432",
 }
 
+
+# Build a statement for the given laws/paragraphs tables from a template using
+# {laws} and {paragraphs} placeholders
+def _table_sql(template, tables, **identifiers):
+    return sql.SQL(template).format(
+        laws=sql.Identifier(tables.laws),
+        paragraphs=sql.Identifier(tables.paragraphs),
+        **{name: sql.Identifier(value) for name, value in identifiers.items()},
+    )
+
+
 # Create necessary tables if they do not exist
-def create_table_if_not_exists(conn):
+def create_table_if_not_exists(conn, tables=LIVE_TABLES):
     with conn.cursor() as cur:
         cur.execute(
-            """
+            _table_sql(
+                """
             CREATE EXTENSION IF NOT EXISTS vector;
 
             -- Table for laws
-            CREATE TABLE IF NOT EXISTS laws (
+            CREATE TABLE IF NOT EXISTS {laws} (
                 id SERIAL PRIMARY KEY,
                 law_id TEXT UNIQUE,
                 text TEXT,
                 metadata JSONB,
-                embedding VECTOR(384)
+                embedding VECTOR(384),
+                content_hash TEXT
             );
 
             -- Table for paragraphs related to laws
-            CREATE TABLE IF NOT EXISTS paragraphs (
+            CREATE TABLE IF NOT EXISTS {paragraphs} (
                 id SERIAL PRIMARY KEY,
-                paragraph_id TEXT,
+                paragraph_id TEXT UNIQUE,
                 law_id TEXT,  -- points to laws.law_id (but without FK-constraints)
                 paragraph_number TEXT,
                 text TEXT,
                 metadata JSONB,
-                embedding VECTOR(384)
+                embedding VECTOR(384),
+                content_hash TEXT,
+                clean_text TEXT,
+                word_count INTEGER,
+                lovdata_url TEXT,
+                is_first_section BOOLEAN,
+                -- Norwegian full-text search over the paragraphs, for hybrid retrieval.
+                -- Not added to existing tables, as adding a stored generated column
+                -- rewrites the table under an exclusive lock: live tables get it with
+                -- the next index version, whose tables are created here
+                text_search TSVECTOR GENERATED ALWAYS AS (
+                    to_tsvector(
+                        'norwegian', coalesce(paragraph_number, '') || ' ' || coalesce(text, '')
+                    )
+                ) STORED
             );
-        """
+
+            -- Upgrade tables created before content hashes were stored
+            ALTER TABLE {laws} ADD COLUMN IF NOT EXISTS content_hash TEXT;
+            ALTER TABLE {paragraphs} ADD COLUMN IF NOT EXISTS content_hash TEXT;
+            -- Display text, word count and Lovdata link, computed once at ingestion
+            ALTER TABLE {paragraphs} ADD COLUMN IF NOT EXISTS clean_text TEXT;
+            ALTER TABLE {paragraphs} ADD COLUMN IF NOT EXISTS word_count INTEGER;
+            ALTER TABLE {paragraphs} ADD COLUMN IF NOT EXISTS lovdata_url TEXT;
+            -- § 1 is never retrieved, so the searches filter on a stored flag
+            ALTER TABLE {paragraphs} ADD COLUMN IF NOT EXISTS is_first_section BOOLEAN;
+            CREATE UNIQUE INDEX IF NOT EXISTS {law_id_key} ON {laws} (law_id);
+            CREATE UNIQUE INDEX IF NOT EXISTS {paragraph_id_key} ON {paragraphs} (paragraph_id);
+        """,
+                tables,
+                law_id_key=f"{tables.laws}_law_id_key",
+                paragraph_id_key=f"{tables.paragraphs}_paragraph_id_key",
+            )
         )
     conn.commit()
 
+
+# Build the lookup and vector indexes of freshly loaded tables. The vector index type
+# and parameters come from VECTOR_INDEX_METHOD etc. (see vector_indexes.py); pass
+# rebuild=True to drop existing vector indexes so changed parameters take effect.
+# VECTOR_INDEX_QUANTIZATION only applies to the paragraphs index
+def build_indexes(conn, tables=LIVE_TABLES, index_config=None, rebuild=False):
+    index_config = index_config or VectorIndexConfig.from_env()
+    table_configs = {
+        tables.laws: dataclasses.replace(index_config, quantization="none"),
+        tables.paragraphs: index_config,
+    }
+    with conn.cursor() as cur:
+        cur.execute(
+            _table_sql(
+                "CREATE INDEX IF NOT EXISTS {law_id_idx} ON {paragraphs} (law_id);",
+                tables,
+                law_id_idx=f"{tables.paragraphs}_law_id_idx",
+            )
+        )
+        cur.execute(
+            _table_sql(
+                "CREATE INDEX IF NOT EXISTS {text_search_idx} ON {paragraphs} "
+                "USING gin (text_search);",
+                tables,
+                text_search_idx=f"{tables.paragraphs}_text_search_idx",
+            )
+        )
+        for table, table_config in table_configs.items():
+            index_name = f"{table}_embedding_idx"
+            if rebuild:
+                cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(index_name)))
+
+            rows = 0
+            if table_config.method == "ivfflat" and table_config.lists is None:
+                cur.execute(
+                    sql.SQL("SELECT count(*) FROM {} WHERE embedding IS NOT NULL;").format(
+                        sql.Identifier(table)
+                    )
+                )
+                rows = cur.fetchone()[0]
+            cur.execute(vector_index_sql(table, index_name, table_config, rows))
+
+        cur.execute(_table_sql("ANALYZE {laws}; ANALYZE {paragraphs};", tables))
+    conn.commit()
+
+
+# Copy the rows of one set of tables into another, used to seed a new index version
+# with the current live data so only changed laws have to be rebuilt
+def copy_table_contents(conn, source, target):
+    with conn.cursor() as cur:
+        for source_table, target_table in zip(source, target, strict=True):
+            # Skip the serial id and generated columns, the target fills those itself
+            cur.execute(
+                """
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = current_schema() AND table_name = %s
+                    AND column_name <> 'id' AND is_generated = 'NEVER'
+                ORDER BY ordinal_position;
+            """,
+                (target_table,),
+            )
+            columns = sql.SQL(", ").join(sql.Identifier(row[0]) for row in cur.fetchall())
+            cur.execute(
+                sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {};").format(
+                    sql.Identifier(target_table), columns, columns, sql.Identifier(source_table)
+                )
+            )
+    conn.commit()
+
+
 # Extract all text from JSON into a single string
 def extract_text_from_json(data):
     parts = []
+    seen = set()
 
     if "Tittel" in data.get("metadata", {}):
         parts.append(data["metadata"]["Tittel"])
+        seen.add(data["metadata"]["Tittel"])
 
     for article in data.get("articles", []):
         for para in article.get("paragraphs", []):
-            if para and para not in parts:
+            if para and para not in seen:
                 parts.append(para)
+                seen.add(para)
     return "\n".join(parts)
 
 
-# Create embedding for given text with model
+# Law-level vector from the vectors of its paragraphs: the normalized mean, or with
+# weights (e.g. paragraph word counts) a weighted centroid
+def centroid_embedding(vectors, weights=None):
+    centroid = np.average(np.asarray(vectors, dtype=np.float32), axis=0, weights=weights)
+    norm = np.linalg.norm(centroid)
+    return (centroid / norm if norm else centroid).tolist()
+
+
+# Load stored paragraph vectors of a law as {paragraph_id: vector}
+def load_paragraph_embeddings(conn, law_id, paragraph_ids, tables=LIVE_TABLES):
+    with conn.cursor() as cur:
+        cur.execute(
+            _table_sql(
+                """
+                SELECT paragraph_id, embedding::text FROM {paragraphs}
+                WHERE law_id = %s AND paragraph_id = ANY(%s) AND embedding IS NOT NULL;
+            """,
+                tables,
+            ),
+            (law_id, list(paragraph_ids)),
+        )
+        return {paragraph_id: json.loads(vector) for paragraph_id, vector in cur.fetchall()}
+
+
+# Create embedding for given text with model, reading through the embedding cache
 def create_embedding(text):
+    cache = get_embedding_cache(EMBEDDING_MODEL_NAME, EMBEDDING_DIM)
+    if cache is not None:
+        return cache.get_or_compute([text], lambda missing: get_model().embed(missing))[0].tolist()
+
     model = get_model()
     embeddings = list(model.embed([text]))
     return embeddings[0].tolist()
 
 
-# Insert a law into the database
-def insert_law_record(conn, law_id, text, metadata, embedding):
+# Create embeddings for many texts in batches, returned in the same order as the input.
+# Texts already in the embedding cache are not sent to the model.
+def create_embeddings(texts, batch_size=EMBEDDING_BATCH_SIZE):
+    if not texts:
+        return []
+
+    def embed(missing):
+        return get_model().embed(list(missing), batch_size=batch_size)
+
+    cache = get_embedding_cache(EMBEDDING_MODEL_NAME, EMBEDDING_DIM)
+    if cache is not None:
+        return [embedding.tolist() for embedding in cache.get_or_compute(list(texts), embed)]
+    return [embedding.tolist() for embedding in embed(texts)]
+
+
+# Hits and misses of the embedding cache so far, for reporting per run
+def embedding_cache_counts():
+    cache = get_embedding_cache(EMBEDDING_MODEL_NAME, EMBEDDING_DIM)
+    if cache is None:
+        return 0, 0
+    return cache.hits, cache.misses
+
+
+# Upserts and deletes below are templates for _table_sql, so they can target the
+# shadow tables of an index version
+LAW_UPSERT_SQL = """
+    INSERT INTO {laws} (law_id, text, metadata, embedding, content_hash)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (law_id) DO UPDATE SET
+        text = EXCLUDED.text,
+        metadata = EXCLUDED.metadata,
+        embedding = EXCLUDED.embedding,
+        content_hash = EXCLUDED.content_hash
+"""
+
+# Records a law's content hash once all of its paragraphs are stored
+LAW_HASH_UPDATE_SQL = "UPDATE {laws} SET content_hash = %s WHERE law_id = %s"
+
+# Stored content hashes, of all laws when law_ids is NULL
+LAW_HASHES_SQL = """
+    SELECT law_id, content_hash FROM {laws}
+    WHERE %(law_ids)s::text[] IS NULL OR law_id = ANY(%(law_ids)s)
+"""
+PARAGRAPH_HASHES_SQL = """
+    SELECT law_id, paragraph_id, content_hash FROM {paragraphs}
+    WHERE %(law_ids)s::text[] IS NULL OR law_id = ANY(%(law_ids)s)
+"""
+
+# Multi-row upsert used with execute_values
+PARAGRAPH_UPSERT_SQL = """
+    INSERT INTO {paragraphs}
+        (paragraph_id, law_id, paragraph_number, text, metadata, embedding, content_hash,
+         clean_text, word_count, lovdata_url, is_first_section)
+    VALUES %s
+    ON CONFLICT (paragraph_id) DO UPDATE SET
+        law_id = EXCLUDED.law_id,
+        paragraph_number = EXCLUDED.paragraph_number,
+        text = EXCLUDED.text,
+        metadata = EXCLUDED.metadata,
+        embedding = EXCLUDED.embedding,
+        content_hash = EXCLUDED.content_hash,
+        clean_text = EXCLUDED.clean_text,
+        word_count = EXCLUDED.word_count,
+        lovdata_url = EXCLUDED.lovdata_url,
+        is_first_section = EXCLUDED.is_first_section
+"""
+
+# Fills the precomputed text columns of paragraphs stored before they existed
+PARAGRAPH_TEXT_BACKFILL_SQL = """
+    UPDATE {paragraphs} AS p
+    SET clean_text = v.clean_text, word_count = v.word_count, lovdata_url = v.lovdata_url,
+        is_first_section = v.is_first_section
+    FROM (VALUES %s) AS v (id, clean_text, word_count, lovdata_url, is_first_section)
+    WHERE p.id = v.id
+"""
+
+# Removes paragraphs of a law that are no longer part of its current text
+PARAGRAPH_DELETE_STALE_SQL = """
+    DELETE FROM {paragraphs}
+    WHERE law_id = %s AND NOT (paragraph_id = ANY(%s))
+"""
+
+# Remove laws, and their paragraphs, that are no longer part of the ingested corpus
+PARAGRAPH_DELETE_MISSING_LAWS_SQL = "DELETE FROM {paragraphs} WHERE NOT (law_id = ANY(%s))"
+LAW_DELETE_MISSING_SQL = "DELETE FROM {laws} WHERE NOT (law_id = ANY(%s))"
+
+
+# Convert paragraph records into rows matching PARAGRAPH_UPSERT_SQL, with the cleaned
+# text, word count, Lovdata link and § 1 flag the retriever reads instead of computing
+# per query
+def _paragraph_rows(law_id, paragraph_records):
+    return [
+        (
+            record["paragraph_id"],
+            law_id,
+            record["paragraph_number"],
+            record["text"],
+            json.dumps(record["metadata"]),
+            record["embedding"],
+            record.get("content_hash"),
+            *paragraph_text_columns(law_id, record["paragraph_number"], record["text"]),
+        )
+        for record in paragraph_records
+    ]
+
+
+# Compute the text columns of paragraphs that were stored before ingestion filled them
+# in, so unchanged laws carried over into a new index version get them too.
+# Returns the number of paragraphs updated.
+def backfill_paragraph_text(conn, tables=LIVE_TABLES, page_size=WRITE_PAGE_SIZE):
+    with conn.cursor() as cur:
+        cur.execute(
+            _table_sql(
+                "SELECT id, law_id, paragraph_number, text FROM {paragraphs} "
+                "WHERE word_count IS NULL OR is_first_section IS NULL;",
+                tables,
+            )
+        )
+        rows = [
+            (row_id, *paragraph_text_columns(law_id, paragraph_number, text))
+            for row_id, law_id, paragraph_number, text in cur.fetchall()
+        ]
+        if rows:
+            execute_values(
+                cur, _table_sql(PARAGRAPH_TEXT_BACKFILL_SQL, tables), rows, page_size=page_size
+            )
+    conn.commit()
+    if rows:
+        logging.info("Computed the display text of %s stored paragraphs", len(rows))
+    return len(rows)
+
+
+# Upsert paragraph rows one by one inside savepoints so a bad row is reported without
+# losing the rest of the batch
+def _insert_paragraph_rows_individually(conn, law_id, rows, tables=LIVE_TABLES):
+    upsert_sql = _table_sql(PARAGRAPH_UPSERT_SQL, tables)
+    stored = 0
+    with conn.cursor() as cur:
+        for row in rows:
+            cur.execute("SAVEPOINT paragraph_row")
+            try:
+                execute_values(cur, upsert_sql, [row])
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT paragraph_row")
+                logging.exception("Could not store paragraph %s for law %s: %s", row[0], law_id, e)
+            else:
+                cur.execute("RELEASE SAVEPOINT paragraph_row")
+                stored += 1
+    conn.commit()
+    return stored
+
+
+# Upsert a law together with its new or changed paragraphs in one transaction.
+# When current_paragraph_ids is given, paragraphs of the law that are not in it are
+# deleted. Falls back to per-row writes with error reporting if the batch fails; the
+# law's content hash is then only stored once every paragraph is, so a partly written
+# law is re-embedded on the next run. Returns the number of paragraphs stored.
+def write_law_with_paragraphs(
+    conn,
+    law_id,
+    text,
+    metadata,
+    embedding,
+    paragraph_records,
+    page_size=WRITE_PAGE_SIZE,
+    content_hash=None,
+    current_paragraph_ids=None,
+    tables=LIVE_TABLES,
+):
+    law_row = (law_id, text, json.dumps(metadata), embedding, content_hash)
+    rows = _paragraph_rows(law_id, paragraph_records)
+    law_upsert_sql = _table_sql(LAW_UPSERT_SQL, tables)
+    delete_stale_sql = _table_sql(PARAGRAPH_DELETE_STALE_SQL, tables)
+
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO laws (law_id, text, metadata, embedding)
-                VALUES (%s, %s, %s, %s)
-            """,
-                (law_id, text, json.dumps(metadata), embedding),
-            )
+            cur.execute(law_upsert_sql, law_row)
+            if rows:
+                execute_values(
+                    cur, _table_sql(PARAGRAPH_UPSERT_SQL, tables), rows, page_size=page_size
+                )
+            if current_paragraph_ids is not None:
+                cur.execute(delete_stale_sql, (law_id, list(current_paragraph_ids)))
         conn.commit()
+        return len(rows)
+
+    except psycopg2.Error as e:
+        conn.rollback()
+        logging.warning("Bulk write of law %s failed, retrying row by row: %s", law_id, e)
 
+    try:
+        with conn.cursor() as cur:
+            cur.execute(law_upsert_sql, (*law_row[:-1], None))
+        conn.commit()
     except Exception as e:
+        conn.rollback()
         logging.exception("Could not store law %s: %s", law_id, e)
 
+    stored = _insert_paragraph_rows_individually(conn, law_id, rows, tables)
+    complete = stored == len(rows)
+
+    if current_paragraph_ids is not None:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(delete_stale_sql, (law_id, list(current_paragraph_ids)))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            complete = False
+            logging.exception("Could not delete stale paragraphs for law %s: %s", law_id, e)
+
+    if complete and content_hash is not None:
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_table_sql(LAW_HASH_UPDATE_SQL, tables), (content_hash, law_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logging.exception("Could not store the content hash of law %s: %s", law_id, e)
+    return stored
+
+
+# Hash of everything stored for a paragraph, used to detect changed paragraphs
+def compute_paragraph_hash(record):
+    content = json.dumps(
+        [record["paragraph_number"], record["text"], record["metadata"]],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Hash of a whole law, covering its text, metadata and every paragraph hash. The law
+# embedding mode is included when it is not "text", so switching modes re-embeds laws.
+def compute_law_hash(law_text, metadata, paragraph_records, law_embedding="text"):
+    payload = [law_text, metadata, [record["content_hash"] for record in paragraph_records]]
+    if law_embedding != "text":
+        payload.append(law_embedding)
+    content = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+# Load stored content hashes as ({law_id: hash}, {law_id: {paragraph_id: hash}}),
+# optionally only for the given law_ids
+def load_content_hashes(conn, tables=LIVE_TABLES, law_ids=None):
+    law_hashes = {}
+    paragraph_hashes = {}
+    params = {"law_ids": list(law_ids) if law_ids is not None else None}
+    with conn.cursor() as cur:
+        cur.execute(_table_sql(LAW_HASHES_SQL, tables), params)
+        for law_id, content_hash in cur.fetchall():
+            law_hashes[law_id] = content_hash
+
+        cur.execute(_table_sql(PARAGRAPH_HASHES_SQL, tables), params)
+        for law_id, paragraph_id, content_hash in cur.fetchall():
+            paragraph_hashes.setdefault(law_id, {})[paragraph_id] = content_hash
+    return law_hashes, paragraph_hashes
+
+
+# Convert a Lovdata XML document into structured JSON with metadata, table of contents
+# and articles. Accepts a file path or the raw document bytes. Kept at module level so
+# it can run in the parse worker processes.
+def html_to_json_structured(source):
+    if isinstance(source, bytes):
+        soup = BeautifulSoup(source.decode("utf-8"), "html.parser")
+    else:
+        with open(source, encoding="utf-8") as f:
+            soup = BeautifulSoup(f, "html.parser")
+
+    # Extract metadata
+    metadata = {}
+    for dt, dd in zip(
+        soup.select("dl.data-document-key-info dt"),
+        soup.select("dl.data-document-key-info dd"),
+        strict=False,
+    ):
+        key = dt.get_text(strip=True)
+        if dd.find("ul"):
+            metadata[key] = [li.get_text(strip=True) for li in dd.select("li")]
+        else:
+            metadata[key] = dd.get_text(strip=True)
+
+    # Parse table of content recursively
+    def parse_toc(ul):
+        items = []
+        for li in ul.find_all("li", recursive=False):
+            parts = []
+            for child in li.contents:
+                if getattr(child, "name", None) == "ul":
+                    continue
+                if hasattr(child, "get_text"):
+                    parts.append(child.get_text(strip=True))
+                else:
+                    parts.append(str(child).strip())
+            title_text = " ".join(parts).strip()
+            item = {"title": title_text}
+            sub_ul = li.find("ul", recursive=False)
+            if sub_ul:
+                item["subsections"] = parse_toc(sub_ul)
+            items.append(item)
+        return items
+
+    toc_ul = soup.select_one("dd.table-of-contents > ul")
+    table_of_contents = parse_toc(toc_ul) if toc_ul else []
+
+    # Extract articles and paragraphs texts
+    articles = []
+    for legal_article in soup.select("article.legalArticle"):
+        article_data = {
+            "title": legal_article.get("data-name", ""),
+            "url": legal_article.get("data-lovdata-url", ""),
+            "paragraphs": [],
+        }
+
+        full_text = legal_article.get_text(" ", strip=True)
+        if full_text:
+            article_data["paragraphs"].append(full_text)
+
+        articles.append(article_data)
+
+    return {"metadata": metadata, "table_of_contents": table_of_contents, "articles": articles}
+
+
+# Parse one law file. Returns (law_id, xml_path, json_data) where json_data is None
+# if the file could not be read.
+def parse_law_file(xml_path):
+    law_id = os.path.splitext(os.path.basename(xml_path))[0]
+    try:
+        return law_id, xml_path, html_to_json_structured(xml_path)
+    except (FileNotFoundError, UnicodeDecodeError, OSError) as e:
+        logging.exception("Could not read XML %s: %s", xml_path, e)
+        return law_id, xml_path, None
+
+
+# Parse one law document streamed from an archive. Returns (law_id, None, json_data)
+# in the same shape as parse_law_file, without a file to clean up afterwards.
+def parse_law_bytes(law_id, content):
+    try:
+        return law_id, None, html_to_json_structured(content)
+    except UnicodeDecodeError as e:
+        logging.exception("Could not decode XML for %s: %s", law_id, e)
+        return law_id, None, None
+
+
+# Law id of a pipeline source, known before the source is parsed
+def source_law_id(source):
+    if isinstance(source, tuple):
+        return source[0]
+    return os.path.splitext(os.path.basename(source))[0]
+
+
+# Parse a pipeline source: an XML file path, or a (law_id, bytes) pair
+def parse_law_source(source):
+    if isinstance(source, tuple):
+        return parse_law_bytes(*source)
+    return parse_law_file(source)
+
+
+# Split the articles of a parsed law into paragraph records ready for embedding
+def build_paragraph_records(law_id, json_data):
+    paragraph_records = []
+    for idx, article in enumerate(json_data.get("articles", []), start=1):
+        article_title = article.get("title") or f"§{idx}"
+
+        for p_idx, paragraph_text in enumerate(article.get("paragraphs", []), start=1):
+            if not paragraph_text.strip():
+                continue
 
-# Insert a paragraph into the database
-def insert_paragraph_record(
-    conn, law_id, paragraph_id, paragraph_number, text, metadata, embedding
+            paragraph_records.append(
+                {
+                    "paragraph_id": f"{law_id}_p{idx}_{p_idx}",
+                    "paragraph_number": article_title,
+                    "text": paragraph_text,
+                    "metadata": {
+                        "article_title": article.get("title"),
+                        "paragraph_index": p_idx,
+                    },
+                }
+            )
+    return paragraph_records
+
+
+# Connect to the database with retries
+def connect_with_retries(db_config=None, attempts=5, delay=3):
+    for attempt in range(attempts):
+        try:
+            conn = psycopg2.connect(**(db_config or DB_CONFIG))
+            logging.info("Connected to database!")
+            return conn
+        except Exception as e:
+            logging.exception(
+                "Could not connect to database (attemp %s/%s): %s", attempt + 1, attempts, e
+            )
+            time.sleep(delay)
+    raise Exception("Could not connect to database after several attempts")
+
+
+# Consume a pipeline queue until the end marker so the producing stage never blocks
+# on a full queue after a downstream stage failed
+def _drain_queue(pipeline_queue):
+    while pipeline_queue.get() is not _END_OF_STREAM:
+        pass
+
+
+# Parse stage: parses XML files or streamed (law_id, bytes) documents in a process
+# pool and feeds the results into parsed_queue, keeping at most max_in_flight
+# documents in the pool at a time. Sources are consumed lazily, so a streamed archive
+# is only read as fast as the pipeline can take it.
+# With workers=0 the documents are parsed on the calling thread.
+# An error while reading the sources is recorded in errors for the caller to re-raise.
+def _parse_stage(sources, parsed_queue, workers, max_in_flight, errors):
+    try:
+        if workers <= 0:
+            for source in sources:
+                parsed_queue.put(parse_law_source(source))
+            return
+
+        # Spawn instead of fork, the embedding stage runs ONNX threads in this process
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+            pending = set()
+            for source in sources:
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        _put_parse_result(future, parsed_queue)
+                pending.add(pool.submit(parse_law_source, source))
+
+            for future in as_completed(pending):
+                _put_parse_result(future, parsed_queue)
+    except Exception as e:
+        logging.exception("Parse stage failed: %s", e)
+        errors.append(e)
+    finally:
+        parsed_queue.put(_END_OF_STREAM)
+
+
+# Put a finished parse result on the queue, logging failures instead of stopping the stage
+def _put_parse_result(future, parsed_queue):
+    try:
+        parsed_queue.put(future.result())
+    except Exception as e:
+        logging.exception("Could not parse law: %s", e)
+
+
+# Empty counters for an ingestion run
+def new_ingestion_stats():
+    return {
+        "laws": 0,
+        "unchanged_laws": 0,
+        "embedded_paragraphs": 0,
+        "stored_paragraphs": 0,
+        "embedding_seconds": 0.0,
+        "embedding_cache_hits": 0,
+        "embedding_cache_misses": 0,
+    }
+
+
+# Prepare the database update for one parsed law. Returns None if the law has no text
+# or could not be embedded, an "unchanged" update if its content hash matches the
+# stored one, and otherwise the law with embeddings for new or changed paragraphs only.
+# With a centroid law_embedding mode ("mean"/"weighted") the law text is not embedded;
+# the law vector is computed from the paragraph vectors instead, here when every
+# paragraph was embedded, or by write_law_update from the stored vectors otherwise.
+def prepare_law_update(
+    law_id, xml_path, json_data, content_hashes, batch_size, stats, law_embedding="text"
 ):
+    if law_embedding not in LAW_EMBEDDING_MODES:
+        raise ValueError(f"Unknown law embedding mode: {law_embedding}")
+    law_hashes, paragraph_hashes = content_hashes
+
+    # Extract text and create embedding
+    law_text = extract_text_from_json(json_data)
+    if not law_text.strip():
+        logging.warning("No text found in %s", xml_path or law_id)
+        return None
+
+    paragraph_records = build_paragraph_records(law_id, json_data)
+    for record in paragraph_records:
+        record["content_hash"] = compute_paragraph_hash(record)
+    law_hash = compute_law_hash(law_text, json_data["metadata"], paragraph_records, law_embedding)
+
+    if law_hashes.get(law_id) == law_hash:
+        stats["unchanged_laws"] += 1
+        return {"law_id": law_id, "xml_path": xml_path, "unchanged": True}
+
+    stored_hashes = paragraph_hashes.get(law_id, {})
+    changed_records = [
+        record
+        for record in paragraph_records
+        if stored_hashes.get(record["paragraph_id"]) != record["content_hash"]
+    ]
+
+    # Laws without paragraphs have nothing to average and fall back to the text
+    use_centroid = law_embedding != "text" and bool(paragraph_records)
+    weights = None
+    if law_embedding == "weighted":
+        weights = [max(1, len(record["text"].split())) for record in paragraph_records]
+
+    cache_hits, cache_misses = embedding_cache_counts()
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO paragraphs (paragraph_id, law_id, paragraph_number, text, metadata, embedding)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (paragraph_id, law_id, paragraph_number, text, json.dumps(metadata), embedding),
+        law_vector = None if use_centroid else create_embedding(law_text)
+
+        embedding_started = time.perf_counter()
+        paragraph_embeddings = create_embeddings(
+            [record["text"] for record in changed_records], batch_size=batch_size
+        )
+        stats["embedding_seconds"] += time.perf_counter() - embedding_started
+    except Exception as e:
+        logging.exception("Could not create embeddings for law %s: %s", law_id, e)
+        return None
+    finally:
+        hits, misses = embedding_cache_counts()
+        stats["embedding_cache_hits"] += hits - cache_hits
+        stats["embedding_cache_misses"] += misses - cache_misses
+
+    stats["embedded_paragraphs"] += len(changed_records)
+    for record, paragraph_embedding in zip(changed_records, paragraph_embeddings, strict=True):
+        record["embedding"] = paragraph_embedding
+
+    if use_centroid and len(changed_records) == len(paragraph_records):
+        law_vector = centroid_embedding(
+            [record["embedding"] for record in paragraph_records], weights
+        )
+
+    return {
+        "law_id": law_id,
+        "xml_path": xml_path,
+        "unchanged": False,
+        "text": law_text,
+        "metadata": json_data["metadata"],
+        "embedding": law_vector,
+        "content_hash": law_hash,
+        "paragraphs": changed_records,
+        "paragraph_ids": [record["paragraph_id"] for record in paragraph_records],
+        "paragraph_weights": weights,
+    }
+
+
+# Write a prepared law update: upserts the law with its changed paragraphs and deletes
+# the paragraphs that disappeared, with a single commit
+def write_law_update(conn, update, write_page_size, stats, tables):
+    if update["unchanged"]:
+        return
+
+    law_vector = update["embedding"]
+    if law_vector is None:
+        law_vector = _centroid_from_stored_paragraphs(conn, update, tables)
+
+    stored = write_law_with_paragraphs(
+        conn,
+        update["law_id"],
+        update["text"],
+        update["metadata"],
+        law_vector,
+        update["paragraphs"],
+        page_size=write_page_size,
+        content_hash=update["content_hash"],
+        current_paragraph_ids=update["paragraph_ids"],
+        tables=tables,
+    )
+    stats["laws"] += 1
+    stats["stored_paragraphs"] += stored
+    logging.info("Updated %s paragraphs from %s", stored, update["law_id"])
+
+
+# Law centroid for an update where only some paragraphs were re-embedded, using the
+# stored vectors of the unchanged paragraphs
+def _centroid_from_stored_paragraphs(conn, update, tables):
+    vectors = {record["paragraph_id"]: record["embedding"] for record in update["paragraphs"]}
+    unchanged_ids = [pid for pid in update["paragraph_ids"] if pid not in vectors]
+    vectors.update(load_paragraph_embeddings(conn, update["law_id"], unchanged_ids, tables))
+
+    paragraph_ids = update["paragraph_ids"]
+    if not vectors:
+        logging.warning("No paragraph vectors stored for %s, embedding its text", update["law_id"])
+        return create_embedding(update["text"])
+
+    weights = update["paragraph_weights"]
+    if weights is not None:
+        weights = [w for pid, w in zip(paragraph_ids, weights, strict=True) if pid in vectors]
+    return centroid_embedding([vectors[pid] for pid in paragraph_ids if pid in vectors], weights)
+
+
+# Embed stage: turns parsed laws into prepared updates, skipping laws whose content
+# hash is unchanged and embedding new or changed paragraphs only.
+# An error that stops the stage is recorded in errors for the caller to re-raise.
+def _embed_stage(
+    parsed_queue, write_queue, batch_size, stats, content_hashes, law_embedding, errors
+):
+    finished = False
+    try:
+        while (item := parsed_queue.get()) is not _END_OF_STREAM:
+            law_id, xml_path, json_data = item
+            if json_data is None:
+                continue
+
+            update = prepare_law_update(
+                law_id, xml_path, json_data, content_hashes, batch_size, stats, law_embedding
             )
-        conn.commit()
+            if update is not None:
+                write_queue.put(update)
+        finished = True
+    except Exception as e:
+        logging.exception("Embedding stage failed: %s", e)
+        errors.append(e)
+    finally:
+        if not finished:
+            _drain_queue(parsed_queue)
+        write_queue.put(_END_OF_STREAM)
 
+
+# Writer stage: writes each prepared update, with a single commit per law.
+# An error that stops the stage is recorded in errors for the caller to re-raise.
+def _write_stage(conn, write_queue, write_page_size, stats, tables, errors):
+    finished = False
+    try:
+        while (item := write_queue.get()) is not _END_OF_STREAM:
+            write_law_update(conn, item, write_page_size, stats, tables)
+
+            # Streamed laws never touched the disk
+            if item["xml_path"]:
+                os.remove(item["xml_path"])
+        finished = True
     except Exception as e:
-        logging.exception("Could not store paragraph %s for law %s: %s", paragraph_id, law_id, e)
+        logging.exception("Write stage failed: %s", e)
+        errors.append(e)
+    finally:
+        if not finished:
+            _drain_queue(write_queue)
+
+
+# Create the shadow tables of a new index version. Unless full_rebuild is set they are
+# seeded with the live data, so laws that are unchanged carry over without re-embedding.
+def prepare_version_tables(conn, tables, full_rebuild=False):
+    create_table_if_not_exists(conn, tables)
+    if not full_rebuild:
+        copy_table_contents(conn, LIVE_TABLES, tables)
 
 
-# Clear all data from tables
-def clear_table(conn):
+# Delete the laws of an index version that are not in law_ids, with their paragraphs, so
+# laws dropped from the corpus stop being searchable once the version is activated.
+# An empty law_ids is taken as a failed fetch rather than an empty corpus and deletes
+# nothing. Returns the number of laws deleted.
+def delete_missing_laws(conn, tables, law_ids):
+    if not law_ids:
+        logging.warning("No laws were ingested, keeping the laws of the previous version")
+        return 0
+    law_ids = list(law_ids)
     with conn.cursor() as cur:
-        cur.execute("TRUNCATE TABLE paragraphs;")
-        cur.execute("TRUNCATE TABLE laws;")
+        cur.execute(_table_sql(PARAGRAPH_DELETE_MISSING_LAWS_SQL, tables), (law_ids,))
+        cur.execute(_table_sql(LAW_DELETE_MISSING_SQL, tables), (law_ids,))
+        removed = cur.rowcount
     conn.commit()
+    if removed:
+        logging.info("Removed %s laws that are no longer ingested", removed)
+    return removed
 
 
-# Main function to process laws and store in database
-def process_laws(input_dir):
-    conn = None
+# Build the indexes of a fully written index version and swap it in as the live tables
+def finish_index_version(conn, version, tables):
+    build_indexes(conn, tables)
+    activate_index_version(conn, version)
 
-    # Try to connect to the database with retries
-    for attempt in range(5):
-        try:
-            conn = psycopg2.connect(**DB_CONFIG)
-            logging.info("Connected to database!")
-            break
-        except Exception as e:
-            logging.exception("Could not connect to database (attemp %s/5): %s", attempt + 1, e)
-            time.sleep(3)
+
+# Main function to process laws and store in database.
+# Builds a new index version in shadow tables seeded with the live data, and swaps it
+# in atomically when done so retrieval is never served from half-written tables.
+# Only laws whose content hash changed are re-embedded and written; pass
+# full_rebuild=True to start from empty tables and embed the whole corpus again.
+# Runs a pipeline of parse (process pool) -> embed (thread) -> write (calling thread)
+# stages connected by bounded queues, so parsing, ONNX inference and database writes
+# overlap while memory stays bounded by queue_size.
+# Laws are read from the XML files in input_dir, which are removed once stored, or
+# from law_stream, an iterable of (law_id, bytes) such as stream_lovdata_laws(), in
+# which case nothing is written to or read from disk.
+def process_laws(
+    input_dir=None,
+    batch_size=EMBEDDING_BATCH_SIZE,
+    write_page_size=WRITE_PAGE_SIZE,
+    parse_workers=PARSE_WORKERS,
+    queue_size=PIPELINE_QUEUE_SIZE,
+    full_rebuild=False,
+    rollback_window_hours=INDEX_ROLLBACK_WINDOW_HOURS,
+    law_stream=None,
+    law_embedding=LAW_EMBEDDING,
+):
+    if (input_dir is None) == (law_stream is None):
+        raise ValueError("Pass either input_dir or law_stream")
+
+    if law_stream is None:
+        sources = [
+            os.path.join(input_dir, file) for file in os.listdir(input_dir) if file.endswith(".xml")
+        ]
     else:
-        raise Exception("Could not connect to database after several attempts")
+        sources = law_stream
+
+    conn = connect_with_retries()
 
-    # Create tables and clear existing data
     create_table_if_not_exists(conn)
-    clear_table(conn)
+    version = begin_index_version(conn)
+    tables = version_tables(version)
+    try:
+        prepare_version_tables(conn, tables, full_rebuild)
 
-    def html_to_json_structured(html_path):
-        with open(html_path, encoding="utf-8") as f:
-            soup = BeautifulSoup(f, "html.parser")
+        stats = _run_pipeline(
+            conn,
+            sources,
+            tables,
+            batch_size,
+            write_page_size,
+            parse_workers,
+            queue_size,
+            law_embedding,
+        )
+        backfill_paragraph_text(conn, tables, write_page_size)
 
-        # Extract metadata
-        metadata = {}
-        for dt, dd in zip(
-            soup.select("dl.data-document-key-info dt"),
-            soup.select("dl.data-document-key-info dd"),
-            strict=False,
-        ):
-            key = dt.get_text(strip=True)
-            if dd.find("ul"):
-                metadata[key] = [li.get_text(strip=True) for li in dd.select("li")]
-            else:
-                metadata[key] = dd.get_text(strip=True)
-
-        # Parse table of content recursively
-        def parse_toc(ul):
-            items = []
-            for li in ul.find_all("li", recursive=False):
-                parts = []
-                for child in li.contents:
-                    if getattr(child, "name", None) == "ul":
-                        continue
-                    if hasattr(child, "get_text"):
-                        parts.append(child.get_text(strip=True))
-                    else:
-                        parts.append(str(child).strip())
-                title_text = " ".join(parts).strip()
-                item = {"title": title_text}
-                sub_ul = li.find("ul", recursive=False)
-                if sub_ul:
-                    item["subsections"] = parse_toc(sub_ul)
-                items.append(item)
-            return items
-
-        toc_ul = soup.select_one("dd.table-of-contents > ul")
-        table_of_contents = parse_toc(toc_ul) if toc_ul else []
-
-        # Extract articles and paragraphs texts
-        articles = []
-        for legal_article in soup.select("article.legalArticle"):
-            article_data = {
-                "title": legal_article.get("data-name", ""),
-                "url": legal_article.get("data-lovdata-url", ""),
-                "paragraphs": [],
-            }
-
-            full_text = legal_article.get_text(" ", strip=True)
-            if full_text:
-                article_data["paragraphs"].append(full_text)
-
-            articles.append(article_data)
-
-        return {"metadata": metadata, "table_of_contents": table_of_contents, "articles": articles}
-
-    # Process each XML file in the input directory
-    for file in os.listdir(input_dir):
-        if not file.endswith(".xml"):
-            continue
-
-        xml_path = os.path.join(input_dir, file)
-        law_id = os.path.splitext(file)[0]
+        finish_index_version(conn, version, tables)
+    except BaseException:
+        abandon_index_version(conn, version)
+        conn.close()
+        raise
 
-        try:
-            json_data = html_to_json_structured(xml_path)
-        except (FileNotFoundError, UnicodeDecodeError, OSError) as e:
-            logging.exception("Could not read XML %s: %s", file, e)
-            continue
+    drop_expired_index_versions(conn, rollback_window_hours)
+    conn.close()
 
-        # Extract text and create embedding
-        law_text = extract_text_from_json(json_data)
-        if not law_text.strip():
-            logging.warning("No text found in %s", file)
-            continue
+    stats["index_version"] = version
+    return stats
 
-        law_embedding = create_embedding(law_text)
-        insert_law_record(conn, law_id, law_text, json_data["metadata"], law_embedding)
 
-        paragraph_count = 0
+# Run the parse -> embed -> write pipeline over the given sources (XML file paths or
+# (law_id, bytes) pairs), writing into the given tables. Laws of the tables that are not
+# among the sources are deleted afterwards.
+def _run_pipeline(
+    conn,
+    sources,
+    tables,
+    batch_size,
+    write_page_size,
+    parse_workers,
+    queue_size,
+    law_embedding=LAW_EMBEDDING,
+):
+    content_hashes = load_content_hashes(conn, tables)
 
-        # Process each paragraph and generate embeddings
-        for idx, article in enumerate(json_data.get("articles", []), start=1):
-            article_title = article.get("title") or f"§{idx}"
+    parsed_queue = queue.Queue(maxsize=queue_size)
+    write_queue = queue.Queue(maxsize=queue_size)
+    stats = new_ingestion_stats()
+    errors = []
+    # Every source counts, even one that fails to parse keeps its previous version
+    law_ids = set()
 
-            for p_idx, paragraph_text in enumerate(article.get("paragraphs", []), start=1):
-                if not paragraph_text.strip():
-                    continue
+    def tracked_sources():
+        for source in sources:
+            law_ids.add(source_law_id(source))
+            yield source
 
-                paragraph_id = f"{law_id}_p{idx}_{p_idx}"
-                paragraph_embedding = create_embedding(paragraph_text)
+    started = time.perf_counter()
+    parse_thread = threading.Thread(
+        target=_parse_stage,
+        args=(
+            tracked_sources(),
+            parsed_queue,
+            parse_workers,
+            max(queue_size, parse_workers),
+            errors,
+        ),
+        name="law-parse-stage",
+        daemon=True,
+    )
+    embed_thread = threading.Thread(
+        target=_embed_stage,
+        args=(
+            parsed_queue,
+            write_queue,
+            batch_size,
+            stats,
+            content_hashes,
+            law_embedding,
+            errors,
+        ),
+        name="law-embed-stage",
+        daemon=True,
+    )
+    parse_thread.start()
+    embed_thread.start()
 
-                insert_paragraph_record(
-                    conn=conn,
-                    law_id=law_id,
-                    paragraph_id=paragraph_id,
-                    paragraph_number=article_title,
-                    text=paragraph_text,
-                    metadata={
-                        "article_title": article.get("title"),
-                        "paragraph_index": p_idx,
-                    },
-                    embedding=paragraph_embedding,
-                )
-                paragraph_count += 1
+    try:
+        _write_stage(conn, write_queue, write_page_size, stats, tables, errors)
+    finally:
+        embed_thread.join()
+        parse_thread.join()
+
+    # A failed source (e.g. a broken archive stream) or a stage that stopped early must
+    # not activate a partial index
+    if errors:
+        raise errors[0]
 
-        print(f" Added {paragraph_count} paragraphs from {law_id}")
-        os.remove(xml_path)
+    stats["removed_laws"] = delete_missing_laws(conn, tables, law_ids)
+
+    elapsed = time.perf_counter() - started
+    logging.info(
+        "Updated %s laws with %s paragraphs in %.1fs, %s laws unchanged",
+        stats["laws"],
+        stats["stored_paragraphs"],
+        elapsed,
+        stats["unchanged_laws"],
+    )
+
+    # Report embedding throughput so re-index windows can be sized
+    if stats["embedding_seconds"] > 0:
+        logging.info(
+            "Embedded %s paragraphs in %.1fs (%.1f paragraphs/s, batch size %s)",
+            stats["embedded_paragraphs"],
+            stats["embedding_seconds"],
+            stats["embedded_paragraphs"] / stats["embedding_seconds"],
+            batch_size,
+        )
+    log_embedding_cache_stats(stats)
+    return stats
+
+
+# Report how many embeddings of a run were served from the embedding cache
+def log_embedding_cache_stats(stats):
+    lookups = stats["embedding_cache_hits"] + stats["embedding_cache_misses"]
+    if lookups:
+        logging.info(
+            "Embedding cache: %s hits, %s misses (%.1f%% hit rate)",
+            stats["embedding_cache_hits"],
+            stats["embedding_cache_misses"],
+            100 * stats["embedding_cache_hits"] / lookups,
+        )
 
 
 # Main program execution
+# Pass --stream to ingest straight from the archives without writing law files to disk
 if __name__ == "__main__":
-    law_dir = "common/utils/lovdataxml"
-    fetch_lovdata_laws(standard_format_laws, out_dir=law_dir)
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    process_laws(law_dir)
+    if "--stream" in sys.argv[1:]:
+        process_laws(law_stream=stream_lovdata_laws(standard_format_laws))
+    else:
+        law_dir = "common/utils/lovdataxml"
+        fetch_lovdata_laws(standard_format_laws, out_dir=law_dir)
+        process_laws(law_dir)
@@ -0,0 +1,298 @@
+"""
+Bounded connection pool for the vector-search queries.
+
+The pool hands out at most ``max_size`` psycopg2 connections at a time. Callers beyond
+that wait up to ``checkout_timeout`` seconds for a connection to be returned and then
+fail with ``PoolTimeoutError``, so a burst of chat traffic queues up in the web workers
+instead of exhausting the connections Postgres allows.
+
+Connections run in autocommit mode with a server-side ``statement_timeout``. Idle
+connections above ``min_size`` are closed after ``idle_timeout`` seconds, and a
+connection that has been idle for a while is pinged before it is handed out again.
+The shared pool is configured from ``DATABASES["default"]`` and the ``LAW_DB_POOL_*``
+settings.
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+import psycopg2
+from psycopg2 import extensions
+
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the connection itself is broken, not the query
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+class PoolTimeoutError(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+def db_config_from_settings(alias: str = "default") -> dict:
+    """Return psycopg2 connection arguments for a database in Django's ``DATABASES``."""
+    database = settings.DATABASES[alias]
+    db_config = {
+        "dbname": database.get("NAME"),
+        "user": database.get("USER"),
+        "password": database.get("PASSWORD"),
+        "host": database.get("HOST"),
+        "port": database.get("PORT"),
+    }
+    return {key: value for key, value in db_config.items() if value not in (None, "")}
+
+
+class ConnectionPool:
+    """Thread-safe, bounded pool of autocommit psycopg2 connections."""
+
+    def __init__(
+        self,
+        db_config: dict,
+        min_size: int = 1,
+        max_size: int = 10,
+        idle_timeout: float = 300.0,
+        checkout_timeout: float = 5.0,
+        statement_timeout_ms: int = 5000,
+        health_check_after: float = 30.0,
+    ):
+        if not 0 <= min_size <= max_size or max_size < 1:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size and max_size >= 1")
+
+        self.db_config = db_config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_after = health_check_after
+
+        # Idle connections with the time they were returned, most recently used last
+        self._idle: deque[tuple[extensions.connection, float]] = deque()
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._metrics = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "wait_seconds": 0.0,
+            "created": 0,
+            "discarded": 0,
+            "failed_health_checks": 0,
+        }
+
+    def _connect(self) -> extensions.connection:
+        db_config = dict(self.db_config)
+        if self.statement_timeout_ms:
+            db_config["options"] = f"-c statement_timeout={int(self.statement_timeout_ms)}"
+        conn = psycopg2.connect(**db_config)
+        conn.autocommit = True
+        return conn
+
+    def open_pool(self) -> None:
+        """Open connections until the pool holds ``min_size`` of them."""
+        while True:
+            with self._condition:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            conn = self._create_counted()
+            self._put_idle(conn)
+
+    def _create_counted(self) -> extensions.connection:
+        """Create a connection for a slot that has already been counted in ``_size``."""
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._metrics["created"] += 1
+        return conn
+
+    def _put_idle(self, conn: extensions.connection) -> None:
+        with self._condition:
+            if self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+                return
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def _discard(self, conn: extensions.connection) -> None:
+        self._close_quietly(conn)
+        with self._condition:
+            self._size -= 1
+            self._metrics["discarded"] += 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_quietly(conn: extensions.connection) -> None:
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _prune_idle(self, now: float) -> list:
+        """Take idle connections past the idle timeout out of the pool, keeping min_size."""
+        expired = []
+        while (
+            self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout
+        ):
+            conn, _ = self._idle.popleft()
+            self._size -= 1
+            self._metrics["discarded"] += 1
+            expired.append(conn)
+        return expired
+
+    def _is_usable(self, conn: extensions.connection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            return True
+        except psycopg2.Error:
+            with self._condition:
+                self._metrics["failed_health_checks"] += 1
+            return False
+
+    def getconn(self) -> extensions.connection:
+        """Check out a connection, waiting up to ``checkout_timeout`` for a free one."""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise PoolTimeoutError("The connection pool is closed")
+                expired = self._prune_idle(time.monotonic())
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    create = False
+                elif self._size < self.max_size:
+                    self._size += 1
+                    conn, idle_since, create = None, None, True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._metrics["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"No database connection available within {self.checkout_timeout}s "
+                            f"({self.max_size} in use)"
+                        )
+                    if not waited:
+                        self._metrics["waits"] += 1
+                        waited = True
+                    self._condition.wait(remaining)
+                    continue
+
+            for expired_conn in expired:
+                self._close_quietly(expired_conn)
+
+            if create:
+                conn = self._create_counted()
+            elif not self._is_usable(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            with self._condition:
+                self._metrics["checkouts"] += 1
+                self._metrics["wait_seconds"] += time.monotonic() - started
+            return conn
+
+    def putconn(self, conn: extensions.connection, broken: bool = False) -> None:
+        """Return a connection; broken ones are closed and their slot is freed."""
+        if broken or conn.closed:
+            self._discard(conn)
+            return
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+        self._put_idle(conn)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and returns it afterwards."""
+        conn = self.getconn()
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            self.putconn(conn, broken=True)
+            raise
+        except BaseException:
+            self.putconn(conn)
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self) -> dict:
+        """Current pool size and usage counters since the pool was created."""
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                **self._metrics,
+            }
+
+    def close(self) -> None:
+        """Close idle connections and refuse new checkouts; checked out ones close on return."""
+        with self._condition:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+
+def get_connection_pool() -> ConnectionPool:
+    """Return the pool shared by this process, configured from Django settings."""
+    global _shared_pool
+    if _shared_pool is None:
+        with _shared_pool_lock:
+            if _shared_pool is None:
+                _shared_pool = ConnectionPool(
+                    db_config_from_settings(),
+                    min_size=settings.LAW_DB_POOL_MIN_SIZE,
+                    max_size=settings.LAW_DB_POOL_MAX_SIZE,
+                    idle_timeout=settings.LAW_DB_POOL_IDLE_TIMEOUT,
+                    checkout_timeout=settings.LAW_DB_POOL_CHECKOUT_TIMEOUT,
+                    statement_timeout_ms=settings.LAW_DB_STATEMENT_TIMEOUT_MS,
+                )
+    return _shared_pool
+
+
+def close_connection_pool() -> None:
+    """Close the shared pool; the next ``get_connection_pool()`` call creates a new one."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
+
+
+atexit.register(close_connection_pool)
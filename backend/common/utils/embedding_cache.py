@@ -0,0 +1,285 @@
+"""
+Persistent, content-addressed cache for text embeddings.
+
+Vectors are keyed by the SHA-256 of the text, with a separate store per embedding model.
+Each store is a fixed-size, memory-mapped float32 file holding ``max_entries`` vectors,
+plus a SQLite index that maps text keys to slots in that file and records when each
+entry was last used. A full store evicts the least recently used entry.
+
+Several processes can share a store. Every slot also records the key of the vector it
+holds, and readers check it before and after copying the vector, so a slot that another
+process evicts and overwrites mid-read is treated as a miss instead of returning the
+wrong vector. Use times are buffered and written in batches, on a best-effort basis.
+
+The cache is enabled by pointing ``EMBEDDING_CACHE_DIR`` at a writable directory.
+Ingestion (``db_client``) and query embedding (``LawRetriever``) both read through
+``get_embedding_cache()``, so paragraphs that are byte-identical across runs or laws
+are only embedded once.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Iterable, Sequence
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Vectors kept per model before the least recently used entries are evicted
+EMBEDDING_CACHE_MAX_ENTRIES = 100_000
+
+# SQLite limits the number of parameters in a single statement
+_SQLITE_BATCH_SIZE = 500
+
+# Size of the SHA-256 key stored next to each vector
+_KEY_BYTES = 32
+
+_caches: dict[tuple[str, str], EmbeddingCache | None] = {}
+_caches_lock = threading.Lock()
+
+
+def text_key(text: str) -> str:
+    """Return the content address of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _key_bytes(key: str) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+
+
+class EmbeddingCache:
+    """Memory-mapped float32 vector store with a SQLite key index and LRU eviction."""
+
+    def __init__(
+        self,
+        directory: str,
+        model_name: str,
+        dim: int,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.directory = os.path.join(directory, re.sub(r"[^A-Za-z0-9._-]+", "_", model_name))
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Use times of looked up keys that are not written to the index yet
+        self._pending_uses: dict[str, float] = {}
+
+        self._db = sqlite3.connect(
+            os.path.join(self.directory, "index.sqlite3"),
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_used REAL NOT NULL
+            );
+        """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);")
+
+        vectors_path = os.path.join(self.directory, "vectors.f32")
+        keys_path = os.path.join(self.directory, "keys.bin")
+        reuse = _has_size(
+            vectors_path, max_entries * dim * np.dtype(np.float32).itemsize
+        ) and _has_size(keys_path, max_entries * _KEY_BYTES)
+        if not reuse:
+            # A store created with another size or dimension cannot be reused
+            self._db.execute("DELETE FROM entries;")
+        mode = "r+" if reuse else "w+"
+        self._vectors = np.memmap(
+            vectors_path, dtype=np.float32, mode=mode, shape=(max_entries, dim)
+        )
+        self._keys = np.memmap(
+            keys_path, dtype=np.uint8, mode=mode, shape=(max_entries, _KEY_BYTES)
+        )
+
+    def get_many(self, texts: Sequence[str]) -> list[np.ndarray | None]:
+        """Return the cached vector for each text, or None where it is not cached."""
+        keys = [text_key(text) for text in texts]
+        with self._lock:
+            slots = {}
+            for start in range(0, len(keys), _SQLITE_BATCH_SIZE):
+                batch = keys[start : start + _SQLITE_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                slots.update(
+                    self._db.execute(
+                        f"SELECT key, slot FROM entries WHERE key IN ({placeholders});",  # noqa: S608
+                        batch,
+                    ).fetchall()
+                )
+
+            vectors = [self._read_slot(slots[key], key) if key in slots else None for key in keys]
+            now = time.time()
+            for key, vector in zip(keys, vectors, strict=True):
+                if vector is not None:
+                    self._pending_uses[key] = now
+            if len(self._pending_uses) >= _SQLITE_BATCH_SIZE:
+                self._flush_uses()
+
+            hits = sum(vector is not None for vector in vectors)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return vectors
+
+    def _read_slot(self, slot: int, key: str) -> np.ndarray | None:
+        # Writers clear a slot's key before overwriting its vector, so a key that matches
+        # both before and after the copy means the vector was not replaced in between
+        expected = _key_bytes(key)
+        if not np.array_equal(self._keys[slot], expected):
+            return None
+        vector = np.array(self._vectors[slot])
+        if not np.array_equal(self._keys[slot], expected):
+            return None
+        return vector
+
+    def _write_uses(self) -> None:
+        self._db.executemany(
+            "UPDATE entries SET last_used = ? WHERE key = ?;",
+            [(used, key) for key, used in self._pending_uses.items()],
+        )
+        self._pending_uses.clear()
+
+    def _flush_uses(self) -> None:
+        # Use times only steer eviction, losing them must not fail a lookup
+        try:
+            self._db.execute("BEGIN IMMEDIATE;")
+            try:
+                self._write_uses()
+                self._db.execute("COMMIT;")
+            except BaseException:
+                self._db.execute("ROLLBACK;")
+                raise
+        except sqlite3.Error as e:
+            logger.warning("Could not record embedding cache use times: %s", e)
+            self._pending_uses.clear()
+
+    def put_many(self, texts: Sequence[str], vectors: Iterable) -> None:
+        """Store vectors for texts, evicting the least recently used entries when full."""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE;")
+            try:
+                # Eviction below has to see the use times of this process
+                self._write_uses()
+                written = []
+                for text, vector in zip(texts, vectors, strict=True):
+                    key = text_key(text)
+                    slot = self._allocate_slot(key, now)
+                    self._keys[slot] = 0
+                    self._vectors[slot] = np.asarray(vector, dtype=np.float32)
+                    written.append((slot, key))
+                self._vectors.flush()
+                for slot, key in written:
+                    self._keys[slot] = _key_bytes(key)
+                self._keys.flush()
+                self._db.execute("COMMIT;")
+            except BaseException:
+                self._db.execute("ROLLBACK;")
+                raise
+
+    def _allocate_slot(self, key: str, now: float) -> int:
+        row = self._db.execute("SELECT slot FROM entries WHERE key = ?;", (key,)).fetchone()
+        if row:
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?;", (now, key))
+            return row[0]
+
+        (next_slot,) = self._db.execute(
+            "SELECT COALESCE(MAX(slot) + 1, 0) FROM entries;"
+        ).fetchone()
+        if next_slot < self.max_entries:
+            slot = next_slot
+        else:
+            evicted_key, slot = self._db.execute(
+                "SELECT key, slot FROM entries ORDER BY last_used LIMIT 1;"
+            ).fetchone()
+            self._db.execute("DELETE FROM entries WHERE key = ?;", (evicted_key,))
+
+        self._db.execute(
+            "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?);", (key, slot, now)
+        )
+        return slot
+
+    def get_or_compute(
+        self, texts: Sequence[str], compute: Callable[[list[str]], Iterable]
+    ) -> list[np.ndarray]:
+        """
+        Return a vector for every text, computing and storing only the missing ones.
+
+        ``compute`` is called once with the distinct texts that were not cached.
+        """
+        vectors = self.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+
+        distinct_texts = list(dict.fromkeys(texts[i] for i in missing))
+        computed = [np.asarray(vector, dtype=np.float32) for vector in compute(distinct_texts)]
+        self.put_many(distinct_texts, computed)
+
+        by_text = dict(zip(distinct_texts, computed, strict=True))
+        for i in missing:
+            vectors[i] = by_text[texts[i]]
+        return vectors
+
+    def stats(self) -> dict:
+        """Hit and miss counts of this process, and the number of stored vectors."""
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM entries;").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pending_uses:
+                self._flush_uses()
+            self._vectors.flush()
+            self._keys.flush()
+            self._db.close()
+
+
+def _has_size(path: str, size: int) -> bool:
+    return os.path.exists(path) and os.path.getsize(path) == size
+
+
+def get_embedding_cache(model_name: str, dim: int) -> EmbeddingCache | None:
+    """
+    Return the shared cache for a model, or None if caching is disabled.
+
+    The cache is disabled when ``EMBEDDING_CACHE_DIR`` is unset or empty, and when
+    the directory cannot be used (e.g. on a read-only filesystem).
+    """
+    directory = os.environ.get("EMBEDDING_CACHE_DIR")
+    if not directory:
+        return None
+
+    with _caches_lock:
+        if (directory, model_name) not in _caches:
+            try:
+                _caches[(directory, model_name)] = EmbeddingCache(directory, model_name, dim)
+            except (OSError, sqlite3.Error) as e:
+                logger.warning("Embedding cache disabled, %s is not usable: %s", directory, e)
+                _caches[(directory, model_name)] = None
+        return _caches[(directory, model_name)]
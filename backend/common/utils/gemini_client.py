@@ -1,5 +1,4 @@
 import logging
-import re
 
 from django.conf import settings
 
@@ -7,7 +6,8 @@ from google import genai
 from google.genai import types
 from google.genai.types import Content, GenerateContentConfig, Part
 
-from .law_retriever_from_database import LawRetriever
+from .law_retriever_from_database import get_law_retriever
+from .paragraph_text import count_words
 
 
 logger = logging.getLogger(__name__)
@@ -56,7 +56,7 @@ class GeminiAPIClient:
         """
         Henter relevante lover via RAG og sender dem som kontekst til Gemini.
         """
-        law_retriever = LawRetriever()
+        law_retriever = get_law_retriever()
 
         if system_instruction is None:
             system_instruction = self.system_instructions
@@ -70,13 +70,19 @@ class GeminiAPIClient:
 
         model_name = model_name or self.standard_model
 
-        laws_data = law_retriever.retrieve(prompt, k_laws=3, k_paragraphs=20)
+        # Hybrid ranking puts the relevant paragraphs first, so fewer are needed
+        k_paragraphs = settings.LAW_RETRIEVER_HYBRID_K_PARAGRAPHS if law_retriever.hybrid else 20
+        # The search stops once the paragraphs fill the context, instead of returning
+        # k_paragraphs that are then cut below
+        max_words = 400
+        laws_data = law_retriever.retrieve(
+            prompt, k_laws=3, k_paragraphs=k_paragraphs, max_words=max_words
+        )
 
         rag_context = ""
         if laws_data.get("paragraphs"):
             paragraphs_with_law_info = []
             total_words = 0
-            max_words = 400
             law_links = []
 
             for p in laws_data["paragraphs"]:
@@ -96,23 +102,14 @@ class GeminiAPIClient:
 
                 print(f"Cosine Distance: {p['cosine_distance']:.4f} - {p['paragraph_number']}")
 
-                # Build links to lovdata
-                lov_id = p["law_id"]
-
-                formatted_1 = f"{lov_id[3:7]}-{lov_id[7:9]}-{lov_id[9:12]}"
-                formtatted_2 = lov_id[12:].lstrip("0")
-                formatted = formatted_1 + formtatted_2
+                # The Lovdata link and word count are computed at ingestion
+                lov_link = p["lovdata_url"]
                 paragraph_number = p.get("paragraph_number", "").replace("§", "").strip()
-                if "sf" in lov_id:
-                    lov_link = f"https://lovdata.no/dokument/LTI/forskrift/{formatted}"
-                else:
-                    lov_link = f"https://lovdata.no/dokument/LTI/lov/{formatted}"
-                if paragraph_number:
-                    lov_link += f"/§{paragraph_number}"
 
-                para_text = f"Fra {law_title} - §{paragraph_number}: {p['text']}"
+                prefix = f"Fra {law_title} - §{paragraph_number}: "
+                para_text = prefix + p["text"]
 
-                para_words = len(re.findall(r"\w+", para_text))
+                para_words = count_words(prefix) + p["word_count"]
                 if total_words + para_words > max_words:
                     break
 
@@ -0,0 +1,268 @@
+"""
+Blue/green versioning of the vector tables used for law retrieval.
+
+Ingestion builds every new index version into shadow tables (``laws_v<n>`` and
+``paragraphs_v<n>``), builds their indexes there and then swaps them in with table
+renames inside a single transaction. ``LawRetriever`` keeps querying ``laws`` and
+``paragraphs`` and never sees empty or partially written tables. The replaced tables
+stay around under their version name for a rollback window before they are dropped.
+
+Versions and their state are tracked in the ``index_versions`` table:
+``building`` -> ``active`` -> ``retired`` -> ``dropped``, or ``failed`` when a build
+is abandoned.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import namedtuple
+
+from psycopg2 import sql
+
+
+logger = logging.getLogger(__name__)
+
+IndexTables = namedtuple("IndexTables", ["laws", "paragraphs"])
+
+# Tables queried by the retriever
+LIVE_TABLES = IndexTables("laws", "paragraphs")
+
+# How long replaced tables are kept so a bad ingestion can be rolled back
+INDEX_ROLLBACK_WINDOW_HOURS = 72
+
+
+def version_tables(version: int, live_tables: IndexTables = LIVE_TABLES) -> IndexTables:
+    """Return the shadow/retired table names for an index version."""
+    return IndexTables(*(f"{table}_v{version}" for table in live_tables))
+
+
+def create_versions_table(conn) -> None:
+    """Create the ``index_versions`` bookkeeping table if it does not exist."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS index_versions (
+                version SERIAL PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                activated_at TIMESTAMPTZ,
+                retired_at TIMESTAMPTZ
+            );
+        """
+        )
+    conn.commit()
+
+
+def get_active_index_version(conn) -> int | None:
+    """Return the active index version, or None if tables have never been versioned."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('index_versions') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute("SELECT version FROM index_versions WHERE status = 'active';")
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def get_retained_index_versions(conn) -> set[int]:
+    """Return the active version and the retired versions that can still be rolled back to."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('index_versions') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return set()
+        cur.execute("SELECT version FROM index_versions WHERE status IN ('active', 'retired');")
+        return {row[0] for row in cur.fetchall()}
+
+
+def begin_index_version(conn) -> int:
+    """Register a new index version in ``building`` state and return its number."""
+    create_versions_table(conn)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO index_versions (status) VALUES ('building') RETURNING version;")
+        version = cur.fetchone()[0]
+    conn.commit()
+    logger.info("Building index version %s", version)
+    return version
+
+
+def _rename_table(cur, old_name: str, new_name: str) -> None:
+    """Rename a table and every index named after it, so index names follow the table."""
+    cur.execute(
+        """
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s;
+    """,
+        (old_name,),
+    )
+    index_names = [row[0] for row in cur.fetchall()]
+
+    cur.execute(
+        sql.SQL("ALTER TABLE {} RENAME TO {};").format(
+            sql.Identifier(old_name), sql.Identifier(new_name)
+        )
+    )
+    for index_name in index_names:
+        if index_name.startswith(f"{old_name}_"):
+            cur.execute(
+                sql.SQL("ALTER INDEX {} RENAME TO {};").format(
+                    sql.Identifier(index_name),
+                    sql.Identifier(new_name + index_name[len(old_name) :]),
+                )
+            )
+
+
+def _swap_in(cur, version: int, previous: int, live_tables: IndexTables) -> None:
+    """Move the live tables aside as ``previous`` and rename ``version`` to live."""
+    cur.execute(
+        sql.SQL("LOCK TABLE {} IN ACCESS EXCLUSIVE MODE;").format(
+            sql.SQL(", ").join(sql.Identifier(table) for table in live_tables)
+        )
+    )
+    for live, retired, incoming in zip(
+        live_tables,
+        version_tables(previous, live_tables),
+        version_tables(version, live_tables),
+        strict=True,
+    ):
+        _rename_table(cur, live, retired)
+        _rename_table(cur, incoming, live)
+
+
+def activate_index_version(conn, version: int, live_tables: IndexTables = LIVE_TABLES) -> None:
+    """
+    Atomically swap the tables of ``version`` in as the live tables.
+
+    The current live tables are renamed to their own version name and marked
+    ``retired``. Tables that existed before versioning was introduced are registered as
+    a retired version of their own, so they can be rolled back to as well.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM index_versions WHERE status = 'active' FOR UPDATE;")
+            row = cur.fetchone()
+            if row:
+                previous = row[0]
+            else:
+                cur.execute(
+                    "INSERT INTO index_versions (status) VALUES ('retired') RETURNING version;"
+                )
+                previous = cur.fetchone()[0]
+
+            _swap_in(cur, version, previous, live_tables)
+
+            cur.execute(
+                """
+                UPDATE index_versions SET status = 'retired', retired_at = now()
+                WHERE version = %s;
+            """,
+                (previous,),
+            )
+            cur.execute(
+                """
+                UPDATE index_versions SET status = 'active', activated_at = now()
+                WHERE version = %s;
+            """,
+                (version,),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.info("Activated index version %s, version %s kept for rollback", version, previous)
+
+
+def rollback_index_version(conn, live_tables: IndexTables = LIVE_TABLES) -> int:
+    """
+    Swap the most recently retired version back in and return its number.
+
+    Raises:
+        LookupError: If there is no active version or no retired version to go back to.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM index_versions WHERE status = 'active' FOR UPDATE;")
+            active = cur.fetchone()
+            cur.execute(
+                """
+                SELECT version FROM index_versions
+                WHERE status = 'retired'
+                ORDER BY retired_at DESC, version DESC
+                LIMIT 1
+                FOR UPDATE;
+            """
+            )
+            retired = cur.fetchone()
+            if not active or not retired:
+                raise LookupError("No index version available to roll back to")
+
+            _swap_in(cur, retired[0], active[0], live_tables)
+
+            cur.execute(
+                """
+                UPDATE index_versions SET status = 'retired', retired_at = now()
+                WHERE version = %s;
+            """,
+                (active[0],),
+            )
+            cur.execute(
+                """
+                UPDATE index_versions SET status = 'active', activated_at = now()
+                WHERE version = %s;
+            """,
+                (retired[0],),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.warning("Rolled back from index version %s to %s", active[0], retired[0])
+    return retired[0]
+
+
+def _drop_version_tables(cur, version: int, live_tables: IndexTables) -> None:
+    for table in version_tables(version, live_tables):
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {};").format(sql.Identifier(table)))
+
+
+def abandon_index_version(conn, version: int, live_tables: IndexTables = LIVE_TABLES) -> None:
+    """Drop the shadow tables of a failed build and mark the version ``failed``."""
+    conn.rollback()
+    with conn.cursor() as cur:
+        _drop_version_tables(cur, version, live_tables)
+        cur.execute(
+            "UPDATE index_versions SET status = 'failed' WHERE version = %s;",
+            (version,),
+        )
+    conn.commit()
+    logger.warning("Abandoned index version %s", version)
+
+
+def drop_expired_index_versions(
+    conn,
+    rollback_window_hours: float = INDEX_ROLLBACK_WINDOW_HOURS,
+    live_tables: IndexTables = LIVE_TABLES,
+) -> list[int]:
+    """Drop retired versions older than the rollback window and return their numbers."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT version FROM index_versions
+            WHERE status = 'retired' AND retired_at < now() - make_interval(secs => %s);
+        """,
+            (rollback_window_hours * 3600,),
+        )
+        expired = [row[0] for row in cur.fetchall()]
+
+        for version in expired:
+            _drop_version_tables(cur, version, live_tables)
+            cur.execute(
+                "UPDATE index_versions SET status = 'dropped' WHERE version = %s;",
+                (version,),
+            )
+    conn.commit()
+
+    if expired:
+        logger.info("Dropped expired index versions %s", expired)
+    return expired
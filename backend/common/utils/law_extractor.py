@@ -1,14 +1,38 @@
+import hashlib
+import json
 import os
 import re
-import requests
+import shutil
 import tarfile
-from typing import List, Set
+import threading
+from collections.abc import Callable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from common.utils.artifact_cache import ArtifactCache
+
 
 # Base url for lovdata
 BASE_URL = "https://api.lovdata.no/v1/publicData"
 
+# Size of the chunks copied from an archive member to disk
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Size of the chunks read from a download response
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Number of archives downloaded at the same time
+DOWNLOAD_WORKERS = 4
+
+# Cache entry used for the conditional list request
+LIST_CACHE_FILENAME = "list.json"
+
+# Manifest in the output directory recording which archive held each law file
+LAW_SOURCES_FILENAME = "law_sources.json"
+
 # List of laws for insertion in db
-standard_format_laws: List[str] = [
+standard_format_laws: list[str] = [
     "LOV-2018-06-15-038",
     "LOV-2000-04-14-031",
     "LOV-2006-05-19-016",
@@ -29,9 +53,10 @@ standard_format_laws: List[str] = [
     "LOV-2018-06-22-083",
 ]
 
+
 # Convert standard format laws into Lovdata API filenames
-def format_laws_to_lovdata_format(laws: List[str]) -> Set[str]:
-    api_formatted_laws: Set[str] = set()
+def format_laws_to_lovdata_format(laws: list[str]) -> set[str]:
+    api_formatted_laws: set[str] = set()
     for law in laws:
         parts = law.split("-")
         if len(parts) < 4:
@@ -58,20 +83,63 @@ def format_laws_to_lovdata_format(laws: List[str]) -> Set[str]:
 
     return api_formatted_laws
 
-# Get a list of all public files from Lovdata API
-def list_public_files(timeout: float = 30.0):
+
+# Get a list of all public files from Lovdata API.
+# With a cache_dir the list is requested conditionally and reused on 304 Not Modified.
+def list_public_files(timeout: float = 30.0, cache_dir: str | None = None):
     url = f"{BASE_URL}/list"
-    r = requests.get(url, headers={"accept": "application/json"}, timeout=timeout)
-    r.raise_for_status()
-    data = r.json()
+    headers = {"accept": "application/json"}
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    if cache:
+        headers.update(cache.validator_headers(LIST_CACHE_FILENAME))
+
+    r = requests.get(url, headers=headers, timeout=timeout)
+    if cache and r.status_code == 304:
+        with open(cache.path(LIST_CACHE_FILENAME), encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        r.raise_for_status()
+        data = r.json()
+        if cache:
+            with open(cache.path(LIST_CACHE_FILENAME), "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            cache.set_metadata(
+                LIST_CACHE_FILENAME, r.headers, os.path.getsize(cache.path(LIST_CACHE_FILENAME))
+            )
     return [item for item in data if isinstance(item, dict) and "filename" in item]
 
-# Download a specific file from Lovdata API
-def download_lovdata_file(filename: str, out_dir: str = "lovdataxml", timeout: float = 180.0):
+
+# Download a specific file from Lovdata API.
+# With conditional=True, out_dir acts as an artifact cache: the file is only downloaded
+# again when the server reports a change (ETag/Last-Modified), and an interrupted
+# download is resumed with a Range request.
+# expected_size/expected_sha256 are verified once the download is complete, and
+# progress(filename, downloaded_bytes, total_bytes) is called after every chunk.
+def download_lovdata_file(
+    filename: str,
+    out_dir: str = "lovdataxml",
+    timeout: float = 180.0,
+    conditional: bool = False,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    expected_size: int | None = None,
+    expected_sha256: str | None = None,
+    progress: Callable[[str, int, int | None], None] | None = None,
+):
     if not re.fullmatch(r"[A-Za-z0-9._-]+\.(zip|tar\.bz2)", filename):
         raise ValueError(f"Illegal filename: {filename}")
 
     os.makedirs(out_dir, exist_ok=True)
+    if conditional:
+        return _download_cached(
+            ArtifactCache(out_dir),
+            filename,
+            timeout,
+            chunk_size,
+            expected_size,
+            expected_sha256,
+            progress,
+        )
+
     url = f"{BASE_URL}/get/download"
     params = {"filename": filename}
 
@@ -79,50 +147,391 @@ def download_lovdata_file(filename: str, out_dir: str = "lovdataxml", timeout: f
     with requests.get(url, params=params, stream=True, timeout=timeout) as r:
         r.raise_for_status()
         file_path = os.path.join(out_dir, filename)
+        digest = hashlib.sha256()
         with open(file_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+            _write_chunks(r, f, filename, chunk_size, digest, _content_length(r), progress)
+
+    try:
+        _verify_download(
+            filename, os.path.getsize(file_path), digest, expected_size, expected_sha256
+        )
+    except OSError:
+        os.remove(file_path)
+        raise
     return file_path
 
-# Extract selected files from a tar.bz2 archive
-def extract_selected_files(file_path: str, selected_filenames: Set[str], extract_to: str):
+
+# Conditionally download a file into the artifact cache, resuming partial downloads
+def _download_cached(
+    cache: ArtifactCache,
+    filename: str,
+    timeout: float,
+    chunk_size: int,
+    expected_size: int | None,
+    expected_sha256: str | None,
+    progress,
+    retry: bool = True,
+):
+    url = f"{BASE_URL}/get/download"
+    params = {"filename": filename}
+
+    headers = cache.resume_headers(filename)
+    resuming = bool(headers)
+    # A cached copy that does not match the published checksum is fetched again
+    if not resuming and _cache_matches(cache, filename, expected_size, expected_sha256):
+        headers = cache.validator_headers(filename)
+
+    with requests.get(url, params=params, headers=headers, stream=True, timeout=timeout) as r:
+        if r.status_code == 304:
+            print(f" {filename} not modified, using cached copy")
+            return cache.path(filename)
+
+        # The partial file no longer matches what the server has, start over
+        if r.status_code == 416 and retry:
+            cache.discard_partial(filename)
+            return _download_cached(
+                cache,
+                filename,
+                timeout,
+                chunk_size,
+                expected_size,
+                expected_sha256,
+                progress,
+                retry=False,
+            )
+
+        r.raise_for_status()
+        digest = hashlib.sha256()
+        if r.status_code == 206:
+            mode = "ab"
+            # Resume the checksum with the bytes already on disk
+            with open(cache.partial_path(filename), "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    digest.update(chunk)
+            offset = os.path.getsize(cache.partial_path(filename))
+        else:
+            mode = "wb"
+            offset = 0
+            cache.start_partial(filename, r.headers)
+        content_length = _content_length(r)
+        total = offset + content_length if content_length is not None else None
+
+        with open(cache.partial_path(filename), mode) as f:
+            _write_chunks(r, f, filename, chunk_size, digest, total, progress, offset)
+
+        # Keep an incomplete download as .part so the next run can resume it
+        size = os.path.getsize(cache.partial_path(filename))
+        if total is not None and size != total:
+            raise OSError(f"Incomplete download of {filename}: {size} of {total} bytes")
+
+        try:
+            _verify_download(filename, size, digest, expected_size, expected_sha256)
+        except OSError:
+            cache.discard_partial(filename)
+            raise
+        return cache.complete_partial(filename, r.headers, sha256=digest.hexdigest())
+
+
+# Content-Length of a response, or None if the server did not send one
+def _content_length(response) -> int | None:
+    length = response.headers.get("Content-Length")
+    return int(length) if length else None
+
+
+# Copy a streamed response to an open file while updating the checksum and progress
+def _write_chunks(response, f, filename, chunk_size, digest, total, progress, downloaded=0):
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if chunk:
+            f.write(chunk)
+            digest.update(chunk)
+            downloaded += len(chunk)
+            if progress:
+                progress(filename, downloaded, total)
+
+
+# Raise IOError if a finished download does not match the published size or checksum
+def _verify_download(filename, size, digest, expected_size, expected_sha256):
+    if expected_size is not None and size != expected_size:
+        raise OSError(f"Size mismatch for {filename}: got {size}, expected {expected_size} bytes")
+    if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+        raise OSError(f"Checksum mismatch for {filename}")
+
+
+# Check a cached file against the published size and checksum
+def _cache_matches(cache: ArtifactCache, filename, expected_size, expected_sha256) -> bool:
+    metadata = cache.get_metadata(filename)
+    if not metadata:
+        return False
+    if expected_size is not None and metadata.get("size") != expected_size:
+        return False
+    if expected_sha256 and metadata.get("sha256") != expected_sha256.lower():
+        return False
+    return True
+
+
+# Walk a streamed tar archive and yield (name, file object) for every selected file.
+# Stops reading as soon as every selected file has been seen, so the rest of the
+# archive is never decompressed.
+def _iter_selected_members(tar: tarfile.TarFile, selected_filenames: set[str]):
+    remaining = set(selected_filenames)
+    if not remaining:
+        return
+
+    for m in tar:
+        name = os.path.basename(m.name)
+        if name not in remaining or not m.isfile():
+            continue
+
+        extracted_file = tar.extractfile(m)
+        if extracted_file:
+            yield name, extracted_file
+            remaining.discard(name)
+
+        if not remaining:
+            break
+
+
+# Extract selected files from a tar.bz2 archive in a single streaming pass.
+# Members are copied to disk in chunks and reading stops as soon as every selected
+# file has been found. Returns the set of extracted filenames.
+def extract_selected_files(
+    file_path: str, selected_filenames: set[str], extract_to: str
+) -> set[str]:
     os.makedirs(extract_to, exist_ok=True)
-    with tarfile.open(file_path, "r:bz2") as tar:
-        count = 0
-        for m in tar.getmembers():
-            name = os.path.basename(m.name)
-            if name in selected_filenames and m.isfile():
-                extracted_file = tar.extractfile(m)
-                if extracted_file:
-                    out_path = os.path.join(extract_to, name)
-                    with open(out_path, "wb") as f_out:
-                        f_out.write(extracted_file.read())
-                    count += 1
-
-# Fetch and extract all desired laws from Lovdata
-def fetch_lovdata_laws(standard_format_laws: List[str], out_dir: str, show_progress=False):
+    extracted: set[str] = set()
+    if not selected_filenames:
+        return extracted
+
+    with tarfile.open(file_path, "r|bz2") as tar:
+        for name, extracted_file in _iter_selected_members(tar, selected_filenames):
+            out_path = os.path.join(extract_to, name)
+            with open(out_path, "wb") as f_out:
+                shutil.copyfileobj(extracted_file, f_out, COPY_CHUNK_SIZE)
+            extracted.add(name)
+    return extracted
+
+
+# Read selected files from a tar.bz2 stream (an open file or an HTTP response body)
+# and yield (filename, bytes) without writing anything to disk
+def iter_selected_laws(fileobj, selected_filenames: set[str]) -> Iterator[tuple[str, bytes]]:
+    with tarfile.open(fileobj=fileobj, mode="r|bz2") as tar:
+        for name, extracted_file in _iter_selected_members(tar, selected_filenames):
+            yield name, extracted_file.read()
+
+
+# Yield (filename, bytes) for the selected files in one archive. A complete copy in
+# cache_dir is revalidated with a conditional request and read from disk while the
+# server reports it unchanged, otherwise the archive is decompressed straight from
+# the HTTP response.
+def _stream_archive_laws(
+    filename: str, selected_filenames: set[str], cache_dir: str | None, timeout: float
+):
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+    headers = cache.validator_headers(filename) if cache else {}
+
+    url = f"{BASE_URL}/get/download"
+    with requests.get(
+        url, params={"filename": filename}, headers=headers, stream=True, timeout=timeout
+    ) as r:
+        if headers and r.status_code == 304:
+            with open(cache.path(filename), "rb") as f:
+                yield from iter_selected_laws(f, selected_filenames)
+            return
+
+        r.raise_for_status()
+        r.raw.decode_content = True
+        yield from iter_selected_laws(r.raw, selected_filenames)
+
+
+# Stream the desired laws from the Lovdata archives as (law_id, bytes) pairs, for
+# ingestion without a writable law directory. Nothing is written to disk unless
+# cache_dir is given, in which case the file list is cached and previously cached
+# archives are read locally while they are still current. Stops opening archives
+# once every law has been found.
+def stream_lovdata_laws(
+    standard_format_laws: list[str],
+    cache_dir: str | None = None,
+    timeout: float = 180.0,
+) -> Iterator[tuple[str, bytes]]:
+    wanted_files = format_laws_to_lovdata_format(standard_format_laws)
+    found: set[str] = set()
+
+    for item in list_public_files(cache_dir=cache_dir):
+        filename = item["filename"]
+        remaining = wanted_files - found
+        if not remaining:
+            break
+        if not filename.endswith(".tar.bz2"):
+            continue
+
+        for name, content in _stream_archive_laws(filename, remaining, cache_dir, timeout):
+            found.add(name)
+            yield os.path.splitext(name)[0], content
+
+    missing = wanted_files - found
+    if missing:
+        print(" These files were not found:")
+        for name in sorted(missing):
+            print(f"  - {name}")
+
+
+# Read the law file -> archive manifest written by earlier runs
+def load_law_sources(out_dir: str) -> dict[str, str]:
+    try:
+        with open(os.path.join(out_dir, LAW_SOURCES_FILENAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+# Store which archive held each law file so later runs can go straight to it
+def save_law_sources(out_dir: str, law_sources: dict[str, str]):
+    with open(os.path.join(out_dir, LAW_SOURCES_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(law_sources, f, indent=2, sort_keys=True)
+
+
+# Raised from the progress callback to stop downloads that are no longer needed
+class DownloadCancelledError(Exception):
+    pass
+
+
+# Print download progress in steps of roughly ten percent
+def _print_progress():
+    reported: dict[str, int] = {}
+    lock = threading.Lock()
+
+    def progress(filename: str, downloaded: int, total: int | None):
+        if not total:
+            return
+        step = downloaded * 10 // total
+        with lock:
+            if step <= reported.get(filename, -1):
+                return
+            reported[filename] = step
+        print(f"  {filename}: {downloaded * 100 // total}% of {total} bytes")
+
+    return progress
+
+
+# Download archives on a bounded thread pool and extract the wanted laws from each
+# archive as soon as its download finishes. Remaining downloads are cancelled once
+# every wanted law has been found; their partial files are kept for the next run.
+def _fetch_archives(
+    archives: list[dict],
+    wanted_files: set[str],
+    law_sources: dict[str, str],
+    out_dir: str,
+    cache_dir: str,
+    workers: int,
+    chunk_size: int,
+    show_progress: bool,
+):
+    cancelled = threading.Event()
+    print_progress = _print_progress() if show_progress else None
+
+    def progress(filename, downloaded, total):
+        if cancelled.is_set():
+            raise DownloadCancelledError(filename)
+        if print_progress:
+            print_progress(filename, downloaded, total)
+
+    def download(item):
+        return download_lovdata_file(
+            item["filename"],
+            out_dir=cache_dir,
+            conditional=True,
+            chunk_size=chunk_size,
+            expected_size=item.get("size") if isinstance(item.get("size"), int) else None,
+            expected_sha256=item.get("sha256"),
+            progress=progress,
+        )
+
+    pending = iter(archives)
+    in_flight = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        while True:
+            while len(in_flight) < max(1, workers) and not wanted_files <= law_sources.keys():
+                item = next(pending, None)
+                if item is None:
+                    break
+                in_flight[executor.submit(download, item)] = item["filename"]
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = in_flight.pop(future)
+                remaining = wanted_files - law_sources.keys()
+                if not remaining:
+                    continue
+                file_path = future.result()
+                for name in extract_selected_files(file_path, remaining, extract_to=out_dir):
+                    law_sources[name] = filename
+            if wanted_files <= law_sources.keys():
+                break
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Fetch and extract all desired laws from Lovdata.
+# Archives are kept in cache_dir (default: <out_dir>/archives) and only downloaded
+# again when they changed on the server. Up to download_workers archives are
+# downloaded at the same time and each one is extracted as soon as it is complete.
+# Archives known to hold wanted laws are read first, and no further archives are
+# fetched once every wanted law has been found.
+# Returns a mapping from law filename to the archive it was found in.
+def fetch_lovdata_laws(
+    standard_format_laws: list[str],
+    out_dir: str,
+    show_progress=False,
+    cache_dir: str | None = None,
+    download_workers: int = DOWNLOAD_WORKERS,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+):
     print("Looking for laws ...")
     os.makedirs(out_dir, exist_ok=True)
+    cache_dir = cache_dir or os.path.join(out_dir, "archives")
 
     wanted_files = format_laws_to_lovdata_format(standard_format_laws)
-    files = list_public_files()
+    known_sources = load_law_sources(out_dir)
+    preferred_archives = {known_sources[name] for name in wanted_files if name in known_sources}
+
+    archives = [
+        item
+        for item in list_public_files(cache_dir=cache_dir)
+        if item["filename"].endswith(".tar.bz2")
+    ]
+    preferred = [item for item in archives if item["filename"] in preferred_archives]
+    others = [item for item in archives if item["filename"] not in preferred_archives]
+
+    # Known archives go first on their own, so nothing else is downloaded when the
+    # manifest is still accurate
+    law_sources: dict[str, str] = {}
+    for group in (preferred, others):
+        _fetch_archives(
+            group,
+            wanted_files,
+            law_sources,
+            out_dir,
+            cache_dir,
+            download_workers,
+            chunk_size,
+            show_progress,
+        )
+
+    if law_sources:
+        save_law_sources(out_dir, {**known_sources, **law_sources})
 
-    for item in files:
-        filename = item["filename"]
-        if filename.endswith(".tar.bz2"):
-            file_path = os.path.join(out_dir, filename)
-            if not os.path.exists(file_path):
-                download_lovdata_file(filename, out_dir=out_dir)
-
-            extract_selected_files(file_path, wanted_files, extract_to=out_dir)
-            os.remove(file_path)
-    
     available_filenames = set(f for f in os.listdir(out_dir) if f in wanted_files)
     missing = wanted_files - available_filenames
 
     print(f" Found {len(available_filenames)} of {len(wanted_files)} wanted files.")
+    for name in sorted(law_sources):
+        print(f"  - {name} (from {law_sources[name]})")
     if missing:
         print(" These files were not found:")
         for name in sorted(missing):
             print(f"  - {name}")
+    return law_sources
@@ -1,22 +1,207 @@
-import re
+import atexit
+import copy
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
 
 import psycopg2
 from fastembed import TextEmbedding
 
+from common.utils.db_pool import (
+    CONNECTION_ERRORS,
+    ConnectionPool,
+    PoolTimeoutError,
+    get_connection_pool,
+)
+from common.utils.embedding_cache import get_embedding_cache
+from common.utils.index_versions import get_active_index_version
+from common.utils.memory_vector_index import UNVERSIONED, MemoryVectorIndex
+from common.utils.paragraph_text import FIRST_SECTION_SQL, paragraph_text_columns
+from common.utils.vector_indexes import (
+    VECTOR_QUANTIZATIONS,
+    quantized_distance_sql,
+    search_settings_sql,
+)
 
-class LawRetriever:
-    def __init__(self, db_config=None, model_name="BAAI/bge-small-en-v1.5"):
-        if db_config is None:
-            db_config = {
-                "dbname": "CDP_Trondheim_Kommune",
-                "user": "CDP_Trondheim_Kommune",
-                "password": "password",
-                "host": "db",
-                "port": "5432",
-            }
 
-        self.conn = psycopg2.connect(**db_config)
+logger = logging.getLogger(__name__)
+
+# Query vectors kept in memory per retriever, so repeated questions skip the model
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# Reciprocal rank fusion: a paragraph scores 1 / (RRF_K + rank) in each ranking it is in
+RRF_K = 60
+# Paragraphs taken from each of the full-text and vector rankings before they are fused
+HYBRID_CANDIDATES = 50
+
+# Where the vector searches run: in Postgres, or on a memory-mapped copy of the embeddings
+RETRIEVER_BACKENDS = ("pgvector", "numpy")
+
+# The paragraphs of the laws in %(law_ids)s, which retrieve() and retrieve_many() both
+# rank exactly. Materializing them keeps the planner from using the HNSW index and
+# filtering afterwards, which can return fewer than k_paragraphs rows.
+LAW_PARAGRAPHS_CTE = f"""
+    candidates AS MATERIALIZED (
+        SELECT paragraph_id, paragraph_number, coalesce(clean_text, text) AS text,
+               metadata, law_id, word_count, lovdata_url, embedding
+        FROM paragraphs
+        WHERE law_id = ANY(%(law_ids)s) AND embedding IS NOT NULL
+              AND NOT {FIRST_SECTION_SQL}
+    )
+"""  # noqa: S608
+
+_shared_retriever = None
+_shared_retriever_lock = threading.Lock()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize unicode and whitespace, so trivially different prompts share a vector."""
+    return " ".join(unicodedata.normalize("NFKC", prompt).split())
+
+
+class LawRetriever:
+    def __init__(
+        self,
+        db_config=None,
+        model_name="BAAI/bge-small-en-v1.5",
+        pool=None,
+        query_cache_size=QUERY_EMBEDDING_CACHE_SIZE,
+        ef_search=None,
+        probes=None,
+        single_query=None,
+        backend=None,
+        hybrid=None,
+        result_cache=None,
+        quantization=None,
+        rerank_factor=None,
+    ):
+        # Queries go through the process-wide pool configured from Django settings,
+        # unless a pool or explicit connection settings are given
+        self._owns_pool = pool is None and db_config is not None
+        if pool is None and db_config is not None:
+            pool = ConnectionPool(db_config)
+        self._pool = pool
+        # Recall/latency trade-off of the HNSW and IVFFlat index scans
+        self.ef_search = ef_search or settings.VECTOR_SEARCH_EF_SEARCH
+        self.probes = probes or settings.VECTOR_SEARCH_PROBES
+        # Route to laws and search their paragraphs in one statement instead of two
+        self.single_query = (
+            settings.LAW_RETRIEVER_SINGLE_QUERY if single_query is None else single_query
+        )
+        # Fuse Norwegian full-text rank with vector distance when searching paragraphs
+        self.hybrid = settings.LAW_RETRIEVER_HYBRID if hybrid is None else hybrid
+        backend = backend or settings.LAW_RETRIEVER_BACKEND
+        if backend not in RETRIEVER_BACKENDS:
+            raise ValueError(
+                f"Unknown retriever backend {backend!r}, expected one of "
+                f"{', '.join(RETRIEVER_BACKENDS)}"
+            )
+        self.backend = backend
+        # Paragraph index built on halfvec or bit(384) (VECTOR_INDEX_QUANTIZATION): searches
+        # read rerank_factor times as many candidates from it and rerank them exactly
+        quantization = quantization or settings.VECTOR_INDEX_QUANTIZATION
+        if quantization not in VECTOR_QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown vector quantization {quantization!r}, expected one of "
+                f"{', '.join(VECTOR_QUANTIZATIONS)}"
+            )
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor or settings.VECTOR_SEARCH_RERANK_FACTOR
+        self.vector_index = None
+        if backend == "numpy":
+            self.vector_index = MemoryVectorIndex(
+                self.pool,
+                settings.LAW_VECTOR_SNAPSHOT_DIR,
+                settings.LAW_INDEX_VERSION_CHECK_INTERVAL,
+            )
+        self.model_name = model_name
         self.model = TextEmbedding(model_name=model_name)
+        self.embedding_cache = get_embedding_cache(model_name, 384)
+
+        self.query_cache_size = query_cache_size
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self._query_vectors = OrderedDict()
+        self._query_vectors_lock = threading.Lock()
+
+        # Alias of the Django cache that stores whole results, empty to disable it
+        self.result_cache_alias = (
+            settings.LAW_RETRIEVER_RESULT_CACHE if result_cache is None else result_cache
+        )
+        self.result_cache_timeout = settings.LAW_RETRIEVER_RESULT_CACHE_TIMEOUT
+        self.result_cache_hits = 0
+        self.result_cache_misses = 0
+        self.result_cache_seconds_saved = 0.0
+        self._result_cache_lock = threading.Lock()
+        self._index_version = None
+        self._index_version_expires = 0.0
+
+    def _fetchall(self, query: str, params: tuple, search_limit: int | None = None) -> list:
+        """
+        Run a query on a pooled connection, retrying once if the connection was lost.
+
+        Vector searches pass ``search_limit`` so the query runs in a transaction with the
+        index search parameters set for it alone.
+        """
+        try:
+            return self._execute(query, params, search_limit)
+        except CONNECTION_ERRORS as e:
+            # The pool has dropped the broken connection, so this checks out a new one
+            logger.warning("Law database connection lost, retrying: %s", e)
+            return self._execute(query, params, search_limit)
+
+    def _execute(self, query: str, params: tuple, search_limit: int | None) -> list:
+        with self.pool.connection() as conn, conn.cursor() as cur:
+            if search_limit is None:
+                cur.execute(query, params)
+                return cur.fetchall()
+
+            # Pooled connections are in autocommit mode, so open the transaction explicitly
+            cur.execute("BEGIN;")
+            cur.execute(search_settings_sql(self.ef_search, self.probes, search_limit))
+            cur.execute(query, params)
+            rows = cur.fetchall()
+            cur.execute("COMMIT;")
+            return rows
+
+    def health_check(self) -> bool:
+        """Check that the database answers, reconnecting once if the connection is broken."""
+        try:
+            return self._fetchall("SELECT 1;", ()) == [(1,)]
+        except (psycopg2.Error, PoolTimeoutError) as e:
+            logger.error("Law database health check failed: %s", e)
+            return False
+
+    @property
+    def pool(self) -> ConnectionPool:
+        """
+        The pool queries run on. The shared pool is looked up on first use, so a retriever
+        that only builds queries, as inside ``AsyncLawRetriever``, never creates it.
+        """
+        if self._pool is None:
+            self._pool = get_connection_pool()
+        return self._pool
+
+    def warm_up(self) -> bool:
+        """Load the embedding model and open the pool before the first request needs them."""
+        next(iter(self.model.embed(["oppvarming"])))
+        try:
+            self.pool.open_pool()
+        except psycopg2.Error as e:
+            logger.error("Could not open the law database pool: %s", e)
+        return self.health_check()
+
+    def close(self) -> None:
+        """Close the retriever's own pool; the shared pool is closed when the process exits."""
+        if self._owns_pool:
+            self.pool.close()
 
     def retrieve(
         self,
@@ -26,24 +211,94 @@ class LawRetriever:
         law_id: int | None = None,
         skip_law_search: bool = False,
         distance_threshold: float = 0.27,
+        per_law_limit: int | None = None,
+        max_words: int | None = None,
     ) -> dict:
         """
         Hovedmetode for å hente relevante lover og/eller paragrafer.
         Hvis skip_law_search=True, hopper den over lov-søk og søker direkte i alle paragrafer.
         Hvis law_id er satt, søker den kun i paragrafer fra den loven.
+        Med single_query slås lov-søk og paragraf-søk sammen til én spørring, og
+        per_law_limit begrenser hvor mange paragrafer hver lov kan bidra med.
+        Med hybrid rangeres paragrafene etter både fulltekstsøk og vektoravstand.
+        Avstandsgrensen og utelatelsen av § 1 gjøres i SQL, så k_paragraphs gjelder
+        paragrafene som faktisk returneres. Med max_words stopper søket når paragrafene
+        til sammen har minst så mange ord.
+        Resultatet caches per indeksversjon når LAW_RETRIEVER_RESULT_CACHE er satt.
         """
         if not prompt.strip():
             return {}
 
+        arguments = {
+            "k_laws": k_laws,
+            "k_paragraphs": k_paragraphs,
+            "law_id": law_id,
+            "skip_law_search": skip_law_search,
+            "distance_threshold": distance_threshold,
+            "per_law_limit": per_law_limit,
+            "max_words": max_words,
+        }
+        if not self.result_cache_alias:
+            return self._retrieve(prompt, **arguments)
+
+        cache = caches[self.result_cache_alias]
+        key = self.result_cache_key(prompt, arguments)
+        # Each cache backend raises its own errors, and none of them may fail a search
+        try:
+            cached = cache.get(key)
+        except Exception:  # noqa: BLE001
+            logger.warning("Law retrieval cache is unavailable", exc_info=True)
+            return self._retrieve(prompt, **arguments)
+
+        if cached is not None:
+            self.record_result_cache_hit(cached["seconds"])
+            return cached["result"]
+
+        started = time.perf_counter()
+        result = self._retrieve(prompt, **arguments)
+        self.record_result_cache_misses(1)
+        try:
+            cache.set(
+                key,
+                {"result": result, "seconds": time.perf_counter() - started},
+                self.result_cache_timeout,
+            )
+        except Exception:  # noqa: BLE001
+            logger.warning("Could not store law retrieval result in the cache", exc_info=True)
+        return result
+
+    def _retrieve(
+        self,
+        prompt: str,
+        k_laws: int,
+        k_paragraphs: int | None,
+        law_id: int | None,
+        skip_law_search: bool,
+        distance_threshold: float,
+        per_law_limit: int | None,
+        max_words: int | None,
+        query_vec: list | None = None,
+    ) -> dict:
         result = {}
+        # Embedded once and shared by the law and paragraph searches
+        if query_vec is None:
+            query_vec = self.embed_query(prompt)
 
         if skip_law_search:
             result["laws"] = []
-            result["paragraphs"] = self._retrieve_paragraphs(prompt, None, k_paragraphs)
+            result["paragraphs"] = self._retrieve_paragraphs_from_laws(
+                query_vec, None, k_paragraphs, distance_threshold, prompt, max_words
+            )
             return result
 
+        paragraphs = None
         if law_id is None:
-            law_results = self._retrieve_laws(prompt, k_laws)
+            if self.single_query and self.vector_index is None and not self.hybrid:
+                law_results, paragraphs = self._retrieve_laws_and_paragraphs(
+                    query_vec, k_laws, k_paragraphs, distance_threshold, per_law_limit, max_words
+                )
+            else:
+                law_results = self._retrieve_laws(query_vec, k_laws)
             if not law_results:
                 return {"laws": [], "paragraphs": []}
 
@@ -56,94 +311,828 @@ class LawRetriever:
             result["laws"] = [{"law_id": law_id}]
             law_ids = [law_id]
 
-        # Retrieve paragraphs from all relevant laws
-        paragraphs = self._retrieve_paragraphs_from_laws(
-            prompt, law_ids, k_paragraphs, distance_threshold
+        if paragraphs is None:
+            # Retrieve paragraphs from all relevant laws
+            paragraphs = self._retrieve_paragraphs_from_laws(
+                query_vec, law_ids, k_paragraphs, distance_threshold, prompt, max_words
+            )
+        return self.assemble_result(result["laws"], paragraphs)
+
+    @staticmethod
+    def assemble_result(laws: list[dict], paragraphs: list[dict]) -> dict:
+        """The result dict of ``retrieve()`` from the found laws and formatted paragraphs."""
+        return {
+            "laws": laws,
+            "paragraphs": paragraphs,
+            # Combine paragraphs into one text
+            "paragraphs_text": "\n\n".join(
+                [f"{p['paragraph_number']}: {p['text']}" for p in paragraphs]
+            ),
+        }
+
+    def retrieve_many(
+        self,
+        prompts: list[str],
+        k_laws: int = 3,
+        k_paragraphs: int | None = None,
+        law_id: int | None = None,
+        skip_law_search: bool = False,
+        distance_threshold: float = 0.27,
+        per_law_limit: int | None = None,
+        max_words: int | None = None,
+    ) -> list[dict]:
+        """
+        Henter lover og paragrafer for flere spørsmål på én gang.
+        Gir samme resultat per spørsmål som retrieve(), men alle spørsmål embeddes i én
+        batch, og lov-søket og paragraf-søket kjøres som én spørring hver for hele batchen.
+        Paragrafene i de funnede lovene søkes eksakt, slik som i retrieve().
+        """
+        arguments = {
+            "k_laws": k_laws,
+            "k_paragraphs": k_paragraphs,
+            "law_id": law_id,
+            "skip_law_search": skip_law_search,
+            "distance_threshold": distance_threshold,
+            "per_law_limit": per_law_limit,
+            "max_words": max_words,
+        }
+        results = [{} for _ in prompts]
+
+        # Positions of every distinct prompt, so repeats in a batch are retrieved once
+        pending = {}
+        for position, prompt in enumerate(prompts):
+            if prompt.strip():
+                pending.setdefault(normalize_prompt(prompt), []).append(position)
+
+        cache = caches[self.result_cache_alias] if self.result_cache_alias else None
+        keys = {}
+        if cache is not None and pending:
+            keys = {prompt: self.result_cache_key(prompt, arguments) for prompt in pending}
+            # As in retrieve(), no cache backend error may fail the search
+            try:
+                cached = cache.get_many(list(keys.values()))
+            except Exception:  # noqa: BLE001
+                logger.warning("Law retrieval cache is unavailable", exc_info=True)
+                cache, cached = None, {}
+            for prompt in list(pending):
+                entry = cached.get(keys[prompt])
+                if entry is None:
+                    continue
+                for repeat, position in enumerate(pending.pop(prompt)):
+                    results[position] = (
+                        copy.deepcopy(entry["result"]) if repeat else entry["result"]
+                    )
+                self.record_result_cache_hit(entry["seconds"])
+
+        if not pending:
+            return results
+
+        started = time.perf_counter()
+        computed = self._retrieve_batch(list(pending), **arguments)
+        seconds_per_prompt = (time.perf_counter() - started) / len(pending)
+        for prompt, result in zip(pending, computed, strict=True):
+            # Repeated prompts get their own copy, so changing one result leaves the others
+            for repeat, position in enumerate(pending[prompt]):
+                results[position] = copy.deepcopy(result) if repeat else result
+
+        if cache is not None:
+            self.record_result_cache_misses(len(pending))
+            try:
+                cache.set_many(
+                    {
+                        keys[prompt]: {"result": result, "seconds": seconds_per_prompt}
+                        for prompt, result in zip(pending, computed, strict=True)
+                    },
+                    self.result_cache_timeout,
+                )
+            except Exception:  # noqa: BLE001
+                logger.warning("Could not store law retrieval results in the cache", exc_info=True)
+        return results
+
+    def _retrieve_batch(
+        self,
+        prompts: list[str],
+        k_laws: int,
+        k_paragraphs: int | None,
+        law_id: int | None,
+        skip_law_search: bool,
+        distance_threshold: float,
+        per_law_limit: int | None,
+        max_words: int | None,
+    ) -> list[dict]:
+        query_vecs = self.embed_queries(prompts)
+
+        if self.vector_index is not None or self.hybrid or self.single_query:
+            # These searches have no batched statement; the batch embedding is still shared
+            return [
+                self._retrieve(
+                    prompt,
+                    k_laws,
+                    k_paragraphs,
+                    law_id,
+                    skip_law_search,
+                    distance_threshold,
+                    per_law_limit,
+                    max_words,
+                    query_vec=query_vec,
+                )
+                for prompt, query_vec in zip(prompts, query_vecs, strict=True)
+            ]
+
+        if skip_law_search:
+            paragraphs = self._retrieve_paragraphs_batch(
+                query_vecs, None, k_paragraphs, distance_threshold, max_words
+            )
+            return [{"laws": [], "paragraphs": found} for found in paragraphs]
+
+        if law_id is None:
+            law_results = self._retrieve_laws_batch(query_vecs, k_laws)
+            laws = [
+                [{"law_id": law_id, "metadata": law_metadata} for law_id, law_metadata in rows]
+                for rows in law_results
+            ]
+            law_ids = [[law_id for law_id, _ in rows] for rows in law_results]
+        else:
+            laws = [[{"law_id": law_id}] for _ in prompts]
+            law_ids = [[law_id] for _ in prompts]
+
+        # Prompts without any matching law get no paragraph search, as in retrieve()
+        searched = [i for i, ids in enumerate(law_ids) if ids]
+        paragraphs = self._retrieve_paragraphs_batch(
+            [query_vecs[i] for i in searched],
+            [law_ids[i] for i in searched],
+            k_paragraphs,
+            distance_threshold,
+            max_words,
         )
-        result["paragraphs"] = paragraphs
+        found = dict(zip(searched, paragraphs, strict=True))
+        return [
+            self.assemble_result(laws[i], found[i])
+            if i in found
+            else {"laws": [], "paragraphs": []}
+            for i in range(len(prompts))
+        ]
+
+    def _active_index_version(self) -> int:
+        """The active index version, looked up at most every LAW_INDEX_VERSION_CHECK_INTERVAL."""
+        now = time.monotonic()
+        if self._index_version is None or now >= self._index_version_expires:
+            with self.pool.connection() as conn:
+                self._index_version = get_active_index_version(conn) or UNVERSIONED
+            self._index_version_expires = now + settings.LAW_INDEX_VERSION_CHECK_INTERVAL
+        return self._index_version
 
-        # Combine paragraphs into one text
-        result["paragraphs_text"] = "\n\n".join(
-            [f"{p['paragraph_number']}: {p['text']}" for p in paragraphs]
+    def result_cache_key(
+        self, prompt: str, arguments: dict, index_version: int | None = None
+    ) -> str:
+        """
+        Cache key of a result, tagged with the active index version so entries of a
+        replaced version are never read again and expire on their own. The version is
+        looked up unless the caller already knows it.
+        """
+        identity = json.dumps(
+            [
+                normalize_prompt(prompt),
+                arguments,
+                self.model_name,
+                self.backend,
+                self.single_query,
+                self.hybrid,
+                self.quantization,
+            ],
+            sort_keys=True,
+            default=str,
         )
+        digest = hashlib.sha256(identity.encode("utf-8")).hexdigest()
+        if index_version is None:
+            index_version = self._active_index_version()
+        return f"law_retriever:v{index_version}:{digest}"
 
-        return result
+    def result_cache_stats(self) -> dict:
+        """Hit rate of the result cache in this process and the retrieval time it saved."""
+        with self._result_cache_lock:
+            lookups = self.result_cache_hits + self.result_cache_misses
+            return {
+                "hits": self.result_cache_hits,
+                "misses": self.result_cache_misses,
+                "hit_rate": self.result_cache_hits / lookups if lookups else 0.0,
+                "seconds_saved": self.result_cache_seconds_saved,
+            }
+
+    def record_result_cache_hit(self, seconds_saved: float) -> None:
+        """Count a result served from the result cache in ``result_cache_stats()``."""
+        with self._result_cache_lock:
+            self.result_cache_hits += 1
+            self.result_cache_seconds_saved += seconds_saved
+
+    def record_result_cache_misses(self, count: int) -> None:
+        """Count results that had to be retrieved because the cache did not have them."""
+        with self._result_cache_lock:
+            self.result_cache_misses += count
+
+    def embed_query(self, prompt: str) -> list:
+        """The query vector of one prompt, see ``embed_queries()``."""
+        return self.embed_queries([prompt])[0]
+
+    def embed_queries(self, prompts: list[str]) -> list[list]:
+        """
+        Embed prompts, reading through the in-memory LRU of recent prompts first and then
+        the on-disk embedding cache when it is enabled. The remaining prompts are embedded
+        in one batch.
+        """
+        prompts = [normalize_prompt(prompt) for prompt in prompts]
+        query_vecs = {}
+        with self._query_vectors_lock:
+            for prompt in prompts:
+                query_vec = self._query_vectors.get(prompt)
+                if query_vec is not None:
+                    self._query_vectors.move_to_end(prompt)
+                    self.query_cache_hits += 1
+                    query_vecs[prompt] = query_vec
+            missing = list(dict.fromkeys(p for p in prompts if p not in query_vecs))
+            self.query_cache_misses += len(missing)
+
+        if missing:
+            if self.embedding_cache is not None:
+                vectors = self.embedding_cache.get_or_compute(missing, self.model.embed)
+            else:
+                vectors = self.model.embed(missing)
+            computed = [vector.tolist() for vector in vectors]
+
+            with self._query_vectors_lock:
+                for prompt, query_vec in zip(missing, computed, strict=True):
+                    self._query_vectors[prompt] = query_vec
+                    self._query_vectors.move_to_end(prompt)
+                while len(self._query_vectors) > self.query_cache_size:
+                    self._query_vectors.popitem(last=False)
+            query_vecs.update(zip(missing, computed, strict=True))
+
+        return [query_vecs[prompt] for prompt in prompts]
 
-    def _retrieve_laws(self, prompt: str, k_laws: int):
-        query_vec = next(iter(self.model.embed([prompt]))).tolist()
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT law_id, metadata
+    def query_cache_stats(self) -> dict:
+        """Hit and miss counts of the in-memory query embedding cache."""
+        with self._query_vectors_lock:
+            lookups = self.query_cache_hits + self.query_cache_misses
+            return {
+                "hits": self.query_cache_hits,
+                "misses": self.query_cache_misses,
+                "hit_rate": self.query_cache_hits / lookups if lookups else 0.0,
+                "entries": len(self._query_vectors),
+                "max_entries": self.query_cache_size,
+            }
+
+    def _retrieve_laws(self, query_vec: list, k_laws: int):
+        if self.vector_index is not None:
+            return self.vector_index.search_laws(query_vec, k_laws)
+        return self._fetchall(*self.laws_query(query_vec, k_laws))
+
+    def laws_query(self, query_vec: list, k_laws: int) -> tuple:
+        """``(query, params, search_limit)`` of the law search, for either database driver."""
+        query = """
+            SELECT law_id, metadata
+            FROM laws
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> (%s)::vector(384)
+            LIMIT %s;
+        """
+        return query, (query_vec, k_laws), k_laws
+
+    def _retrieve_laws_batch(self, query_vecs: list[list], k_laws: int) -> list[list]:
+        """``_retrieve_laws`` for every query vector, in one statement."""
+        rows = self._fetchall(
+            """
+            SELECT q.query_index, l.law_id, l.metadata
+            FROM unnest(%(query_vecs)s::vector(384)[]) WITH ORDINALITY AS q(query_vec, query_index)
+            CROSS JOIN LATERAL (
+                SELECT law_id, metadata, embedding <=> q.query_vec AS law_distance
                 FROM laws
                 WHERE embedding IS NOT NULL
-                ORDER BY embedding <=> (%s)::vector(384)
-                LIMIT %s;
-            """,
-                (query_vec, k_laws),
-            )
-            return cur.fetchall()
+                ORDER BY embedding <=> q.query_vec
+                LIMIT %(k_laws)s
+            ) l
+            ORDER BY q.query_index, l.law_distance;
+        """,
+            {"query_vecs": _vector_literals(query_vecs), "k_laws": k_laws},
+            search_limit=k_laws,
+        )
+        return _group_by_query(rows, len(query_vecs))
+
+    def _retrieve_paragraphs_batch(
+        self,
+        query_vecs: list[list],
+        law_ids: list[list] | None,
+        k_paragraphs: int | None,
+        distance_threshold: float,
+        max_words: int | None = None,
+    ) -> list[list[dict]]:
+        """
+        ``_retrieve_paragraphs_from_laws`` for every query vector, in one statement.
+        ``law_ids`` holds the laws to search for each query, or is None to search all.
+        """
+        if not query_vecs:
+            return []
+
+        params = {
+            "query_vecs": _vector_literals(query_vecs),
+            "law_ids": None,
+            "k_paragraphs": k_paragraphs,
+            "rerank_candidates": self._rerank_candidates(k_paragraphs),
+            "distance_threshold": distance_threshold,
+            "max_words": max_words,
+        }
+        search_limit = k_paragraphs or 0
+        if law_ids is None:
+            query = f"""
+                SELECT query_index, paragraph_id, paragraph_number, text, metadata, law_id,
+                       cosine_distance, word_count, lovdata_url
+                FROM (
+                    SELECT q.query_index, p.*,
+                           sum(p.word_count) OVER (
+                               PARTITION BY q.query_index ORDER BY p.cosine_distance
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                           ) AS words_before
+                    FROM unnest(%(query_vecs)s::vector(384)[])
+                        WITH ORDINALITY AS q(query_vec, query_index)
+                    CROSS JOIN LATERAL (
+                        SELECT paragraph_id, paragraph_number, coalesce(clean_text, text) AS text,
+                               metadata, law_id, embedding <=> q.query_vec AS cosine_distance,
+                               word_count, lovdata_url
+                        FROM {self._searched_paragraphs_sql("q.query_vec")}
+                        WHERE embedding IS NOT NULL AND NOT {FIRST_SECTION_SQL}
+                        ORDER BY cosine_distance
+                        LIMIT %(k_paragraphs)s
+                    ) p
+                    WHERE p.cosine_distance <= %(distance_threshold)s
+                ) budgeted
+                WHERE %(max_words)s::int IS NULL OR coalesce(words_before, 0) < %(max_words)s
+                ORDER BY query_index, cosine_distance;
+            """  # noqa: S608
+            search_limit = params["rerank_candidates"] or search_limit
+        else:
+            # The paragraphs of every law in the batch are read once and ranked exactly, as
+            # in retrieve(), and each query keeps the paragraphs of its own laws.
+            # Arrays of different lengths cannot be unnested, so each query's laws are JSON.
+            query = f"""
+                WITH {LAW_PARAGRAPHS_CTE}
+                SELECT query_index, paragraph_id, paragraph_number, text, metadata, law_id,
+                       cosine_distance, word_count, lovdata_url
+                FROM (
+                    SELECT q.query_index, p.*,
+                           sum(p.word_count) OVER (
+                               PARTITION BY q.query_index ORDER BY p.cosine_distance
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                           ) AS words_before
+                    FROM unnest(%(query_vecs)s::vector(384)[], %(query_law_ids)s::jsonb[])
+                        WITH ORDINALITY AS q(query_vec, law_ids, query_index)
+                    CROSS JOIN LATERAL (
+                        SELECT paragraph_id, paragraph_number, text, metadata, law_id,
+                               embedding <=> q.query_vec AS cosine_distance, word_count,
+                               lovdata_url
+                        FROM candidates
+                        WHERE law_id = ANY(ARRAY(SELECT jsonb_array_elements_text(q.law_ids)))
+                        ORDER BY cosine_distance
+                        LIMIT %(k_paragraphs)s
+                    ) p
+                    WHERE p.cosine_distance <= %(distance_threshold)s
+                ) budgeted
+                WHERE %(max_words)s::int IS NULL OR coalesce(words_before, 0) < %(max_words)s
+                ORDER BY query_index, cosine_distance;
+            """  # noqa: S608
+            params["query_law_ids"] = [json.dumps(ids) for ids in law_ids]
+            params["law_ids"] = list({law_id for ids in law_ids for law_id in ids})
+        rows = self._fetchall(query, params, search_limit=search_limit)
+        return [
+            self.format_paragraphs(results) for results in _group_by_query(rows, len(query_vecs))
+        ]
 
     def _retrieve_paragraphs_from_laws(
-        self, prompt: str, law_ids: list, k_paragraphs: int, distance_threshold: float
+        self,
+        query_vec: list,
+        law_ids: list | None,
+        k_paragraphs: int,
+        distance_threshold: float,
+        prompt: str | None = None,
+        max_words: int | None = None,
     ):
-        query_vec = next(iter(self.model.embed([prompt]))).tolist()
-        with self.conn.cursor() as cur:
-            if law_ids:
-                cur.execute(
-                    """
-                    SELECT paragraph_id, paragraph_number, text, metadata, law_id,
-                           embedding <=> (%s)::vector(384) as cosine_distance
-                    FROM paragraphs
-                    WHERE law_id = ANY(%s) AND embedding IS NOT NULL
+        if self.vector_index is not None and not (self.hybrid and prompt):
+            results = self.vector_index.search_paragraphs(
+                query_vec, law_ids, k_paragraphs, distance_threshold
+            )
+            return _within_word_budget(self.format_paragraphs(results), max_words)
+        rows = self._fetchall(
+            *self.paragraphs_query(
+                query_vec, law_ids, k_paragraphs, distance_threshold, max_words, prompt
+            )
+        )
+        return self.format_paragraphs(rows)
+
+    def paragraphs_query(
+        self,
+        query_vec: list,
+        law_ids: list | None,
+        k_paragraphs: int | None,
+        distance_threshold: float,
+        max_words: int | None = None,
+        prompt: str | None = None,
+    ) -> tuple:
+        """
+        ``(query, params, search_limit)`` of the paragraph search, for either driver.
+
+        § 1 is excluded before the ``LIMIT``, so it never takes the place of a paragraph
+        that could be returned. The nearest paragraphs come in distance order, so the
+        distance threshold is applied to them afterwards, where it only cuts the tail.
+        With ``max_words`` the rows stop at the first paragraph that reaches the word
+        budget, counting the words of the paragraphs before it. With a quantized index
+        the search over all paragraphs reranks candidates from it. The paragraphs of the
+        given laws are always read through the law_id index and ranked exactly.
+        """
+        if self.hybrid and prompt:
+            return self._hybrid_paragraphs_query(
+                prompt, query_vec, law_ids, k_paragraphs, distance_threshold, max_words
+            )
+        params = {
+            "query_vec": query_vec,
+            "law_ids": law_ids or None,
+            "k_paragraphs": k_paragraphs,
+            "rerank_candidates": self._rerank_candidates(k_paragraphs),
+            "distance_threshold": distance_threshold,
+            "max_words": max_words,
+        }
+        if law_ids:
+            query = f"""
+                WITH {LAW_PARAGRAPHS_CTE}
+                SELECT paragraph_id, paragraph_number, text, metadata, law_id, cosine_distance,
+                       word_count, lovdata_url
+                FROM (
+                    SELECT nearest.*,
+                           sum(word_count) OVER (
+                               ORDER BY cosine_distance
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                           ) AS words_before
+                    FROM (
+                        SELECT paragraph_id, paragraph_number, text, metadata, law_id,
+                               embedding <=> %(query_vec)s::vector(384) AS cosine_distance,
+                               word_count, lovdata_url
+                        FROM candidates
+                        ORDER BY cosine_distance
+                        LIMIT %(k_paragraphs)s
+                    ) nearest
+                    WHERE cosine_distance <= %(distance_threshold)s
+                ) budgeted
+                WHERE %(max_words)s::int IS NULL OR coalesce(words_before, 0) < %(max_words)s
+                ORDER BY cosine_distance;
+            """  # noqa: S608
+            return query, params, k_paragraphs or 0
+        query = f"""
+            SELECT paragraph_id, paragraph_number, text, metadata, law_id, cosine_distance,
+                   word_count, lovdata_url
+            FROM (
+                SELECT nearest.*,
+                       sum(word_count) OVER (
+                           ORDER BY cosine_distance
+                           ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                       ) AS words_before
+                FROM (
+                    SELECT paragraph_id, paragraph_number, coalesce(clean_text, text) AS text,
+                           metadata, law_id,
+                           embedding <=> %(query_vec)s::vector(384) AS cosine_distance,
+                           word_count, lovdata_url
+                    FROM {self._searched_paragraphs_sql("%(query_vec)s::vector(384)")}
+                    WHERE embedding IS NOT NULL AND NOT {FIRST_SECTION_SQL}
                     ORDER BY cosine_distance
-                    LIMIT %s;
-                """,
-                    (query_vec, law_ids, k_paragraphs),
-                )
-            else:
-                cur.execute(
-                    """
-                    SELECT paragraph_id, paragraph_number, text, metadata, law_id,
-                           embedding <=> (%s)::vector(384) as cosine_distance
-                    FROM paragraphs
+                    LIMIT %(k_paragraphs)s
+                ) nearest
+                WHERE cosine_distance <= %(distance_threshold)s
+            ) budgeted
+            WHERE %(max_words)s::int IS NULL OR coalesce(words_before, 0) < %(max_words)s
+            ORDER BY cosine_distance;
+        """  # noqa: S608
+        return query, params, params["rerank_candidates"] or k_paragraphs or 0
+
+    def _rerank_candidates(self, limit: int | None) -> int | None:
+        """Paragraphs read from a quantized index to rerank down to ``limit``."""
+        if self.quantization == "none" or not limit:
+            return None
+        return limit * self.rerank_factor
+
+    def _searched_paragraphs_sql(self, query_vec: str) -> str:
+        """
+        ``FROM`` item of the paragraphs that a search orders by exact cosine distance to
+        ``query_vec``: the table itself, or with a quantized index the
+        ``%(rerank_candidates)s`` nearest paragraphs by quantized distance, read from that
+        index with the same filters. The full vectors of the candidates are still in the
+        table, so the reranked distances and the threshold applied to them are exact.
+        """
+        if self.quantization == "none":
+            return "paragraphs"
+        return f"""(
+            SELECT * FROM paragraphs
+            WHERE embedding IS NOT NULL AND NOT {FIRST_SECTION_SQL}
+                  AND (%(law_ids)s::text[] IS NULL OR law_id = ANY(%(law_ids)s))
+            ORDER BY {quantized_distance_sql(self.quantization, query_vec)}
+            LIMIT %(rerank_candidates)s
+        ) paragraphs"""  # noqa: S608
+
+    def _hybrid_paragraphs_query(
+        self,
+        prompt: str,
+        query_vec: list,
+        law_ids: list | None,
+        k_paragraphs: int | None,
+        distance_threshold: float,
+        max_words: int | None = None,
+    ) -> tuple:
+        """
+        Rank paragraphs by full-text match and by vector distance and fuse the two rankings
+        with reciprocal rank fusion.
+
+        Any of the prompt's words may match (``plainto_tsquery`` terms joined with OR), so
+        exact legal terms and paragraph numbers lift a paragraph even when the embedding
+        misses them. Paragraphs that match the words are kept regardless of the distance
+        threshold. The fused ranking is not in distance order, so the threshold is applied
+        before the ``LIMIT``.
+        """
+        query = f"""
+            WITH query AS (
+                SELECT replace(
+                    plainto_tsquery('norwegian', %(prompt)s)::text, ' & ', ' | '
+                )::tsquery AS tsquery
+            ),
+            semantic AS (
+                SELECT paragraph_id,
+                       row_number() OVER (ORDER BY cosine_distance) AS rank
+                FROM (
+                    SELECT paragraph_id,
+                           embedding <=> %(query_vec)s::vector(384) AS cosine_distance
+                    FROM {self._searched_paragraphs_sql("%(query_vec)s::vector(384)")}
+                    WHERE embedding IS NOT NULL AND NOT {FIRST_SECTION_SQL}
+                          AND (%(law_ids)s::text[] IS NULL OR law_id = ANY(%(law_ids)s))
+                    ORDER BY embedding <=> %(query_vec)s::vector(384)
+                    LIMIT %(candidates)s
+                ) nearest
+            ),
+            lexical AS (
+                SELECT paragraph_id,
+                       row_number() OVER (ORDER BY text_rank DESC) AS rank
+                FROM (
+                    SELECT paragraph_id, ts_rank_cd(text_search, query.tsquery) AS text_rank
+                    FROM paragraphs, query
+                    WHERE text_search @@ query.tsquery AND embedding IS NOT NULL
+                          AND NOT {FIRST_SECTION_SQL}
+                          AND (%(law_ids)s::text[] IS NULL OR law_id = ANY(%(law_ids)s))
+                    ORDER BY text_rank DESC
+                    LIMIT %(candidates)s
+                ) matching
+            ),
+            fused AS (
+                SELECT paragraph_id, sum(1.0 / (%(rrf_k)s + rank)) AS score,
+                       bool_or(lexical) AS lexical_match
+                FROM (
+                    SELECT paragraph_id, rank, false AS lexical FROM semantic
+                    UNION ALL
+                    SELECT paragraph_id, rank, true AS lexical FROM lexical
+                ) rankings
+                GROUP BY paragraph_id
+            ),
+            ranked AS (
+                SELECT p.paragraph_id, p.paragraph_number, coalesce(p.clean_text, p.text) AS text,
+                       p.metadata, p.law_id,
+                       p.embedding <=> %(query_vec)s::vector(384) AS cosine_distance,
+                       p.word_count, p.lovdata_url, f.score, f.lexical_match
+                FROM fused f
+                JOIN paragraphs p ON p.paragraph_id = f.paragraph_id
+            )
+            SELECT paragraph_id, paragraph_number, text, metadata, law_id, cosine_distance,
+                   word_count, lovdata_url
+            FROM (
+                SELECT top.*,
+                       sum(word_count) OVER (
+                           ORDER BY score DESC, cosine_distance
+                           ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                       ) AS words_before
+                FROM (
+                    SELECT * FROM ranked
+                    WHERE lexical_match OR cosine_distance <= %(distance_threshold)s
+                    ORDER BY score DESC, cosine_distance
+                    LIMIT %(k_paragraphs)s
+                ) top
+            ) budgeted
+            WHERE %(max_words)s::int IS NULL OR coalesce(words_before, 0) < %(max_words)s
+            ORDER BY score DESC, cosine_distance;
+        """  # noqa: S608
+        params = {
+            "prompt": normalize_prompt(prompt),
+            "query_vec": query_vec,
+            "law_ids": law_ids or None,
+            "candidates": HYBRID_CANDIDATES,
+            "rerank_candidates": self._rerank_candidates(HYBRID_CANDIDATES),
+            "rrf_k": RRF_K,
+            "k_paragraphs": k_paragraphs,
+            "distance_threshold": distance_threshold,
+            "max_words": max_words,
+        }
+        return query, params, params["rerank_candidates"] or HYBRID_CANDIDATES
+
+    def _retrieve_laws_and_paragraphs(
+        self,
+        query_vec: list,
+        k_laws: int,
+        k_paragraphs: int | None,
+        distance_threshold: float,
+        per_law_limit: int | None,
+        max_words: int | None = None,
+    ):
+        """
+        Find the top laws and their closest paragraphs in a single statement.
+
+        Returns the ``(law_id, metadata)`` rows of the top laws in rank order and the
+        formatted paragraphs, like ``_retrieve_laws`` and ``_retrieve_paragraphs_from_laws``.
+        """
+        rows = self._fetchall(
+            *self.laws_and_paragraphs_query(
+                query_vec, k_laws, k_paragraphs, per_law_limit, distance_threshold, max_words
+            )
+        )
+        return self.split_laws_and_paragraphs(rows)
+
+    def laws_and_paragraphs_query(
+        self,
+        query_vec: list,
+        k_laws: int,
+        k_paragraphs: int | None,
+        per_law_limit: int | None,
+        distance_threshold: float,
+        max_words: int | None = None,
+    ) -> tuple:
+        """``(query, params, search_limit)`` of the single-statement search."""
+        query = f"""
+            WITH top_laws AS MATERIALIZED (
+                SELECT law_id, metadata,
+                       row_number() OVER (ORDER BY law_distance) AS law_rank
+                FROM (
+                    SELECT law_id, metadata,
+                           embedding <=> %(query_vec)s::vector(384) AS law_distance
+                    FROM laws
                     WHERE embedding IS NOT NULL
-                    ORDER BY cosine_distance
-                    LIMIT %s;
-                """,
-                    (query_vec, k_paragraphs),
+                    ORDER BY embedding <=> %(query_vec)s::vector(384)
+                    LIMIT %(k_laws)s
+                ) nearest_laws
+            ),
+            ranked_paragraphs AS (
+                SELECT p.paragraph_id, p.paragraph_number, coalesce(p.clean_text, p.text) AS text,
+                       p.metadata, p.law_id,
+                       p.embedding <=> %(query_vec)s::vector(384) AS cosine_distance,
+                       p.word_count, p.lovdata_url
+                FROM paragraphs p
+                WHERE p.law_id IN (SELECT law_id FROM top_laws) AND p.embedding IS NOT NULL
+                      AND NOT {FIRST_SECTION_SQL}
+            ),
+            top_paragraphs AS (
+                SELECT * FROM (
+                    SELECT ranked_paragraphs.*,
+                           row_number() OVER (
+                               PARTITION BY law_id ORDER BY cosine_distance
+                           ) AS position_in_law
+                    FROM ranked_paragraphs
+                ) numbered
+                WHERE (%(per_law_limit)s::int IS NULL OR position_in_law <= %(per_law_limit)s)
+                      AND cosine_distance <= %(distance_threshold)s
+                ORDER BY cosine_distance
+                LIMIT %(k_paragraphs)s
+            ),
+            budgeted_paragraphs AS (
+                SELECT * FROM (
+                    SELECT top_paragraphs.*,
+                           sum(word_count) OVER (
+                               ORDER BY cosine_distance
+                               ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                           ) AS words_before
+                    FROM top_paragraphs
+                ) counted
+                WHERE %(max_words)s::int IS NULL OR coalesce(words_before, 0) < %(max_words)s
+            )
+            SELECT l.law_id, l.metadata, p.paragraph_id, p.paragraph_number, p.text,
+                   p.metadata, p.cosine_distance, p.word_count, p.lovdata_url
+            FROM top_laws l
+            LEFT JOIN budgeted_paragraphs p ON p.law_id = l.law_id
+            ORDER BY l.law_rank, p.cosine_distance;
+        """  # noqa: S608
+        params = {
+            "query_vec": query_vec,
+            "k_laws": k_laws,
+            "k_paragraphs": k_paragraphs,
+            "per_law_limit": per_law_limit,
+            "distance_threshold": distance_threshold,
+            "max_words": max_words,
+        }
+        return query, params, max(k_laws, k_paragraphs or 0)
+
+    def split_laws_and_paragraphs(self, rows: list) -> tuple:
+        """Top laws and formatted paragraphs from the rows of the single-statement search."""
+        # One row per paragraph, or a single row with NULL paragraph columns for a top law
+        # without matching paragraphs
+        law_results = []
+        for law_id, law_metadata, *_ in rows:
+            if not law_results or law_results[-1][0] != law_id:
+                law_results.append((law_id, law_metadata))
+        paragraph_rows = sorted(
+            (
+                (pid, pnum, txt, meta, law_id, distance, *precomputed)
+                for law_id, _, pid, pnum, txt, meta, distance, *precomputed in rows
+                if pid is not None
+            ),
+            key=lambda row: row[5],
+        )
+        return law_results, self.format_paragraphs(paragraph_rows)
+
+    def format_paragraphs(self, results: list) -> list[dict]:
+        """
+        Paragraph dicts from ``(paragraph_id, paragraph_number, text, metadata, law_id,
+        cosine_distance, word_count, lovdata_url)`` rows, which the searches have already
+        filtered by distance and stripped of § 1. The text, word count and link are
+        computed here only for rows stored before ingestion precomputed them.
+        """
+        paragraphs = []
+        for pid, pnum, txt, meta, law_id, similarity, *precomputed in results:
+            word_count, lovdata_url = precomputed or (None, None)
+            if word_count is None:
+                txt, word_count, lovdata_url, first_section = paragraph_text_columns(
+                    law_id, pnum, txt
                 )
-            results = cur.fetchall()
+                # Rows without the stored flag are only filtered by their number in SQL
+                if first_section:
+                    continue
+            paragraphs.append(
+                {
+                    "paragraph_id": pid,
+                    "paragraph_number": pnum,
+                    "text": txt,
+                    "metadata": meta,
+                    "law_id": law_id,
+                    "cosine_distance": float(similarity),
+                    "word_count": word_count,
+                    "lovdata_url": lovdata_url,
+                }
+            )
+        return paragraphs
 
-        # Filter by cosine distance threshold
-        results = [r for r in results if r[5] <= distance_threshold]  # r[5] is cosine_distance
 
-        # Removes first chapter "lovens formål og virkeområde"
-        results = [r for r in results if not re.match(r"^§\s*1\b", str(r[1]))]
+def _vector_literals(query_vecs: list[list]) -> list[str]:
+    """pgvector text literals, so a list of vectors can be sent as one ``vector[]``."""
+    return ["[" + ",".join(map(str, query_vec)) + "]" for query_vec in query_vecs]
 
-        return [
-            {
-                "paragraph_id": pid,
-                "paragraph_number": pnum,
-                "text": self._clean_text(txt),
-                "metadata": meta,
-                "law_id": law_id,
-                "cosine_distance": float(similarity),
-            }
-            for pid, pnum, txt, meta, law_id, similarity in results
-        ]
 
-    def _clean_text(self, text: str) -> str:
-        text = re.sub(
-            r"\b(XML generert|LegacyID|DocumentID|Departement|Publisert i|Korttittel|Tittel|Innhold|Kunngjort|Annet om dokumentet|Etat|Hjemmel|Endrer|I kraft fra)\b.*?(?=[A-ZÆØÅa-zæøå]|$)",
-            "",
-            text,
-            flags=re.DOTALL,
-        )
-        text = re.sub(r"\s+", " ", text).strip()
-        sections = re.findall(r"(§\s*\d+[a-zA-Z]*.*?)(?=(?:§|\Z))", text, flags=re.DOTALL)
-        if sections:
-            text = " ".join(sections)
-        if len(text.split()) > 600:
-            text = " ".join(text.split()[:600])
-        return text
+def _within_word_budget(paragraphs: list[dict], max_words: int | None) -> list[dict]:
+    """The leading paragraphs up to the first one that reaches ``max_words``, as in SQL."""
+    if max_words is None:
+        return paragraphs
+    words = 0
+    for position, paragraph in enumerate(paragraphs):
+        if words >= max_words:
+            return paragraphs[:position]
+        words += paragraph["word_count"]
+    return paragraphs
+
+
+def _group_by_query(rows: list, count: int) -> list[list]:
+    """Split ``(query_index, *columns)`` rows of a batch by their 1-based query index."""
+    grouped = [[] for _ in range(count)]
+    for query_index, *columns in rows:
+        grouped[query_index - 1].append(tuple(columns))
+    return grouped
+
+
+def get_law_retriever() -> LawRetriever:
+    """
+    Return the retriever shared by this process, creating it on first use.
+
+    Loading the embedding model and connecting to the database is done once per process
+    instead of once per chat request. The retriever is closed when the process exits.
+    """
+    global _shared_retriever
+    if _shared_retriever is None:
+        with _shared_retriever_lock:
+            if _shared_retriever is None:
+                _shared_retriever = LawRetriever()
+    return _shared_retriever
+
+
+def warm_up_law_retriever() -> None:
+    """Create and warm up the shared retriever, e.g. from a background thread at startup."""
+    try:
+        if not get_law_retriever().warm_up():
+            logger.warning("Law retriever warmed up, but the database is not reachable yet")
+    except Exception:
+        logger.exception("Failed to warm up the law retriever")
+
+
+def close_law_retriever() -> None:
+    """Close the shared retriever; the next ``get_law_retriever()`` call creates a new one."""
+    global _shared_retriever
+    with _shared_retriever_lock:
+        if _shared_retriever is not None:
+            _shared_retriever.close()
+            _shared_retriever = None
+
+
+atexit.register(close_law_retriever)
@@ -0,0 +1,266 @@
+"""
+Exact in-memory vector search over the ``laws`` and ``paragraphs`` embeddings.
+
+The law corpus is small enough that a matrix-vector product in the web worker is faster
+than a round trip to Postgres. ``MemoryVectorIndex`` exports the embeddings of the active
+index version once into a snapshot directory as contiguous, L2-normalized float32
+``.npy`` files and memory-maps them read-only, so every web worker on a host shares the
+same pages. The ids, paragraph numbers, texts and metadata that go with the vectors are
+kept in a JSON file next to them.
+
+The active index version is looked up at most every ``check_interval`` seconds, and the
+snapshot of a new version is exported and loaded as soon as ingestion activates it.
+Snapshots of versions that can no longer be rolled back to are deleted at that point.
+It is used by ``LawRetriever`` when ``LAW_RETRIEVER_BACKEND`` is ``numpy``.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from common.utils.index_versions import get_active_index_version, get_retained_index_versions
+from common.utils.paragraph_text import FIRST_SECTION_SQL
+
+
+logger = logging.getLogger(__name__)
+
+# Snapshot of a database whose tables were never versioned
+UNVERSIONED = 0
+
+# Seconds between checks for a newly activated index version
+DEFAULT_CHECK_INTERVAL = 30.0
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length, so a dot product gives the cosine similarity."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def cosine_distances(vectors: np.ndarray, query_vec) -> np.ndarray:
+    """Cosine distance from a query to every row of a matrix of unit vectors."""
+    query = np.asarray(query_vec, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm:
+        query = query / norm
+    return 1.0 - vectors @ query
+
+
+def top_k(distances: np.ndarray, k: int | None) -> np.ndarray:
+    """Positions of the ``k`` smallest distances in ascending order; all of them if k is None."""
+    if k is None or k >= len(distances):
+        return np.argsort(distances, kind="stable")
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    # Only the k candidates are sorted, instead of every row
+    candidates = np.argpartition(distances, k - 1)[:k]
+    return candidates[np.argsort(distances[candidates], kind="stable")]
+
+
+def _fetch_vectors(cur, query: str, dim: int) -> tuple[list, np.ndarray]:
+    cur.execute(query)
+    rows, vectors = [], []
+    for *row, vector in cur.fetchall():
+        rows.append(row)
+        vectors.append(json.loads(vector))
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), dim)
+    return rows, normalize_rows(matrix)
+
+
+def export_snapshot(conn, directory: str, dim: int = 384) -> int:
+    """
+    Write the embeddings of the active index version to ``directory/v<version>``.
+
+    The snapshot is written to a temporary directory and renamed into place, so other
+    workers never load a partial one. Returns the version that was exported.
+    """
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        version = get_active_index_version(conn) or UNVERSIONED
+        with conn.cursor() as cur:
+            laws, law_vectors = _fetch_vectors(
+                cur,
+                """
+                SELECT law_id, metadata, embedding::text FROM laws
+                WHERE embedding IS NOT NULL ORDER BY law_id;
+            """,
+                dim,
+            )
+            # § 1 is never retrieved, so it is left out of the snapshot
+            paragraphs, paragraph_vectors = _fetch_vectors(
+                cur,
+                f"""
+                SELECT paragraph_id, paragraph_number, coalesce(clean_text, text), metadata,
+                       law_id, word_count, lovdata_url, embedding::text
+                FROM paragraphs
+                WHERE embedding IS NOT NULL AND NOT {FIRST_SECTION_SQL}
+                ORDER BY law_id, paragraph_id;
+            """,  # noqa: S608
+                dim,
+            )
+        conn.commit()
+        # Read again, in case a new version was swapped in while the tables were read
+        if (get_active_index_version(conn) or UNVERSIONED) == version:
+            break
+
+    target = os.path.join(directory, f"v{version}")
+    if os.path.isdir(target):
+        return version
+
+    staging = tempfile.mkdtemp(prefix=f".v{version}-", dir=directory)
+    try:
+        np.save(os.path.join(staging, "laws.npy"), law_vectors)
+        np.save(os.path.join(staging, "paragraphs.npy"), paragraph_vectors)
+        with open(os.path.join(staging, "rows.json"), "w", encoding="utf-8") as f:
+            json.dump({"laws": laws, "paragraphs": paragraphs}, f, ensure_ascii=False)
+        os.rename(staging, target)
+    except OSError:
+        # Another worker renamed its snapshot of the same version into place first
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(target):
+            raise
+    logger.info(
+        "Exported vector snapshot of index version %s: %s laws, %s paragraphs",
+        version,
+        len(laws),
+        len(paragraphs),
+    )
+    return version
+
+
+def prune_snapshots(directory: str, keep: set[int]) -> list[int]:
+    """
+    Delete the ``v<version>`` snapshots in ``directory`` older than every version in ``keep``
+    that are not in ``keep`` themselves, and return their versions.
+
+    Newer snapshots are left alone, as they may belong to a version activated after
+    ``keep`` was read. Workers that still have a deleted snapshot memory-mapped keep
+    reading it until they load the next one.
+    """
+    if not keep:
+        return []
+    newest = max(keep)
+    pruned = []
+    for name in os.listdir(directory):
+        if not (name.startswith("v") and name[1:].isdigit()):
+            continue
+        version = int(name[1:])
+        if version < newest and version not in keep:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+            pruned.append(version)
+    if pruned:
+        logger.info("Deleted vector snapshots of index versions %s", sorted(pruned))
+    return sorted(pruned)
+
+
+class VectorSnapshot:
+    """The memory-mapped embeddings and rows of one index version."""
+
+    def __init__(self, directory: str, version: int):
+        self.version = version
+        self.law_vectors = np.load(os.path.join(directory, "laws.npy"), mmap_mode="r")
+        self.paragraph_vectors = np.load(os.path.join(directory, "paragraphs.npy"), mmap_mode="r")
+        with open(os.path.join(directory, "rows.json"), encoding="utf-8") as f:
+            rows = json.load(f)
+        # (law_id, metadata) and (paragraph_id, paragraph_number, text, metadata, law_id,
+        # word_count, lovdata_url); snapshots exported before the last two have five fields
+        self.laws = [tuple(row) for row in rows["laws"]]
+        self.paragraphs = [tuple(row) for row in rows["paragraphs"]]
+
+        # Paragraph rows of every law, so a law filter is a gather instead of a scan
+        positions = defaultdict(list)
+        for position, row in enumerate(self.paragraphs):
+            positions[row[4]].append(position)
+        self.law_paragraphs = {
+            law_id: np.asarray(rows, dtype=np.intp) for law_id, rows in positions.items()
+        }
+
+    def search_laws(self, query_vec, k: int) -> list[tuple]:
+        """``(law_id, metadata)`` of the ``k`` closest laws."""
+        distances = cosine_distances(self.law_vectors, query_vec)
+        return [self.laws[i] for i in top_k(distances, k)]
+
+    def search_paragraphs(
+        self, query_vec, law_ids: list | None, k: int | None, max_distance: float | None = None
+    ) -> list[tuple]:
+        """
+        The ``k`` closest paragraphs within ``max_distance``, of the given laws only unless
+        ``law_ids`` is empty, as ``(paragraph_id, paragraph_number, text, metadata, law_id,
+        cosine_distance, word_count, lovdata_url)``.
+        """
+        if law_ids:
+            rows = np.concatenate(
+                [self.law_paragraphs[law_id] for law_id in law_ids if law_id in self.law_paragraphs]
+                or [np.empty(0, dtype=np.intp)]
+            )
+            distances = cosine_distances(self.paragraph_vectors[rows], query_vec)
+        else:
+            rows = None
+            distances = cosine_distances(self.paragraph_vectors, query_vec)
+        if max_distance is None:
+            order = top_k(distances, k)
+        else:
+            # Only paragraphs within the threshold compete for the k places
+            within = np.flatnonzero(distances <= max_distance)
+            order = within[top_k(distances[within], k)]
+        positions = order if rows is None else rows[order]
+        return [
+            (*self.paragraphs[position][:5], float(distances[i]), *self.paragraphs[position][5:])
+            for position, i in zip(positions, order, strict=True)
+        ]
+
+
+class MemoryVectorIndex:
+    """Serves searches from the snapshot of the active index version, reloading on change."""
+
+    def __init__(
+        self,
+        pool,
+        directory: str,
+        check_interval: float = DEFAULT_CHECK_INTERVAL,
+        dim: int = 384,
+    ):
+        self.pool = pool
+        self.directory = directory
+        self.check_interval = check_interval
+        self.dim = dim
+        self._snapshot: VectorSnapshot | None = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> VectorSnapshot:
+        """The snapshot of the active index version, loading a new one when it changed."""
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now < self._next_check:
+                return self._snapshot
+
+            with self.pool.connection() as conn:
+                version = get_active_index_version(conn) or UNVERSIONED
+                if self._snapshot is None or self._snapshot.version != version:
+                    if not os.path.isdir(os.path.join(self.directory, f"v{version}")):
+                        version = export_snapshot(conn, self.directory, self.dim)
+                    self._snapshot = VectorSnapshot(
+                        os.path.join(self.directory, f"v{version}"), version
+                    )
+                    logger.info("Loaded vector snapshot of index version %s", version)
+                    prune_snapshots(self.directory, get_retained_index_versions(conn) | {version})
+            self._next_check = now + self.check_interval
+            return self._snapshot
+
+    def search_laws(self, query_vec, k: int) -> list[tuple]:
+        return self.snapshot().search_laws(query_vec, k)
+
+    def search_paragraphs(
+        self, query_vec, law_ids: list | None, k: int | None, max_distance: float | None = None
+    ) -> list[tuple]:
+        return self.snapshot().search_paragraphs(query_vec, law_ids, k, max_distance)
@@ -0,0 +1,83 @@
+"""
+Display text, word count, Lovdata link and § 1 flag of a paragraph.
+
+These only depend on the stored paragraph, so ingestion computes them once and stores
+them in the ``clean_text``, ``word_count``, ``lovdata_url`` and ``is_first_section``
+columns of ``paragraphs``. The retriever selects and filters on them directly, and only
+computes the text columns for rows stored before they existed.
+"""
+
+from __future__ import annotations
+
+import re
+
+
+# Paragraphs longer than this are cut to their first MAX_PARAGRAPH_WORDS words
+MAX_PARAGRAPH_WORDS = 600
+
+# Lovdata document metadata that ends up in the paragraph text of some laws
+_METADATA_PATTERN = re.compile(
+    r"\b(XML generert|LegacyID|DocumentID|Departement|Publisert i|Korttittel|Tittel|Innhold"
+    r"|Kunngjort|Annet om dokumentet|Etat|Hjemmel|Endrer|I kraft fra)\b"
+    r".*?(?=[A-ZÆØÅa-zæøå]|$)",
+    flags=re.DOTALL,
+)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_SECTION_PATTERN = re.compile(r"(§\s*\d+[a-zA-Z]*.*?)(?=(?:§|\Z))", flags=re.DOTALL)
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Paragraph numbers of § 1, "lovens formål og virkeområde", which is left out of results
+FIRST_SECTION_PATTERN = re.compile(r"^§\s*1\b")
+# SQL condition that is true for § 1. Rows stored before is_first_section was filled in
+# are matched on their paragraph number, like FIRST_SECTION_PATTERN does
+FIRST_SECTION_SQL = r"coalesce(is_first_section, paragraph_number ~ '^§\s*1\M', false)"
+
+LOVDATA_DOCUMENT_URL = "https://lovdata.no/dokument/LTI"
+
+
+def clean_paragraph_text(text: str) -> str:
+    """Strip Lovdata metadata and extra whitespace, keep the § sections and cap the length."""
+    text = _METADATA_PATTERN.sub("", text)
+    text = _WHITESPACE_PATTERN.sub(" ", text).strip()
+    sections = _SECTION_PATTERN.findall(text)
+    if sections:
+        text = " ".join(sections)
+    words = text.split()
+    if len(words) > MAX_PARAGRAPH_WORDS:
+        text = " ".join(words[:MAX_PARAGRAPH_WORDS])
+    return text
+
+
+def count_words(text: str) -> int:
+    """Number of words, counted the way the chat context budget counts them."""
+    return len(_WORD_PATTERN.findall(text))
+
+
+def build_lovdata_url(law_id: str, paragraph_number: str | None = None) -> str:
+    """Deep link to a law, or to one of its paragraphs, on lovdata.no."""
+    formatted = f"{law_id[3:7]}-{law_id[7:9]}-{law_id[9:12]}" + law_id[12:].lstrip("0")
+    kind = "forskrift" if "sf" in law_id else "lov"
+    url = f"{LOVDATA_DOCUMENT_URL}/{kind}/{formatted}"
+    number = (paragraph_number or "").replace("§", "").strip()
+    if number:
+        url += f"/§{number}"
+    return url
+
+
+def is_first_section(paragraph_number: str | None) -> bool:
+    """Whether the paragraph is § 1, which the retriever never returns."""
+    return bool(FIRST_SECTION_PATTERN.match(paragraph_number or ""))
+
+
+def paragraph_text_columns(law_id: str, paragraph_number: str | None, text: str) -> tuple:
+    """
+    ``(clean_text, word_count, lovdata_url, is_first_section)`` of a paragraph, as stored
+    at ingestion.
+    """
+    clean_text = clean_paragraph_text(text or "")
+    return (
+        clean_text,
+        count_words(clean_text),
+        build_lovdata_url(law_id, paragraph_number),
+        is_first_section(paragraph_number),
+    )
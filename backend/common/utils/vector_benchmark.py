@@ -0,0 +1,461 @@
+"""
+Latency and recall benchmark for the vector indexes on synthetic paragraph embeddings.
+
+For every table size a table of clustered, normalized random vectors is loaded into
+Postgres, and the same query set is run against an exact scan, an HNSW index and an
+IVFFlat index at several ``ef_search`` / ``probes`` settings. The HNSW runs are repeated
+on ``halfvec`` and binary quantized indexes, whose candidates are reranked by exact
+cosine distance like the retriever does with ``VECTOR_INDEX_QUANTIZATION``. For
+comparison the queries are also run in process against a memory-mapped matrix of the
+same vectors, like the ``numpy`` retriever backend does. The report lists index build
+(or matrix load) time, index size, p50/p99 query latency and recall@k against the exact
+neighbours.
+
+Run it against the development database with::
+
+    make docker_vector_benchmark
+
+or directly, e.g. ``python -m common.utils.vector_benchmark --sizes 10000,100000``.
+The benchmark tables are dropped afterwards unless ``--keep`` is given.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import io
+import logging
+import os
+import struct
+import tempfile
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+import numpy as np
+from psycopg2 import sql
+
+from common.utils.db_client import EMBEDDING_DIM, connect_with_retries
+from common.utils.memory_vector_index import cosine_distances, top_k
+from common.utils.vector_indexes import (
+    DEFAULT_HNSW_EF_CONSTRUCTION,
+    DEFAULT_HNSW_M,
+    DEFAULT_RERANK_FACTOR,
+    VECTOR_QUANTIZATIONS,
+    VectorIndexConfig,
+    ivfflat_lists,
+    quantized_distance_sql,
+    search_settings_sql,
+    vector_index_sql,
+)
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+DEFAULT_EF_SEARCH = (20, 40, 100, 200)
+DEFAULT_PROBES = (1, 5, 10, 40)
+
+# Vectors generated, loaded and scanned at a time, so a million rows fit in memory
+CHUNK_SIZE = 50_000
+
+# Topics the synthetic paragraphs are spread over, like paragraphs of different laws
+CLUSTERS = 200
+
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+
+
+@dataclass
+class BenchmarkResult:
+    rows: int
+    index: str
+    setting: str
+    build_seconds: float
+    # Size of the index on disk, None for the searches without one
+    index_mb: float | None
+    p50_ms: float
+    p99_ms: float
+    recall: float
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _cluster_centres(seed: int, dim: int) -> np.ndarray:
+    return _normalize(np.random.default_rng(seed).standard_normal((CLUSTERS, dim)))
+
+
+def synthetic_chunks(
+    rows: int, dim: int = EMBEDDING_DIM, seed: int = 0, chunk_size: int = CHUNK_SIZE
+) -> Iterator[tuple[int, np.ndarray]]:
+    """
+    Yield ``(first_id, vectors)`` chunks of clustered unit vectors.
+
+    Each chunk is derived from the seed and its position only, so the same data can be
+    generated again for loading and for the exact search without keeping it in memory.
+    """
+    centres = _cluster_centres(seed, dim)
+    for start in range(0, rows, chunk_size):
+        count = min(chunk_size, rows - start)
+        rng = np.random.default_rng((seed, start))
+        topics = rng.integers(0, CLUSTERS, count)
+        noise = rng.standard_normal((count, dim)) * 0.6 / np.sqrt(dim)
+        yield start, _normalize(centres[topics] + noise).astype(np.float32)
+
+
+def synthetic_queries(count: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> np.ndarray:
+    """Query vectors drawn around the same topics as the synthetic paragraphs."""
+    centres = _cluster_centres(seed, dim)
+    # A separate stream from the paragraph chunks, so queries are not copies of paragraphs
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(1,)))
+    topics = rng.integers(0, CLUSTERS, count)
+    noise = rng.standard_normal((count, dim)) * 0.6 / np.sqrt(dim)
+    return _normalize(centres[topics] + noise).astype(np.float32)
+
+
+def exact_neighbours(
+    chunks: Iterator[tuple[int, np.ndarray]], queries: np.ndarray, k: int
+) -> np.ndarray:
+    """Ids of the ``k`` nearest vectors by cosine distance for every query."""
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for first_id, vectors in chunks:
+        # Vectors are normalized, so the largest dot products are the closest
+        scores = np.concatenate([best_scores, queries @ vectors.T], axis=1)
+        chunk_ids = np.tile(np.arange(first_id, first_id + len(vectors)), (len(queries), 1))
+        ids = np.concatenate([best_ids, chunk_ids], axis=1)
+        top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+
+def recall_at_k(found: list[list[int]], expected: np.ndarray) -> float:
+    """Share of the exact neighbours that were found, averaged over the queries."""
+    hits = sum(
+        len(set(row) & set(exact.tolist())) for row, exact in zip(found, expected, strict=True)
+    )
+    return hits / expected.size if expected.size else 1.0
+
+
+def copy_payload(first_id: int, vectors: np.ndarray) -> bytes:
+    """Binary COPY data for ``(id, embedding)`` rows in pgvector's binary vector format."""
+    count, dim = vectors.shape
+    row = np.dtype(
+        [
+            ("fields", ">i2"),
+            ("id_size", ">i4"),
+            ("id", ">i4"),
+            ("vector_size", ">i4"),
+            ("dim", ">i2"),
+            ("unused", ">i2"),
+            ("values", ">f4", (dim,)),
+        ]
+    )
+    rows = np.empty(count, dtype=row)
+    rows["fields"] = 2
+    rows["id_size"] = 4
+    rows["id"] = np.arange(first_id, first_id + count)
+    rows["vector_size"] = 4 + 4 * dim
+    rows["dim"] = dim
+    rows["unused"] = 0
+    rows["values"] = vectors
+    return _COPY_HEADER + rows.tobytes() + _COPY_TRAILER
+
+
+def load_table(conn, table: str, rows: int, dim: int, seed: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            sql.SQL(
+                """
+                DROP TABLE IF EXISTS {table};
+                CREATE TABLE {table} (id INTEGER PRIMARY KEY, embedding VECTOR({dim}));
+            """
+            ).format(table=sql.Identifier(table), dim=sql.Literal(dim))
+        )
+        copy = sql.SQL("COPY {} (id, embedding) FROM STDIN WITH (FORMAT binary)").format(
+            sql.Identifier(table)
+        )
+        for first_id, vectors in synthetic_chunks(rows, dim, seed):
+            cur.copy_expert(copy.as_string(conn), io.BytesIO(copy_payload(first_id, vectors)))
+        cur.execute(sql.SQL("ANALYZE {};").format(sql.Identifier(table)))
+    conn.commit()
+
+
+def search_sql(table: str, quantization: str = "none") -> sql.Composed:
+    """
+    Nearest neighbour query on ``table``. With quantization the ``candidates`` nearest rows
+    by quantized distance are read from the quantized index and reranked exactly.
+    """
+    if quantization == "none":
+        return sql.SQL(
+            "SELECT id FROM {table} ORDER BY embedding <=> %(query_vec)s::vector LIMIT %(k)s;"
+        ).format(table=sql.Identifier(table))
+    return sql.SQL(
+        """
+        SELECT id FROM (
+            SELECT id, embedding FROM {table} ORDER BY {distance} LIMIT %(candidates)s
+        ) candidates
+        ORDER BY embedding <=> %(query_vec)s::vector LIMIT %(k)s;
+    """
+    ).format(
+        table=sql.Identifier(table),
+        distance=sql.SQL(quantized_distance_sql(quantization, "%(query_vec)s::vector")),
+    )
+
+
+def run_queries(
+    conn,
+    table: str,
+    queries: np.ndarray,
+    k: int,
+    settings: sql.Composable | None,
+    quantization: str = "none",
+    candidates: int | None = None,
+) -> tuple[list[float], list[list[int]]]:
+    """Run every query in its own transaction and return latencies (ms) and result ids."""
+    query = search_sql(table, quantization)
+    latencies, results = [], []
+    with conn.cursor() as cur:
+        for vector in queries:
+            literal = "[" + ",".join(map(str, vector.tolist())) + "]"
+            if settings is not None:
+                cur.execute(settings)
+            started = time.perf_counter()
+            cur.execute(query, {"query_vec": literal, "k": k, "candidates": candidates})
+            ids = [row[0] for row in cur.fetchall()]
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append(ids)
+            conn.commit()
+    return latencies, results
+
+
+def run_memory_queries(
+    rows: int, queries: np.ndarray, k: int, seed: int
+) -> tuple[float, list[float], list[list[int]]]:
+    """
+    Write the vectors to a memory-mapped ``.npy`` file and search it in process.
+
+    Returns the time it took to write and map the matrix, and the latencies (ms) and
+    result ids of the queries.
+    """
+    dim = queries.shape[1]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "vectors.npy")
+        started = time.perf_counter()
+        vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(rows, dim))
+        for first_id, chunk in synthetic_chunks(rows, dim, seed):
+            vectors[first_id : first_id + len(chunk)] = chunk
+        vectors.flush()
+        del vectors
+        matrix = np.load(path, mmap_mode="r")
+        load_seconds = time.perf_counter() - started
+
+        latencies, results = [], []
+        for vector in queries:
+            started = time.perf_counter()
+            ids = top_k(cosine_distances(matrix, vector), k).tolist()
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append(ids)
+        del matrix
+    return load_seconds, latencies, results
+
+
+def index_size_mb(conn, index_name: str) -> float:
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_relation_size(%s::regclass);", (index_name,))
+        return cur.fetchone()[0] / 2**20
+
+
+def _result(rows, index, setting, build_seconds, index_mb, latencies, found, expected):
+    return BenchmarkResult(
+        rows=rows,
+        index=index,
+        setting=setting,
+        build_seconds=build_seconds,
+        index_mb=index_mb,
+        p50_ms=float(np.percentile(latencies, 50)),
+        p99_ms=float(np.percentile(latencies, 99)),
+        recall=recall_at_k(found, expected),
+    )
+
+
+def benchmark_size(
+    conn,
+    rows: int,
+    queries: np.ndarray,
+    k: int,
+    ef_search_values,
+    probes_values,
+    hnsw_config: VectorIndexConfig,
+    seed: int,
+    keep: bool,
+    quantizations=(),
+    rerank_factor: int = DEFAULT_RERANK_FACTOR,
+) -> list[BenchmarkResult]:
+    dim = queries.shape[1]
+    table = f"vector_benchmark_{rows}"
+    logger.info("Loading %s synthetic vectors into %s", rows, table)
+    load_table(conn, table, rows, dim, seed)
+    expected = exact_neighbours(synthetic_chunks(rows, dim, seed), queries, k)
+
+    results = []
+    # Sequential scan baseline, exact by construction
+    latencies, found = run_queries(
+        conn, table, queries, k, sql.SQL("SET LOCAL enable_indexscan = off;")
+    )
+    results.append(_result(rows, "exact", "-", 0.0, None, latencies, found, expected))
+
+    # In-process search of the numpy backend, also exact
+    load_seconds, latencies, found = run_memory_queries(rows, queries, k, seed)
+    results.append(
+        _result(rows, "numpy (memmap)", "-", load_seconds, None, latencies, found, expected)
+    )
+
+    ivfflat_config = VectorIndexConfig(method="ivfflat", lists=ivfflat_lists(rows))
+    index_name = f"{table}_embedding_idx"
+    runs = [
+        (hnsw_config, ef_search_values, "ef_search={}"),
+        (ivfflat_config, probes_values, "probes={}"),
+    ]
+    runs.extend(
+        (
+            dataclasses.replace(hnsw_config, quantization=quantization),
+            ef_search_values,
+            "ef_search={}",
+        )
+        for quantization in quantizations
+        if quantization != "none"
+    )
+    for config, values, describe in runs:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP INDEX IF EXISTS {};").format(sql.Identifier(index_name)))
+            started = time.perf_counter()
+            cur.execute(vector_index_sql(table, index_name, config, rows))
+        conn.commit()
+        build_seconds = time.perf_counter() - started
+        index_mb = index_size_mb(conn, index_name)
+
+        if config.method == "hnsw":
+            label = f"hnsw (m={config.m}, ef_construction={config.ef_construction})"
+        else:
+            label = f"ivfflat (lists={config.lists})"
+        # The quantized indexes return candidates for the exact rerank instead of results
+        limit = k
+        if config.quantization != "none":
+            label = f"{config.quantization} {label}, rerank {rerank_factor}x"
+            limit = k * rerank_factor
+
+        for value in values:
+            if config.method == "hnsw":
+                settings = search_settings_sql(value, 1, limit)
+            else:
+                settings = search_settings_sql(limit, value)
+            latencies, found = run_queries(
+                conn, table, queries, k, settings, config.quantization, limit
+            )
+            results.append(
+                _result(
+                    rows,
+                    label,
+                    describe.format(value),
+                    build_seconds,
+                    index_mb,
+                    latencies,
+                    found,
+                    expected,
+                )
+            )
+
+    if not keep:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(table)))
+        conn.commit()
+    return results
+
+
+def format_report(results: list[BenchmarkResult], k: int) -> str:
+    header = (
+        f"{'rows':>9}  {'index':<60} {'setting':<14} {'build s':>8} {'size MB':>8} "
+        f"{'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(k):>10}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        size = "-" if r.index_mb is None else f"{r.index_mb:.1f}"
+        lines.append(
+            f"{r.rows:>9}  {r.index:<60} {r.setting:<14} {r.build_seconds:>8.1f} {size:>8} "
+            f"{r.p50_ms:>8.2f} {r.p99_ms:>8.2f} {r.recall:>10.3f}"
+        )
+    return "\n".join(lines)
+
+
+def _int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",") if item]
+
+
+def _str_list(value: str) -> list[str]:
+    return [item for item in value.split(",") if item]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=_int_list, default=list(DEFAULT_SIZES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=_int_list, default=list(DEFAULT_EF_SEARCH))
+    parser.add_argument("--probes", type=_int_list, default=list(DEFAULT_PROBES))
+    parser.add_argument("--m", type=int, default=DEFAULT_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=DEFAULT_HNSW_EF_CONSTRUCTION)
+    parser.add_argument(
+        "--quantizations",
+        type=_str_list,
+        default=[q for q in VECTOR_QUANTIZATIONS if q != "none"],
+        help="quantized HNSW indexes to compare, empty for none",
+    )
+    parser.add_argument("--rerank-factor", type=int, default=DEFAULT_RERANK_FACTOR)
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark tables")
+    args = parser.parse_args(argv)
+
+    queries = synthetic_queries(args.queries, EMBEDDING_DIM, args.seed)
+    hnsw_config = VectorIndexConfig(method="hnsw", m=args.m, ef_construction=args.ef_construction)
+
+    conn = connect_with_retries()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            # HNSW builds are much faster when the graph fits in maintenance_work_mem
+            cur.execute(
+                "SELECT set_config('maintenance_work_mem', %s, false);",
+                (args.maintenance_work_mem,),
+            )
+        conn.commit()
+
+        results = []
+        for rows in args.sizes:
+            results.extend(
+                benchmark_size(
+                    conn,
+                    rows,
+                    queries,
+                    args.k,
+                    args.ef_search,
+                    args.probes,
+                    hnsw_config,
+                    args.seed,
+                    args.keep,
+                    args.quantizations,
+                    args.rerank_factor,
+                )
+            )
+    finally:
+        conn.close()
+
+    print(format_report(results, args.k))
+
+
+if __name__ == "__main__":
+    main()
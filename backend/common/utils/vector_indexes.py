@@ -0,0 +1,177 @@
+"""
+Approximate nearest neighbour indexes on the ``laws`` and ``paragraphs`` embeddings.
+
+Both pgvector index types are supported and configured through environment variables,
+read when ingestion builds the indexes of a new index version:
+
+``VECTOR_INDEX_METHOD``
+    ``hnsw`` (default) or ``ivfflat``.
+``HNSW_M`` / ``HNSW_EF_CONSTRUCTION``
+    Graph degree and build-time candidate list of HNSW indexes (pgvector defaults 16/64).
+``IVFFLAT_LISTS``
+    Number of IVFFlat lists. Defaults to ``rows / 1000``, or ``sqrt(rows)`` above a
+    million rows, as recommended by pgvector.
+``VECTOR_INDEX_QUANTIZATION``
+    ``none`` (default), ``halfvec`` or ``binary``. Builds the ``paragraphs`` index on
+    ``halfvec(384)`` or on ``binary_quantize(embedding)::bit(384)`` with Hamming distance
+    instead of the full ``vector(384)``, which makes an HNSW index with the default ``m``
+    about half or a sixth of the size (see ``vector_benchmark``). The column keeps the
+    full vectors, so searches take ``VECTOR_SEARCH_RERANK_FACTOR`` times as many candidates
+    from the quantized index and rerank them by exact cosine distance. Laws are few and
+    keep the full precision index. Needs pgvector 0.7 or later.
+
+At query time recall is traded against latency with ``hnsw.ef_search`` and
+``ivfflat.probes``, which ``search_settings_sql`` sets for a single transaction.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+
+from psycopg2 import sql
+
+
+VECTOR_INDEX_METHODS = ("hnsw", "ivfflat")
+VECTOR_QUANTIZATIONS = ("none", "halfvec", "binary")
+
+# Operator classes of the quantized paragraph indexes
+_QUANTIZED_OPERATOR_CLASSES = {"halfvec": "halfvec_cosine_ops", "binary": "bit_hamming_ops"}
+
+# pgvector defaults for building and searching the indexes
+DEFAULT_HNSW_M = 16
+DEFAULT_HNSW_EF_CONSTRUCTION = 64
+DEFAULT_HNSW_EF_SEARCH = 40
+DEFAULT_IVFFLAT_PROBES = 10
+
+# Candidates per result read from a quantized index and reranked by exact distance
+DEFAULT_RERANK_FACTOR = 10
+
+
+@dataclass(frozen=True)
+class VectorIndexConfig:
+    """How the embedding indexes are built."""
+
+    method: str = "hnsw"
+    m: int = DEFAULT_HNSW_M
+    ef_construction: int = DEFAULT_HNSW_EF_CONSTRUCTION
+    # None picks the number of lists from the row count when the index is built
+    lists: int | None = None
+    # Index the paragraph embeddings as halfvec or bit(384) instead of vector(384)
+    quantization: str = "none"
+
+    def __post_init__(self):
+        if self.method not in VECTOR_INDEX_METHODS:
+            raise ValueError(
+                f"Unknown vector index method {self.method!r}, expected one of "
+                f"{', '.join(VECTOR_INDEX_METHODS)}"
+            )
+        if self.quantization not in VECTOR_QUANTIZATIONS:
+            raise ValueError(
+                f"Unknown vector quantization {self.quantization!r}, expected one of "
+                f"{', '.join(VECTOR_QUANTIZATIONS)}"
+            )
+
+    @classmethod
+    def from_env(cls) -> VectorIndexConfig:
+        lists = os.environ.get("IVFFLAT_LISTS")
+        return cls(
+            method=os.environ.get("VECTOR_INDEX_METHOD", "hnsw"),
+            m=int(os.environ.get("HNSW_M", DEFAULT_HNSW_M)),
+            ef_construction=int(
+                os.environ.get("HNSW_EF_CONSTRUCTION", DEFAULT_HNSW_EF_CONSTRUCTION)
+            ),
+            lists=int(lists) if lists else None,
+            quantization=os.environ.get("VECTOR_INDEX_QUANTIZATION", "none"),
+        )
+
+
+def ivfflat_lists(rows: int) -> int:
+    """Number of IVFFlat lists pgvector recommends for a table of ``rows`` rows."""
+    if rows > 1_000_000:
+        return max(1, int(math.sqrt(rows)))
+    return max(1, rows // 1000)
+
+
+def quantized_embedding_sql(quantization: str, vector: str = "embedding") -> str:
+    """
+    SQL expression of a ``vector(384)`` expression as stored in a quantized index.
+
+    A search only uses an expression index if it orders by the same expression, so
+    the index definition and the first stage of the searches are both built from this.
+    """
+    if quantization == "halfvec":
+        return f"({vector})::halfvec(384)"
+    if quantization == "binary":
+        return f"binary_quantize({vector})::bit(384)"
+    return vector
+
+
+def quantized_distance_sql(quantization: str, query_vec: str) -> str:
+    """
+    Distance between ``embedding`` and ``query_vec`` that the index of ``quantization``
+    orders by: cosine distance, or Hamming distance between the binary quantized vectors.
+    """
+    operator = "<~>" if quantization == "binary" else "<=>"
+    return (
+        f"{quantized_embedding_sql(quantization)} {operator} "
+        f"{quantized_embedding_sql(quantization, query_vec)}"
+    )
+
+
+def vector_index_sql(
+    table: str, index_name: str, config: VectorIndexConfig, rows: int = 0
+) -> sql.Composed:
+    """
+    Statement that creates the cosine distance index on ``table.embedding``, or with
+    quantization the halfvec cosine or bit Hamming distance index on its quantized form.
+    """
+    if config.method == "hnsw":
+        options = sql.SQL("m = {}, ef_construction = {}").format(
+            sql.Literal(config.m), sql.Literal(config.ef_construction)
+        )
+    else:
+        lists = config.lists or ivfflat_lists(rows)
+        options = sql.SQL("lists = {}").format(sql.Literal(lists))
+
+    if config.quantization == "none":
+        column = sql.SQL("embedding vector_cosine_ops")
+    else:
+        column = sql.SQL("({expression}) {operator_class}").format(
+            expression=sql.SQL(quantized_embedding_sql(config.quantization)),
+            operator_class=sql.SQL(_QUANTIZED_OPERATOR_CLASSES[config.quantization]),
+        )
+
+    return sql.SQL(
+        "CREATE INDEX IF NOT EXISTS {index} ON {table} USING {method} ({column}) WITH ({options});"
+    ).format(
+        index=sql.Identifier(index_name),
+        table=sql.Identifier(table),
+        method=sql.SQL(config.method),
+        column=column,
+        options=options,
+    )
+
+
+def search_settings_sql(ef_search: int, probes: int, limit: int = 0) -> sql.Composed:
+    """
+    ``SET LOCAL`` statements for the search parameters of the current transaction.
+
+    Both are set, so the query does not need to know which index type is in use. An HNSW
+    scan returns at most ``ef_search`` rows, so it is raised to ``limit`` when needed.
+    """
+    return sql.SQL("SET LOCAL hnsw.ef_search = {}; SET LOCAL ivfflat.probes = {};").format(
+        sql.Literal(max(ef_search, limit)), sql.Literal(probes)
+    )
+
+
+def search_settings_query(ef_search: int, probes: int, limit: int = 0) -> tuple[str, tuple]:
+    """
+    The settings of ``search_settings_sql`` as a parameterized query and its parameters.
+
+    ``set_config(..., true)`` is local to the transaction like ``SET LOCAL``, but takes
+    bound parameters, so drivers that cannot render psycopg2 ``sql`` objects can use it.
+    """
+    query = "SELECT set_config('hnsw.ef_search', %s, true), set_config('ivfflat.probes', %s, true);"
+    return query, (str(max(ef_search, limit)), str(probes))
@@ -17,6 +17,7 @@ from .serializers import (
     ChecklistRequestSerializer,
     MockResponseSerializer,
 )
+from .utils.db_pool import PoolTimeoutError
 from .utils.gemini_client import GEMINI_CHAT_SERVICE
 
 
@@ -212,6 +213,10 @@ class ChatViewSet(viewsets.ViewSet):
                 "type": "object",
                 "properties": {"error": {"type": "string"}},
             },
+            status.HTTP_503_SERVICE_UNAVAILABLE: {
+                "type": "object",
+                "properties": {"error": {"type": "string"}},
+            },
         },
         examples=[
             OpenApiExample(
@@ -271,6 +276,12 @@ class ChatViewSet(viewsets.ViewSet):
                 status=status.HTTP_200_OK,
             )
 
+        except PoolTimeoutError:
+            return Response(
+                {"error": "Tjenesten er opptatt, prøv igjen om litt."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+
         except (ValueError, TypeError, KeyError, AttributeError) as e:
             return Response(
                 {"error": f"AI Error: {e!s}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR